@@ -5,16 +5,19 @@ Handles OCR, document analysis, and expense extraction
 
 import os
 import json
+import hashlib
 import re
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
-import base64
-from PIL import Image
-import io
+from instrumentation import instrumented
 
 # Mock AI functions for free deployment
 # In production, you'd use real AI services like OpenAI, Google Vision, etc.
 
+# Bump when the extraction code changes; pattern and keyword edits are picked up automatically
+EXTRACTOR_VERSION = 1
+
+@instrumented('ai')
 class AIProcessor:
     def __init__(self):
         self.supported_formats = ['.pdf', '.jpg', '.jpeg', '.png', '.gif', '.tiff', '.bmp']
@@ -38,8 +41,93 @@ class AIProcessor:
                 r'merchant[:\s]*([a-zA-Z\s&]+)'
             ]
         }
+        # Keywords used to categorize scanned documents, in priority order
+        self.document_category_keywords = {
+            'Food & Dining': ['coffee', 'starbucks', 'restaurant', 'food', 'lunch', 'dinner'],
+            'Transportation': ['gas', 'fuel', 'gasoline', 'petrol'],
+            'Travel': ['hotel', 'accommodation', 'lodging'],
+            'Office Supplies': ['office', 'supplies', 'stationery', 'paper'],
+            'Technology': ['software', 'subscription', 'license', 'saas']
+        }
+        # Keywords used to categorize manually entered expenses, in priority order
+        self.category_keywords = {
+            'Food & Dining': ['restaurant', 'food', 'coffee', 'lunch', 'dinner', 'breakfast', 'cafe', 'bar', 'pizza', 'burger'],
+            'Transportation': ['gas', 'fuel', 'uber', 'lyft', 'taxi', 'parking', 'toll', 'metro', 'bus', 'train'],
+            'Travel': ['hotel', 'flight', 'airline', 'accommodation', 'lodging', 'booking', 'airbnb'],
+            'Office Supplies': ['office', 'supplies', 'stationery', 'paper', 'pens', 'notebook', 'stapler'],
+            'Technology': ['software', 'subscription', 'license', 'saas', 'cloud', 'hosting', 'domain', 'app'],
+            'Business': ['meeting', 'client', 'conference', 'seminar', 'workshop', 'training'],
+            'Healthcare': ['doctor', 'medical', 'pharmacy', 'hospital', 'clinic', 'medicine', 'health'],
+            'Entertainment': ['movie', 'theater', 'concert', 'sports', 'game', 'entertainment', 'netflix', 'spotify']
+        }
+        self.compile_patterns()
     
-    def extract_text_from_image(self, image_path: str) -> str:
+    def compile_patterns(self):
+        """Compile the extraction patterns and keyword tables.
+        
+        Called once at construction; call again after editing
+        ``expense_patterns`` or the keyword tables. Also derives
+        ``extractor_version``, which keys cached extraction results.
+        """
+        signature = json.dumps(
+            [self.expense_patterns, self.document_category_keywords, self.category_keywords],
+            sort_keys=True
+        )
+        self.extractor_version = f"{EXTRACTOR_VERSION}.{hashlib.blake2b(signature.encode(), digest_size=8).hexdigest()}"
+        
+        # Patterns run against text lowercased once per document, which is several
+        # times cheaper than re.IGNORECASE. The case-insensitive set is the fallback
+        # for the rare text whose length changes when lowercased.
+        self._field_patterns = {
+            field: [re.compile(pattern) for pattern in patterns]
+            for field, patterns in self.expense_patterns.items()
+        }
+        self._field_patterns_ci = {
+            field: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            for field, patterns in self.expense_patterns.items()
+        }
+        self._document_categories = tuple(
+            (category, tuple(keywords)) for category, keywords in self.document_category_keywords.items()
+        )
+        self._expense_categories = tuple(
+            (category, tuple(keywords)) for category, keywords in self.category_keywords.items()
+        )
+        self._amount_only_line = re.compile(r'\$?\d+\.?\d*')
+    
+    def _match_categories(self, text_lower: str, categories: Tuple) -> str:
+        """Return the first category with a keyword occurring in the text"""
+        for category, keywords in categories:
+            for keyword in keywords:
+                if keyword in text_lower:
+                    return category
+        return 'Other'
+    
+    def _search_fields(self, text: str, text_lower: str) -> Dict[str, Optional[str]]:
+        """Find the first-matching pattern's capture for each extraction field"""
+        if len(text_lower) == len(text):
+            patterns, haystack = self._field_patterns, text_lower
+        else:
+            patterns, haystack = self._field_patterns_ci, text
+        
+        found = {}
+        for field, field_patterns in patterns.items():
+            found[field] = None
+            for pattern in field_patterns:
+                match = pattern.search(haystack)
+                if match is None:
+                    continue
+                # Slice the original text so captured values keep their case
+                value = text[match.start(1):match.end(1)]
+                if field == 'amount':
+                    try:
+                        value = float(value)
+                    except ValueError:
+                        continue
+                found[field] = value
+                break
+        return found
+    
+    def extract_text_from_image(self, image_path: str, source_name: str = None) -> str:
         """Extract text from image using OCR (mock implementation)"""
         # In production, use libraries like:
         # - pytesseract (Tesseract OCR)
@@ -48,7 +136,7 @@ class AIProcessor:
         # - AWS Textract
         
         # Mock OCR result based on filename
-        filename = os.path.basename(image_path).lower()
+        filename = os.path.basename(source_name or image_path).lower()
         
         mock_texts = {
             'receipt': """
@@ -147,54 +235,26 @@ class AIProcessor:
             'confidence': 0.0
         }
         
-        # Extract amount
-        for pattern in self.expense_patterns['amount']:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    extracted_data['amount'] = float(match.group(1))
-                    break
-                except ValueError:
-                    continue
-        
-        # Extract date
-        for pattern in self.expense_patterns['date']:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                extracted_data['date'] = match.group(1)
-                break
-        
-        # Extract vendor
-        for pattern in self.expense_patterns['vendor']:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                extracted_data['vendor'] = match.group(1).strip()
-                break
+        text_lower = text.lower()
+        fields = self._search_fields(text, text_lower)
+        extracted_data['amount'] = fields['amount']
+        extracted_data['date'] = fields['date']
+        if fields['vendor'] is not None:
+            extracted_data['vendor'] = fields['vendor'].strip()
         
         # Categorize based on keywords
-        text_lower = text.lower()
-        if any(word in text_lower for word in ['coffee', 'starbucks', 'restaurant', 'food', 'lunch', 'dinner']):
-            extracted_data['category'] = 'Food & Dining'
-        elif any(word in text_lower for word in ['gas', 'fuel', 'gasoline', 'petrol']):
-            extracted_data['category'] = 'Transportation'
-        elif any(word in text_lower for word in ['hotel', 'accommodation', 'lodging']):
-            extracted_data['category'] = 'Travel'
-        elif any(word in text_lower for word in ['office', 'supplies', 'stationery', 'paper']):
-            extracted_data['category'] = 'Office Supplies'
-        elif any(word in text_lower for word in ['software', 'subscription', 'license', 'saas']):
-            extracted_data['category'] = 'Technology'
-        else:
-            extracted_data['category'] = 'Other'
+        extracted_data['category'] = self._match_categories(text_lower, self._document_categories)
         
-        # Generate description
-        lines = text.split('\n')
+        # Generate description from the first three non-amount lines
         description_parts = []
-        for line in lines:
+        for line in text.split('\n'):
             line = line.strip()
-            if line and not re.match(r'^\$?\d+\.?\d*$', line) and len(line) > 3:
+            if len(line) > 3 and not self._amount_only_line.fullmatch(line):
                 description_parts.append(line)
+                if len(description_parts) == 3:
+                    break
         
-        extracted_data['description'] = ' | '.join(description_parts[:3])
+        extracted_data['description'] = ' | '.join(description_parts)
         
         # Calculate confidence
         confidence = 0.0
@@ -211,12 +271,15 @@ class AIProcessor:
         
         return extracted_data
     
-    def process_document(self, file_path: str, file_type: str) -> Dict:
-        """Process a document and extract expense information"""
+    def process_document(self, file_path: str, file_type: str, source_name: str = None) -> Dict:
+        """Process a document and extract expense information.
+        
+        ``source_name`` is the uploaded file name, for stores whose paths don't keep it.
+        """
         try:
             # Extract text based on file type
             if file_type.lower() in ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/tiff', 'image/bmp']:
-                text = self.extract_text_from_image(file_path)
+                text = self.extract_text_from_image(file_path, source_name)
             elif file_type.lower() == 'application/pdf':
                 text = self.extract_text_from_pdf(file_path)
             else:
@@ -246,23 +309,7 @@ class AIProcessor:
     def categorize_expense_automatically(self, title: str, description: str = None) -> str:
         """Automatically categorize expense based on title and description"""
         text = f"{title} {description or ''}".lower()
-        
-        category_keywords = {
-            'Food & Dining': ['restaurant', 'food', 'coffee', 'lunch', 'dinner', 'breakfast', 'cafe', 'bar', 'pizza', 'burger'],
-            'Transportation': ['gas', 'fuel', 'uber', 'lyft', 'taxi', 'parking', 'toll', 'metro', 'bus', 'train'],
-            'Travel': ['hotel', 'flight', 'airline', 'accommodation', 'lodging', 'booking', 'airbnb'],
-            'Office Supplies': ['office', 'supplies', 'stationery', 'paper', 'pens', 'notebook', 'stapler'],
-            'Technology': ['software', 'subscription', 'license', 'saas', 'cloud', 'hosting', 'domain', 'app'],
-            'Business': ['meeting', 'client', 'conference', 'seminar', 'workshop', 'training'],
-            'Healthcare': ['doctor', 'medical', 'pharmacy', 'hospital', 'clinic', 'medicine', 'health'],
-            'Entertainment': ['movie', 'theater', 'concert', 'sports', 'game', 'entertainment', 'netflix', 'spotify']
-        }
-        
-        for category, keywords in category_keywords.items():
-            if any(keyword in text for keyword in keywords):
-                return category
-        
-        return 'Other'
+        return self._match_categories(text, self._expense_categories)
     
     def suggest_expense_title(self, vendor: str, amount: float, category: str) -> str:
         """Suggest expense title based on extracted data"""
@@ -303,11 +350,17 @@ class AIProcessor:
         expense_count = len(expenses)
         average_expense = total_amount / expense_count if expense_count > 0 else 0
         
-        # Category breakdown
+        # Category breakdown and monthly trend in one pass
         categories = {}
+        months = {}
         for exp in expenses:
+            amount = exp.get('amount', 0)
             category = exp.get('category', 'Other')
-            categories[category] = categories.get(category, 0) + exp.get('amount', 0)
+            categories[category] = categories.get(category, 0) + amount
+            month = (exp.get('date') or '')[:7]
+            if month:
+                month_amount, month_count = months.get(month, (0, 0))
+                months[month] = (month_amount + amount, month_count + 1)
         
         top_category = max(categories.items(), key=lambda x: x[1])[0] if categories else None
         
@@ -317,5 +370,6 @@ class AIProcessor:
             'average_expense': average_expense,
             'top_category': top_category,
             'category_breakdown': categories,
-            'monthly_trend': []  # Would need date processing for this
+            'monthly_trend': [{'month': month, 'amount': amount, 'count': count}
+                              for month, (amount, count) in sorted(months.items())]
         }
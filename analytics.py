@@ -0,0 +1,98 @@
+"""
+Analytics module for ExpenseWise
+Expense trends, breakdowns and percentiles computed in SQLite and cached per user
+(or per team) until their data changes
+"""
+
+from typing import Callable, Dict, List
+from database import Database
+from memo import MemoCache
+
+PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+# Rolling average windows, in months and weeks
+MONTHLY_WINDOW = 3
+WEEKLY_WINDOW = 4
+
+class ExpenseAnalytics:
+    """Per-user analytics, recomputed only after the user's data changes.
+    
+    Results are memoised on the user's data version, so reruns without
+    writes are served from memory.
+    """
+    
+    def __init__(self, db: Database, cache: MemoCache = None):
+        self.db = db
+        self.cache = cache or MemoCache()
+    
+    def _cached(self, user_id: int, key: str, compute: Callable[[], object]):
+        return self.cache.get_or_compute((user_id, self.db.data_version(user_id), 'analytics', key), compute)
+    
+    def category_breakdown(self, user_id: int) -> List[Dict]:
+        """Get spending per category, largest first, with each category's share"""
+        def compute():
+            stats = self.db.get_expense_stats(user_id)
+            total = stats['total_amount'] or 0
+            return [{**category, 'share': category['amount'] / total if total else 0}
+                    for category in stats['categories']]
+        return self._cached(user_id, 'category_breakdown', compute)
+    
+    def monthly_trend(self, user_id: int) -> List[Dict]:
+        """Get monthly totals with a rolling average"""
+        return self._cached(user_id, 'monthly_trend',
+                            lambda: self.db.get_monthly_trend(user_id, MONTHLY_WINDOW))
+    
+    def weekly_trend(self, user_id: int) -> List[Dict]:
+        """Get weekly totals with a rolling average"""
+        return self._cached(user_id, 'weekly_trend',
+                            lambda: self.db.get_weekly_trend(user_id, WEEKLY_WINDOW))
+    
+    def percentiles(self, user_id: int) -> Dict[float, float]:
+        """Get expense amount percentiles, including the minimum (0) and maximum (1)"""
+        return self._cached(user_id, 'percentiles',
+                            lambda: self.db.get_amount_percentiles(user_id, (0.0,) + PERCENTILES + (1.0,)))
+    
+    def summary(self, user_id: int) -> Dict:
+        """Get the same summary as AIProcessor.generate_expense_summary, from SQL"""
+        def compute():
+            stats = self.db.get_expense_stats(user_id)
+            categories = self.category_breakdown(user_id)
+            return {
+                'total_amount': stats['total_amount'],
+                'expense_count': stats['expense_count'],
+                'average_expense': stats['average_expense'],
+                'top_category': categories[0]['category'] if categories else None,
+                'category_breakdown': {category['category']: category['amount'] for category in categories},
+                'monthly_trend': [{'month': month['month'], 'amount': month['amount'], 'count': month['count']}
+                                  for month in self.monthly_trend(user_id)]
+            }
+        return self._cached(user_id, 'summary', compute)
+    
+    def team_member_ids(self, team_id: int) -> List[int]:
+        """Get a team's member ids, cached until team membership changes"""
+        return self.cache.get_or_compute((None, self.db.data_version(None), 'team_members', team_id),
+                                         lambda: self.db.get_team_member_ids(team_id))
+    
+    def _cached_team(self, team_id: int, key: str, compute: Callable[[], object]):
+        # Valid while no member's data changes; checking their versions needs no query
+        versions = tuple(self.db.data_version(member_id) for member_id in self.team_member_ids(team_id))
+        return self.cache.get_or_compute(('team', team_id, versions, key), compute)
+    
+    def team_summary(self, team_id: int) -> Dict:
+        """Get a team's totals with per-member and per-category breakdowns and shares"""
+        def compute():
+            stats = self.db.get_team_stats(team_id)
+            total = stats['total_amount'] or 0
+            return {
+                **stats,
+                'members': [{**member, 'share': member['amount'] / total if total else 0}
+                            for member in stats['members']],
+                'categories': [{**category, 'share': category['amount'] / total if total else 0}
+                               for category in stats['categories']]
+            }
+        return self._cached_team(team_id, 'team_summary', compute)
+    
+    def team_monthly_trend(self, team_id: int) -> List[Dict]:
+        """Get a team's monthly totals with a rolling average"""
+        return self._cached_team(team_id, 'team_monthly_trend',
+                                 lambda: self.db.get_team_monthly_trend(team_id, MONTHLY_WINDOW))
@@ -0,0 +1,288 @@
+"""
+HTTP API for ExpenseWise
+Async document processing and expense endpoints for scanners and mobile clients,
+sharing the SQLite database and blob store with the Streamlit app
+
+Usage:
+    uvicorn api:app --host 0.0.0.0 --port 8000
+    EXPENSEWISE_DB=multitools.db EXPENSEWISE_BLOBS=blobs uvicorn api:app
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import secrets
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from fastapi import Depends, FastAPI, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from pydantic import BaseModel, Field
+from database import Database, EXPENSE_SORTS
+from ai_processor import AIProcessor
+from blob_store import BLOB_ROOT, BlobStore
+from batch_processor import BatchProcessor, enqueue_uploads
+from memo import MemoCache
+import instrumentation
+
+MAX_PAGE_SIZE = 200
+MAX_BULK_EXPENSES = 10000
+
+# Verified credentials are remembered this long (seconds), so clients sending
+# Basic auth on every request don't pay for a password hash each time. A
+# password change or deactivation takes effect within this window.
+CREDENTIAL_CACHE_TTL = 300
+
+DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}$'
+
+# A duplicate upload whose job is in one of these states is already being
+# processed, so it is returned for polling instead of being extracted again
+PENDING_JOB_STATES = ('queued', 'running')
+
+class ExpenseIn(BaseModel):
+    title: str = Field(min_length=1, max_length=200)
+    amount: float = Field(gt=0)
+    category: Optional[str] = None
+    description: Optional[str] = None
+    date: Optional[str] = Field(default=None, pattern=DATE_PATTERN)
+
+class ExpenseUpdate(BaseModel):
+    title: Optional[str] = Field(default=None, min_length=1, max_length=200)
+    amount: Optional[float] = Field(default=None, gt=0)
+    category: Optional[str] = None
+    description: Optional[str] = None
+    date: Optional[str] = Field(default=None, pattern=DATE_PATTERN)
+    status: Optional[str] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared database and blob store and start a document worker"""
+    app.state.db = Database(os.environ.get('EXPENSEWISE_DB', 'multitools.db'))
+    app.state.store = BlobStore(os.environ.get('EXPENSEWISE_BLOBS', BLOB_ROOT))
+    app.state.ai_processor = AIProcessor()
+    app.state.processor = BatchProcessor(app.state.db, app.state.store)
+    app.state.processor.start()
+    # Keyed by an HMAC of the credentials under a per-process secret, never the password itself
+    app.state.credentials = MemoCache(max_entries=1024, ttl=CREDENTIAL_CACHE_TTL)
+    app.state.credential_key = secrets.token_bytes(32)
+    try:
+        yield
+    finally:
+        app.state.processor.shutdown(wait=False)
+        app.state.db.close()
+
+app = FastAPI(title="ExpenseWise API", lifespan=lifespan)
+security = HTTPBasic()
+
+class InvalidCredentials(Exception):
+    pass
+
+async def current_user(request: Request, credentials: HTTPBasicCredentials = Depends(security)) -> Dict:
+    """Authenticate the request with HTTP Basic credentials"""
+    state = request.app.state
+    key = hmac.new(state.credential_key, f'{credentials.username}\0{credentials.password}'.encode(),
+                   hashlib.sha256).digest()
+    
+    def authenticate() -> Dict:
+        user = state.db.authenticate_user(credentials.username, credentials.password)
+        if not user:
+            # Raised rather than returned so failures are never cached
+            raise InvalidCredentials()
+        return user
+    
+    try:
+        user = await asyncio.to_thread(state.credentials.get_or_compute, key, authenticate)
+    except InvalidCredentials:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Invalid username or password",
+                            headers={'WWW-Authenticate': 'Basic'})
+    return dict(user)
+
+async def admin_user(user: Dict = Depends(current_user)) -> Dict:
+    """Require an authenticated user with the admin role"""
+    if user.get('role') != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return user
+
+@app.get('/health')
+async def health(request: Request) -> Dict:
+    version = await asyncio.to_thread(request.app.state.db.schema_version)
+    return {'status': 'ok', 'schema_version': version}
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics(user: Dict = Depends(admin_user)) -> PlainTextResponse:
+    """Timing metrics in the Prometheus text format (empty unless EXPENSEWISE_METRICS=1).
+    
+    Admins only: scrape with an admin account's Basic auth credentials.
+    """
+    return PlainTextResponse(instrumentation.render_prometheus(),
+                             media_type=instrumentation.PROMETHEUS_CONTENT_TYPE)
+
+# Documents
+
+@app.post('/documents/process')
+async def process_document(request: Request, file: UploadFile = File(...),
+                           user: Dict = Depends(current_user)) -> Dict:
+    """Store a document and extract expense data from it before responding.
+    
+    A document the user already uploaded is returned as it is: with its
+    extracted data once processed, or with its job state while it is still
+    queued or running (poll /documents/{file_id} for the result). An upload
+    that failed or was never processed is extracted again into its own row.
+    """
+    state = request.app.state
+    # The multipart parser has already spooled the upload; copy it to the blob store in chunks
+    blob_id, size = await asyncio.to_thread(state.store.write_stream, file.file)
+    
+    existing = await asyncio.to_thread(state.db.find_file_by_hash, user['id'], blob_id)
+    if existing and (existing['processed'] or existing['job_state'] in PENDING_JOB_STATES):
+        upload = await asyncio.to_thread(state.db.get_upload, existing['id'], user['id'])
+        return {'file_id': upload['id'], 'blob_id': blob_id, 'extracted_data': upload['extracted_data'],
+                'job_state': upload['job_state'], 'cached': upload['processed']}
+    
+    cached = await asyncio.to_thread(state.processor.cache.get, blob_id)
+    if cached:
+        extracted_data = cached['extracted_data']
+    else:
+        # Extraction is CPU-bound, so it runs in the worker process pool
+        result = await asyncio.wrap_future(state.processor.submit_document(
+            state.store.path(blob_id), file.content_type or '', file.filename
+        ))
+        if not result['success']:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=result['error'])
+        extracted_data = result['extracted_data']
+        await asyncio.to_thread(state.processor.cache.put, blob_id, result['raw_text'], extracted_data)
+    
+    if existing:
+        # An earlier upload that failed or was never processed: fill in its row
+        await asyncio.to_thread(state.db.mark_file_processed, existing['id'], user['id'],
+                                json.dumps(extracted_data))
+        file_id = existing['id']
+    else:
+        file_ids = await asyncio.to_thread(state.db.add_files, [{
+            'user_id': user['id'],
+            'filename': file.filename,
+            'blob_id': blob_id,
+            'file_type': file.content_type,
+            'file_size': size,
+            'processed': True,
+            'extracted_data': json.dumps(extracted_data)
+        }])
+        file_id = file_ids[0]
+    return {'file_id': file_id, 'blob_id': blob_id, 'extracted_data': extracted_data,
+            'job_state': None, 'cached': cached is not None}
+
+@app.post('/documents', status_code=status.HTTP_202_ACCEPTED)
+async def upload_documents(request: Request, files: List[UploadFile] = File(...),
+                           user: Dict = Depends(current_user)) -> Dict:
+    """Store documents and queue them for background processing"""
+    state = request.app.state
+    file_ids = await asyncio.to_thread(
+        enqueue_uploads, state.db, state.store, user['id'],
+        [{'name': file.filename, 'type': file.content_type, 'stream': file.file} for file in files],
+        cache=state.processor.cache
+    )
+    return {'file_ids': file_ids}
+
+@app.get('/documents')
+async def list_documents(request: Request, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+                         user: Dict = Depends(current_user)) -> List[Dict]:
+    """List recent documents with their processing state"""
+    return await asyncio.to_thread(request.app.state.db.get_recent_uploads, user['id'], limit)
+
+@app.get('/documents/{file_id}')
+async def get_document(request: Request, file_id: int, user: Dict = Depends(current_user)) -> Dict:
+    """Get a document's processing state and extracted data"""
+    upload = await asyncio.to_thread(request.app.state.db.get_upload, file_id, user['id'])
+    if not upload:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    return upload
+
+# Expenses
+
+def _parse_cursor(after: Optional[str], sort: str) -> Optional[tuple]:
+    if not after:
+        return None
+    try:
+        cursor = json.loads(after)
+    except ValueError:
+        cursor = None
+    if not isinstance(cursor, list) or len(cursor) != len(EXPENSE_SORTS[sort][0]):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return tuple(cursor)
+
+def _expense_response(expense) -> Dict:
+    """Turn a database expense record into a plain dict for the response, 404 if missing"""
+    if not expense:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Expense not found")
+    return expense.to_dict()
+
+@app.get('/expenses')
+async def list_expenses(request: Request, category: Optional[str] = None, search: Optional[str] = None,
+                        sort: str = 'date_desc', after: Optional[str] = None,
+                        page_size: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+                        user: Dict = Depends(current_user)) -> Dict:
+    """List expenses one keyset page at a time; pass next_cursor back as ``after``"""
+    if sort not in EXPENSE_SORTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"sort must be one of {', '.join(EXPENSE_SORTS)}")
+    expenses, cursor = await asyncio.to_thread(
+        request.app.state.db.query_expenses, user['id'], category=category, search=search,
+        sort=sort, after=_parse_cursor(after, sort), page_size=page_size
+    )
+    return {'expenses': [expense.to_dict() for expense in expenses], 'next_cursor': json.dumps(list(cursor)) if cursor else None}
+
+@app.post('/expenses', status_code=status.HTTP_201_CREATED)
+async def create_expense(request: Request, expense: ExpenseIn, user: Dict = Depends(current_user)) -> Dict:
+    state = request.app.state
+    category = expense.category or state.ai_processor.categorize_expense_automatically(
+        expense.title, expense.description
+    )
+    expense_id = await asyncio.to_thread(
+        state.db.add_expense, user['id'], expense.title, expense.amount, category,
+        expense.description, expense.date
+    )
+    return _expense_response(await asyncio.to_thread(state.db.get_expense, expense_id, user['id']))
+
+@app.post('/expenses/bulk', status_code=status.HTTP_201_CREATED)
+async def create_expenses(request: Request, expenses: List[ExpenseIn],
+                          user: Dict = Depends(current_user)) -> Dict:
+    """Add many expenses in batched transactions"""
+    if len(expenses) > MAX_BULK_EXPENSES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {MAX_BULK_EXPENSES} expenses per request")
+    state = request.app.state
+    rows = [{
+        **expense.model_dump(),
+        'user_id': user['id'],
+        'category': expense.category or state.ai_processor.categorize_expense_automatically(
+            expense.title, expense.description
+        )
+    } for expense in expenses]
+    inserted = await asyncio.to_thread(state.db.bulk_add_expenses, rows)
+    return {'imported': inserted}
+
+@app.get('/expenses/{expense_id}')
+async def get_expense(request: Request, expense_id: int, user: Dict = Depends(current_user)) -> Dict:
+    expense = await asyncio.to_thread(request.app.state.db.get_expense, expense_id, user['id'])
+    return _expense_response(expense)
+
+@app.patch('/expenses/{expense_id}')
+async def update_expense(request: Request, expense_id: int, changes: ExpenseUpdate,
+                         user: Dict = Depends(current_user)) -> Dict:
+    db = request.app.state.db
+    fields = changes.model_dump(exclude_unset=True, exclude_none=True)
+    if not fields:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No changes given")
+    updated = await asyncio.to_thread(db.update_expense, expense_id, user['id'], **fields)
+    if not updated:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Expense not found")
+    return _expense_response(await asyncio.to_thread(db.get_expense, expense_id, user['id']))
+
+@app.delete('/expenses/{expense_id}', status_code=status.HTTP_204_NO_CONTENT)
+async def delete_expense(request: Request, expense_id: int, user: Dict = Depends(current_user)):
+    deleted = await asyncio.to_thread(request.app.state.db.delete_expense, expense_id, user['id'])
+    if not deleted:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Expense not found")
@@ -3,53 +3,94 @@ Authentication module for ExpenseWise
 Handles user login, registration, and session management
 """
 
+import json
 import streamlit as st
-import hashlib
-import secrets
-from datetime import datetime, timedelta
+import streamlit.components.v1 as components
 from typing import Optional, Dict
 from database import Database
+from sessions import SESSION_TIMEOUT, SessionStore
+
+# Cookie carrying the session token, so reloads and other tabs join the same
+# session. The token never goes in the URL, where browser history, Referer
+# headers, proxy logs and shared links would leak it. Streamlit gives apps no
+# way to set response headers, so the cookie is written from JavaScript and
+# can't be HttpOnly: page scripts can read it. Every user-supplied value the
+# app renders with unsafe_allow_html must therefore be HTML-escaped.
+SESSION_COOKIE = 'expensewise_session'
+
+# Query parameter older versions put the token in; it is removed, never honoured
+LEGACY_SESSION_PARAM = 'session'
+
+def _write_session_cookie(token: str, max_age: int):
+    """Set the session cookie (delete it with max_age 0) from a zero-height component"""
+    components.html(f"""<script>
+        const page = window.parent;
+        page.document.cookie = {json.dumps(SESSION_COOKIE)} + "=" + {json.dumps(token)}
+            + "; Path=/; Max-Age={max_age}; SameSite=Strict"
+            + (page.location.protocol === "https:" ? "; Secure" : "");
+    </script>""", height=0)
 
 class AuthManager:
-    def __init__(self):
-        self.db = Database()
-        self.session_timeout = 24 * 60 * 60  # 24 hours in seconds
+    def __init__(self, db: Database = None, sessions: SessionStore = None):
+        self.db = db or Database()
+        self.session_timeout = SESSION_TIMEOUT
+        self.sessions = sessions or SessionStore(self.db, self.session_timeout)
     
     def hash_password(self, password: str) -> str:
-        """Hash password using SHA-256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Hash password with the database's configured KDF"""
+        return self.db.hash_password(password)
     
-    def generate_session_token(self) -> str:
-        """Generate a secure session token"""
-        return secrets.token_urlsafe(32)
+    def current_session(self) -> Optional[Dict]:
+        """Get the server-side session for this browser tab, or None if not logged in"""
+        if LEGACY_SESSION_PARAM in st.query_params:
+            del st.query_params[LEGACY_SESSION_PARAM]
+        # Cookie changes are written on the rerun after login or logout, since
+        # st.rerun() would discard a component rendered before it
+        pending_cookie = st.session_state.pop('pending_session_cookie', None)
+        if pending_cookie:
+            _write_session_cookie(*pending_cookie)
+        
+        token = st.session_state.get('session_token')
+        if token is None and not st.session_state.get('logged_out'):
+            # Cookies are read when the tab connects, so this is how reloads and new tabs rejoin
+            token = st.context.cookies.get(SESSION_COOKIE)
+        session = self.sessions.validate(token)
+        if session is None:
+            self._clear_local_state()
+            return None
+        
+        st.session_state.session_token = token
+        st.session_state.user = session['user']
+        return session
     
     def is_logged_in(self) -> bool:
         """Check if user is logged in"""
-        return 'user' in st.session_state and 'session_token' in st.session_state
+        return self.current_session() is not None
     
     def get_current_user(self) -> Optional[Dict]:
         """Get current logged-in user"""
-        if self.is_logged_in():
-            return st.session_state.user
-        return None
+        session = self.current_session()
+        return session['user'] if session else None
+    
+    def get_session_value(self, key: str, default=None):
+        """Read a value shared by every tab of the current session"""
+        session = self.current_session()
+        return session['data'].get(key, default) if session else default
+    
+    def set_session_value(self, key: str, value) -> bool:
+        """Store a small JSON-serialisable value shared by every tab of the current session"""
+        return self.sessions.update_data(st.session_state.get('session_token'), **{key: value})
     
     def login(self, username: str, password: str) -> bool:
         """Authenticate user login"""
         user = self.db.authenticate_user(username, password)
         
         if user:
-            # Create session
+            token = self.sessions.create(user)
             st.session_state.user = user
-            st.session_state.session_token = self.generate_session_token()
-            st.session_state.login_time = datetime.now()
-            
-            # Store session in database (simplified)
-            st.session_state.session_data = {
-                'user_id': user['id'],
-                'token': st.session_state.session_token,
-                'created_at': datetime.now().isoformat()
-            }
-            
+            st.session_state.session_token = token
+            st.session_state.pending_session_cookie = (token, self.session_timeout)
+            st.session_state.pop('logged_out', None)
             return True
         
         return False
@@ -73,28 +114,21 @@ class AuthManager:
             st.error(f"Registration failed: {str(e)}")
             return False
     
+    def _clear_local_state(self):
+        st.session_state.pop('user', None)
+        st.session_state.pop('session_token', None)
+    
     def logout(self):
-        """Logout current user"""
-        if 'user' in st.session_state:
-            del st.session_state.user
-        if 'session_token' in st.session_state:
-            del st.session_state.session_token
-        if 'login_time' in st.session_state:
-            del st.session_state.login_time
-        if 'session_data' in st.session_state:
-            del st.session_state.session_data
+        """Logout current user, ending the session in every tab"""
+        self.sessions.revoke(st.session_state.get('session_token'))
+        self._clear_local_state()
+        # This tab's cookie snapshot still holds the revoked token; don't reread it
+        st.session_state.logged_out = True
+        st.session_state.pending_session_cookie = ('', 0)
     
     def check_session_timeout(self) -> bool:
-        """Check if session has timed out"""
-        if not self.is_logged_in():
-            return False
-        
-        login_time = st.session_state.get('login_time')
-        if not login_time:
-            return False
-        
-        time_diff = datetime.now() - login_time
-        return time_diff.total_seconds() < self.session_timeout
+        """Check that the session has not timed out (expiry slides with activity)"""
+        return self.current_session() is not None
     
     def require_auth(self, func):
         """Decorator to require authentication for a function"""
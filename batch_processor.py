@@ -0,0 +1,240 @@
+"""
+Background document processing for ExpenseWise
+Workers claim jobs from the SQLite job queue and run AIProcessor.process_document in a process pool
+
+Usage:
+    python batch_processor.py --db multitools.db --workers 4
+    python batch_processor.py --burst    # drain the queue and exit
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List
+from database import Database
+from ai_processor import AIProcessor
+from extraction_cache import ExtractionCache
+from blob_store import BLOB_ROOT, BlobStore
+
+# Interactive "Process" clicks jump ahead of bulk uploads
+INTERACTIVE_PRIORITY = 10
+
+# Each worker process builds its own processor (and compiled patterns) once
+_worker_processor = None
+
+def _init_worker():
+    """Create the AIProcessor used by this worker process"""
+    global _worker_processor
+    _worker_processor = AIProcessor()
+
+def _process_in_worker(file_path: str, file_type: str, source_name: str) -> Dict:
+    """Process one document inside a worker process"""
+    return _worker_processor.process_document(file_path, file_type, source_name)
+
+def enqueue_uploads(db: Database, store: BlobStore, user_id: int, files: List[Dict],
+                    priority: int = 0, cache: ExtractionCache = None) -> List[int]:
+    """Store uploaded files as blobs, record them and queue them for processing.
+    
+    Each file is a dict with ``name``, ``type`` and ``stream`` (a binary file
+    object, copied in chunks). Re-uploads of a file the user already has
+    reuse its row, and documents found in the extraction cache are recorded
+    as processed without a job.
+    Returns the file ids in input order.
+    """
+    file_ids = [None] * len(files)
+    first_copies = {}
+    duplicates = []
+    new_files = []
+    queued_ids = []
+    for index, file in enumerate(files):
+        digest, size = store.write_stream(file['stream'])
+        if digest in first_copies:
+            duplicates.append((index, first_copies[digest]))
+            continue
+        first_copies[digest] = index
+        
+        existing = db.find_file_by_hash(user_id, digest)
+        if existing:
+            file_ids[index] = existing['id']
+            if existing['job_state'] == 'failed':
+                queued_ids.append(existing['id'])
+            continue
+        
+        cached = cache.get(digest) if cache else None
+        new_files.append((index, {
+            'user_id': user_id,
+            'filename': file['name'],
+            'blob_id': digest,
+            'file_type': file['type'],
+            'file_size': size,
+            'processed': cached is not None,
+            'extracted_data': json.dumps(cached['extracted_data']) if cached else None
+        }))
+    
+    new_ids = db.add_files(file for _, file in new_files)
+    for (index, file), file_id in zip(new_files, new_ids):
+        file_ids[index] = file_id
+        if not file['processed']:
+            queued_ids.append(file_id)
+    for index, first_index in duplicates:
+        file_ids[index] = file_ids[first_index]
+    
+    db.enqueue_jobs(user_id, queued_ids, priority)
+    return file_ids
+
+class BatchProcessor:
+    """Process queued documents in parallel worker processes.
+    
+    Several processors (in the app or started from the command line) can
+    share one database; leases make sure each job runs on one of them.
+    Documents already in the extraction cache are completed without OCR.
+    """
+    
+    def __init__(self, db: Database, store: BlobStore = None, max_workers: int = None,
+                 lease_seconds: int = 300, poll_interval: float = 1.0, worker_id: str = None,
+                 cache: ExtractionCache = None):
+        self.db = db
+        self.store = store or BlobStore()
+        self.cache = cache or ExtractionCache(db, AIProcessor().extractor_version)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers don't inherit the server's threads or open connections
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker
+                )
+            return self._executor
+    
+    def submit_document(self, file_path: str, file_type: str, source_name: str = None) -> Future:
+        """Process one document in the worker pool, outside the job queue"""
+        return self._get_executor().submit(_process_in_worker, file_path, file_type, source_name)
+    
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def run(self, stop: threading.Event = None, until_idle: bool = False):
+        """Claim and process jobs until stopped (or, with until_idle, the queue is empty)"""
+        stop = stop or self._stop
+        running = {}
+        last_heartbeat = time.monotonic()
+        self.cache.purge_stale()
+        try:
+            while not stop.is_set():
+                if len(running) < self.max_workers:
+                    jobs = self.db.claim_jobs(self.worker_id, self.max_workers - len(running),
+                                              self.lease_seconds)
+                    cached = []
+                    for job in jobs:
+                        hit = self.cache.get(job['content_hash'])
+                        if hit:
+                            cached.append((job['id'], json.dumps(hit['extracted_data'])))
+                        else:
+                            future = self.submit_document(self.store.resolve(job['blob_id']),
+                                                          job['file_type'], job['filename'])
+                            running[future] = job
+                    if cached:
+                        self.db.complete_jobs(self.worker_id, cached)
+                        continue
+                
+                if not running:
+                    if until_idle:
+                        break
+                    stop.wait(self.poll_interval)
+                    continue
+                
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                self._record([(future, running.pop(future)) for future in done])
+                
+                if running and time.monotonic() - last_heartbeat > self.lease_seconds / 3:
+                    self.db.extend_job_leases(self.worker_id, [job['id'] for job in running.values()],
+                                              self.lease_seconds)
+                    last_heartbeat = time.monotonic()
+        finally:
+            if running:
+                for future in running:
+                    future.cancel()
+                self.db.release_jobs(self.worker_id, [job['id'] for job in running.values()])
+    
+    def _record(self, finished: List):
+        completed = []
+        for future, job in finished:
+            try:
+                result = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._reset_executor()
+                self.db.fail_job(job['id'], self.worker_id, str(e) or type(e).__name__)
+                continue
+            
+            if result['success']:
+                completed.append((job['id'], json.dumps(result['extracted_data'])))
+                self.cache.put(job['content_hash'], result['raw_text'], result['extracted_data'])
+            else:
+                # process_document reports unusable documents this way; retrying won't help
+                self.db.fail_job(job['id'], self.worker_id, result.get('error'), retry=False)
+        
+        self.db.complete_jobs(self.worker_id, completed)
+    
+    def start(self):
+        """Run the processor on a background thread"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='document-worker', daemon=True)
+            self._thread.start()
+    
+    def shutdown(self, wait: bool = True):
+        """Stop claiming jobs, hand unfinished ones back and stop the worker pool"""
+        self._stop.set()
+        if wait and self._thread:
+            self._thread.join()
+        self._reset_executor()
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point for standalone workers"""
+    parser = argparse.ArgumentParser(description="Process queued ExpenseWise documents")
+    parser.add_argument('--db', default='multitools.db', help="SQLite database path")
+    parser.add_argument('--blobs', default=BLOB_ROOT, help="Blob store directory")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument('--lease', type=int, default=300, help="Seconds a claimed job is reserved")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between queue polls")
+    parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty")
+    args = parser.parse_args(argv)
+    
+    processor = BatchProcessor(Database(args.db), BlobStore(args.blobs), max_workers=args.workers,
+                               lease_seconds=args.lease, poll_interval=args.poll_interval)
+    print(f"worker {processor.worker_id} processing with {processor.max_workers} processes", file=sys.stderr)
+    try:
+        processor.run(until_idle=args.burst)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        processor.shutdown(wait=False)
+    print(f"extraction cache: {json.dumps(processor.cache.stats())}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
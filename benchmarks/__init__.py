@@ -0,0 +1,5 @@
+"""
+Benchmarks for ExpenseWise
+Run a module from the repository root, e.g. ``python -m benchmarks.bench_extraction``,
+or the whole suite with ``python -m benchmarks.run``
+"""
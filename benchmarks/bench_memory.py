@@ -0,0 +1,98 @@
+"""
+Expense result set memory benchmark
+Compares bytes per expense held by the original one-dict-per-row results with
+the slotted ExpenseRecord rows Database returns now, and checks both hold the same data
+
+Usage:
+    python -m benchmarks.bench_memory [--expenses 20000]
+"""
+
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+from typing import Callable, Dict
+from database import Database, EXPENSE_COLUMNS
+from benchmarks.datagen import fixture_database, generate_expenses, generate_users
+
+def legacy_expense_from_row(row) -> Dict:
+    """The dict-per-row conversion Database used before ExpenseRecord"""
+    return {
+        'id': row[0],
+        'title': row[1],
+        'amount': row[2],
+        'category': row[3],
+        'description': row[4],
+        'date': row[5],
+        'receipt_path': row[6],
+        'status': row[7],
+        'created_at': row[8]
+    }
+
+def build_database(path: str, count: int, seed: int = 42) -> int:
+    """Create a database holding ``count`` deterministic expenses for one user"""
+    db = fixture_database(path)
+    user_id = db.create_user(**next(generate_users(1)))
+    db.bulk_add_expenses(generate_expenses([user_id], count, seed))
+    db.close()
+    return user_id
+
+def bytes_per_expense(db: Database, user_id: int, convert: Callable) -> float:
+    """Memory retained by a converted result set, per row, once the raw rows are dropped"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with db.connection() as conn:
+            rows = conn.execute(f'SELECT {EXPENSE_COLUMNS} FROM expenses WHERE user_id = ?',
+                                (user_id,)).fetchall()
+        expenses = [convert(row) for row in rows]
+        count = len(rows)
+        del rows
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del expenses
+    return retained / count
+
+def run(expenses: int = 20000) -> Dict:
+    """Measure both representations over the same result set"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        user_id = build_database(path, expenses)
+        db = Database(path)
+        try:
+            with db.connection() as conn:
+                rows = conn.execute(f'SELECT {EXPENSE_COLUMNS} FROM expenses WHERE user_id = ?',
+                                    (user_id,)).fetchall()
+            mismatches = sum(1 for row in rows
+                             if legacy_expense_from_row(row) != db._expense_from_row(row))
+            del rows
+            
+            before = bytes_per_expense(db, user_id, legacy_expense_from_row)
+            after = bytes_per_expense(db, user_id, db._expense_from_row)
+        finally:
+            db.close()
+    return {
+        'expenses': expenses,
+        'before_bytes_per_expense': round(before),
+        'after_bytes_per_expense': round(after),
+        'reduction': round(1 - after / before, 3),
+        'mismatches': mismatches,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory held by expense result sets")
+    parser.add_argument('--expenses', type=int, default=20000)
+    args = parser.parse_args()
+    
+    result = run(args.expenses)
+    print(f"expenses:   {result['expenses']}")
+    print(f"before:     {result['before_bytes_per_expense']:,} bytes/expense")
+    print(f"after:      {result['after_bytes_per_expense']:,} bytes/expense")
+    print(f"reduction:  {result['reduction']:.1%}")
+    print(f"mismatches: {result['mismatches']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Password hashing benchmark
+Reports logins per second per core for a range of scrypt and PBKDF2 work
+factors, to pick the EXPENSEWISE_* password settings for a deployment
+
+Usage:
+    python -m benchmarks.bench_passwords [--logins 20]
+"""
+
+import argparse
+import time
+from typing import Dict, List
+from passwords import PBKDF2, SCRYPT, PasswordHasher
+
+SCRYPT_COSTS = [2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15, 2 ** 16]
+PBKDF2_ITERATIONS = [100000, 210000, 310000, 600000]
+
+def logins_per_second(hasher: PasswordHasher, logins: int) -> float:
+    """Sequential verifications per second on one core"""
+    stored = hasher.hash('correct horse battery staple')
+    start = time.perf_counter()
+    for _ in range(logins):
+        if not hasher.verify('correct horse battery staple', stored):
+            raise AssertionError("verification failed")
+    return logins / (time.perf_counter() - start)
+
+def run(logins: int = 20) -> List[Dict]:
+    """Benchmark every work factor"""
+    results = []
+    for n in SCRYPT_COSTS:
+        hasher = PasswordHasher(SCRYPT, scrypt_n=n)
+        results.append({
+            'scheme': SCRYPT,
+            'work_factor': f'n={n}',
+            'memory_mib': round(128 * hasher.scrypt_r * n / 2 ** 20, 1),
+            'logins_per_sec_per_core': round(logins_per_second(hasher, logins), 1),
+        })
+    for iterations in PBKDF2_ITERATIONS:
+        hasher = PasswordHasher(PBKDF2, pbkdf2_iterations=iterations)
+        results.append({
+            'scheme': PBKDF2,
+            'work_factor': f'iterations={iterations}',
+            'memory_mib': 0.0,
+            'logins_per_sec_per_core': round(logins_per_second(hasher, logins), 1),
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark password verification cost")
+    parser.add_argument('--logins', type=int, default=20)
+    args = parser.parse_args()
+    
+    print(f"{'scheme':<15} {'work factor':<18} {'memory':>9} {'logins/s/core':>14}")
+    for result in run(args.logins):
+        print(f"{result['scheme']:<15} {result['work_factor']:<18} "
+              f"{result['memory_mib']:>5} MiB {result['logins_per_sec_per_core']:>14}")
+
+if __name__ == '__main__':
+    main()
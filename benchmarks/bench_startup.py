@@ -0,0 +1,153 @@
+"""
+Startup import benchmark
+Times, with ``python -X importtime``, the imports the Streamlit entry point runs
+before it can draw the login form, lists the slowest modules and fails when a
+dependency that only one page needs is loaded at startup
+
+Usage:
+    python -m benchmarks.bench_startup [--top 15] [--max-time 5] [--output startup.json]
+                                       [--baseline startup.json] [--threshold 0.10]
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+from typing import Dict, List
+from benchmarks.harness import compare, load_results, make_results, measure, save_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINT = os.path.join(ROOT, 'streamlit_app.py')
+
+# Heavy packages only the pages that use them should import
+LAZY_MODULES = ('plotly', 'pandas', 'PIL', 'pyarrow')
+
+def entry_point_imports(path: str = ENTRY_POINT) -> List[str]:
+    """Modules imported at the top level of a script, in order (imports inside pages are skipped)"""
+    with open(path, encoding='utf-8') as handle:
+        tree = ast.parse(handle.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        modules.extend(name for name in names if name not in modules)
+    return modules
+
+def import_script(modules: List[str]) -> str:
+    """A program importing modules in order and printing the ones that failed.
+    
+    It imports nothing of its own, so every module it loads is the entry point's.
+    """
+    return (
+        "missing = {}\n"
+        f"for name in {modules!r}:\n"
+        "    try:\n"
+        "        __import__(name)\n"
+        "    except ImportError as exc:\n"
+        "        missing[name] = str(exc)\n"
+        "print(repr(missing))\n"
+    )
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Parse ``-X importtime`` output into one entry per imported module"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us)
+        })
+    return modules
+
+def _importtime(program: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', program],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+
+def profile_imports(modules: List[str]) -> Dict:
+    """Import modules in a fresh interpreter with ``-X importtime``.
+    
+    Modules a bare interpreter already loads at startup are left out.
+    """
+    preloaded = {module['module'] for module in parse_importtime(_importtime('pass').stderr)}
+    completed = _importtime(import_script(modules))
+    imported = [module for module in parse_importtime(completed.stderr) if module['module'] not in preloaded]
+    return {
+        'modules': imported,
+        'missing': ast.literal_eval(completed.stdout),
+        'total_us': sum(module['self_us'] for module in imported),
+        'lazy_loaded': sorted({module['module'].split('.')[0] for module in imported} & set(LAZY_MODULES))
+    }
+
+def run(max_time: float = 5.0) -> Dict:
+    """Profile the entry point's imports and time them end to end against a bare interpreter"""
+    modules = entry_point_imports()
+    script = import_script(modules)
+    
+    def start(program: str):
+        subprocess.run([sys.executable, '-c', program], cwd=ROOT, capture_output=True, check=True)
+    
+    return {
+        'imports': modules,
+        'profile': profile_imports(modules),
+        'benchmarks': {
+            'interpreter': measure(lambda: start('pass'), max_time=max_time / 2, min_rounds=5),
+            'startup_imports': measure(lambda: start(script), max_time=max_time / 2, min_rounds=5),
+        }
+    }
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Streamlit entry point's import time")
+    parser.add_argument('--top', type=int, default=15, help="Slowest top-level imports to list")
+    parser.add_argument('--max-time', type=float, default=5.0, help="Seconds to spend timing startups")
+    parser.add_argument('--output', help="Write JSON results here")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Median slowdown counted as a regression (fraction)")
+    args = parser.parse_args(argv)
+    
+    result = run(args.max_time)
+    profile = result['profile']
+    stats = result['benchmarks']
+    imports_ms = (stats['startup_imports']['median'] - stats['interpreter']['median']) * 1000
+    
+    print(f"{'module':<40} {'cumulative ms':>14} {'self ms':>9}")
+    roots = [module for module in profile['modules'] if module['depth'] == 0]
+    for module in sorted(roots, key=lambda module: module['cumulative_us'], reverse=True)[:args.top]:
+        print(f"{module['module']:<40} {module['cumulative_us'] / 1000:>14.1f} {module['self_us'] / 1000:>9.1f}")
+    print()
+    print(f"modules imported:  {len(profile['modules'])}")
+    print(f"import time:       {profile['total_us'] / 1000:.1f} ms (-X importtime, self times summed)")
+    print(f"startup overhead:  {imports_ms:.1f} ms median over a bare interpreter")
+    for name, error in profile['missing'].items():
+        print(f"warning: {name} not importable here ({error}); its cost is not included")
+    
+    results = make_results(stats, {'imports': result['imports'], 'max_time': args.max_time})
+    results['import_profile'] = profile
+    if args.output:
+        save_results(args.output, results)
+    
+    status = 0
+    if profile['lazy_loaded']:
+        print(f"FAIL: loaded at startup but only needed by some pages: {', '.join(profile['lazy_loaded'])}")
+        status = 1
+    if args.baseline:
+        for entry in compare(results, load_results(args.baseline), args.threshold):
+            marker = 'REGRESSION' if entry['regression'] else ''
+            print(f"{entry['name']:<16} {entry['baseline_median'] * 1000:>8.1f} ms -> "
+                  f"{entry['median'] * 1000:>8.1f} ms  {entry['change']:+.1%}  {marker}")
+            # The bare interpreter is timed for reference only
+            if entry['regression'] and entry['name'] == 'startup_imports':
+                status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Synthetic data for ExpenseWise benchmarks
+Deterministic users, teams, expenses and receipt texts: the same seed always
+gives the same data, so results from different runs are comparable
+
+Usage:
+    python -m benchmarks.datagen fixture.db [--scale 100k] [--seed 42]
+"""
+
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+from typing import Dict, Iterator, List
+from ai_processor import AIProcessor
+from database import Database
+from passwords import PBKDF2, PasswordHasher
+
+# Expense counts of the standard fixture sizes
+SCALES = {
+    '1k': 1000,
+    '100k': 100000,
+    '1m': 1000000,
+}
+
+# One user per this many expenses, in teams of TEAM_SIZE
+EXPENSES_PER_USER = 1000
+TEAM_SIZE = 25
+
+VENDORS = ['Starbucks Coffee', 'Shell Gas Station', 'Hilton Hotel', 'Office Depot',
+           'Adobe Software', 'Corner Bakery', 'City Parking', 'Acme Corporation']
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+CATEGORIES = ['Food & Dining', 'Transportation', 'Travel', 'Office Supplies',
+              'Technology', 'Utilities', 'Entertainment', 'Other']
+TITLES = ['Coffee', 'Taxi ride', 'Hotel night', 'Printer paper', 'Software license',
+          'Electricity bill', 'Team lunch', 'Parking']
+
+FIXTURE_PASSWORD = 'bench-password'
+
+def receipt_corpus(count: int, seed: int = 42) -> List[str]:
+    """Build a deterministic mix of receipt, invoice and free-form texts"""
+    rng = random.Random(seed)
+    processor = AIProcessor()
+    corpus = [
+        processor.extract_text_from_image('receipt.jpg'),
+        processor.extract_text_from_image('invoice.png'),
+        processor.extract_text_from_image('scan.png'),
+        processor.extract_text_from_pdf('invoice.pdf'),
+    ]
+    while len(corpus) < count:
+        vendor = rng.choice(VENDORS)
+        day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.randint(2019, 2025)
+        date_text = rng.choice([
+            f"{month:02d}/{day:02d}/{year}",
+            f"{year}-{month:02d}-{day:02d}",
+            f"{MONTHS[month - 1].title()} {day}, {year}",
+            f"{day} {MONTHS[month - 1].upper()} {year}",
+        ])
+        items = '\n'.join(
+            f"    Item {i:<16} ${rng.randint(1, 300)}.{rng.randint(0, 99):02d}" for i in range(rng.randint(1, 12))
+        )
+        total = rng.choice([f"Total ${rng.randint(5, 900)}.{rng.randint(0, 99):02d}",
+                            f"Amount: {rng.randint(5, 900)} dollars",
+                            "Balance due on receipt"])
+        header = rng.choice([f"{vendor.upper()}", f"Merchant: {vendor}", f"From: {vendor}"])
+        corpus.append(f"\n    {header}\n    Date: {date_text}\n{items}\n    {total}\n    Thank you!\n")
+    return corpus[:count]
+
+def generate_users(count: int) -> Iterator[Dict]:
+    """Users named user0001, user0002, ... sharing FIXTURE_PASSWORD"""
+    for index in range(1, count + 1):
+        yield {
+            'username': f'user{index:04d}',
+            'email': f'user{index:04d}@example.com',
+            'password': FIXTURE_PASSWORD,
+            'full_name': f'User {index}'
+        }
+
+def generate_expenses(user_ids: List[int], count: int, seed: int = 42,
+                      start: date = date(2023, 1, 1), days: int = 730) -> Iterator[Dict]:
+    """Expenses spread over ``days`` from ``start``, for bulk_add_expenses.
+    
+    Users are picked with Zipf-like weights, so the first user has the most
+    expenses, as the busiest accounts do in production.
+    """
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(user_ids) + 1)]
+    owners = rng.choices(user_ids, weights, k=count)
+    for index, user_id in enumerate(owners):
+        yield {
+            'user_id': user_id,
+            'title': rng.choice(TITLES),
+            'amount': round(rng.lognormvariate(3.5, 1.0), 2),
+            'category': rng.choice(CATEGORIES),
+            'description': f"Receipt #{index} from {rng.choice(VENDORS)}",
+            'date': (start + timedelta(days=rng.randrange(days))).isoformat()
+        }
+
+def fixture_database(path: str) -> Database:
+    """Open a fixture database.
+    
+    Fixture users are hashed with a single PBKDF2 round so large fixtures
+    build quickly; benchmarks of login cost create their own users.
+    """
+    return Database(path, hasher=PasswordHasher(PBKDF2, pbkdf2_iterations=1))
+
+def build_fixture(path: str, scale: str = '1k', seed: int = 42) -> Dict:
+    """Create a fixture database at path (reusing it if it was built with the same settings).
+    
+    Returns a description with the user and team ids and the busiest user's id.
+    """
+    expenses = SCALES[scale]
+    settings = {'scale': scale, 'seed': seed, 'expenses': expenses}
+    meta_path = path + '.json'
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as handle:
+            fixture = json.load(handle)
+        if fixture['settings'] == settings:
+            return fixture
+    for stale in (path, path + '-wal', path + '-shm', meta_path):
+        if os.path.exists(stale):
+            os.unlink(stale)
+    
+    db = fixture_database(path)
+    try:
+        user_ids = [db.create_user(**user) for user in generate_users(max(1, expenses // EXPENSES_PER_USER))]
+        team_ids = []
+        for offset in range(0, len(user_ids), TEAM_SIZE):
+            members = user_ids[offset:offset + TEAM_SIZE]
+            team_id = db.create_team(f'Team {len(team_ids) + 1}', 'Benchmark team', members[0])
+            for member_id in members[1:]:
+                db.add_team_member(team_id, member_id)
+            team_ids.append(team_id)
+        db.bulk_add_expenses(generate_expenses(user_ids, expenses, seed), chunk_size=5000)
+    finally:
+        db.close()
+    
+    fixture = {'settings': settings, 'user_ids': user_ids, 'team_ids': team_ids, 'busiest_user_id': user_ids[0]}
+    with open(meta_path, 'w') as handle:
+        json.dump(fixture, handle)
+    return fixture
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a benchmark fixture database")
+    parser.add_argument('path', help="SQLite database to create")
+    parser.add_argument('--scale', choices=SCALES, default='1k')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    fixture = build_fixture(args.path, args.scale, args.seed)
+    print(f"expenses: {fixture['settings']['expenses']:,}")
+    print(f"users:    {len(fixture['user_ids']):,}")
+    print(f"teams:    {len(fixture['team_ids']):,}")
+
+if __name__ == '__main__':
+    main()
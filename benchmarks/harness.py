@@ -0,0 +1,114 @@
+"""
+Timing harness for ExpenseWise benchmarks
+Calibrated rounds with pytest-benchmark style statistics, a JSON results
+format and comparison against a stored baseline
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# Results format version, bumped if the JSON layout changes
+RESULTS_VERSION = 1
+
+def measure(func: Callable[[], object], max_time: float = 1.0, min_rounds: int = 5,
+            max_rounds: int = 1000, round_time: float = 0.001, warmup: int = 1) -> Dict:
+    """Time func over calibrated rounds, returning per-call statistics in seconds.
+    
+    Each round runs func enough times to take at least ``round_time``, so
+    timer resolution doesn't dominate fast calls. Rounds continue until
+    ``max_time`` has passed and at least ``min_rounds`` have run.
+    """
+    for _ in range(warmup):
+        func()
+    
+    start = time.perf_counter()
+    func()
+    single = time.perf_counter() - start
+    iterations = max(1, int(round_time / single)) if single > 0 else 1000
+    
+    timings = []
+    deadline = time.perf_counter() + max_time
+    while len(timings) < max_rounds and (len(timings) < min_rounds or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        timings.append((time.perf_counter() - start) / iterations)
+    
+    mean = statistics.fmean(timings)
+    return {
+        'min': min(timings),
+        'max': max(timings),
+        'mean': mean,
+        'median': statistics.median(timings),
+        'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'rounds': len(timings),
+        'iterations': iterations,
+        'ops': 1 / mean if mean else 0.0,
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def machine_info() -> Dict:
+    """Describe the machine and checkout results were produced on"""
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'commit': _git_commit(),
+    }
+
+def make_results(benchmarks: Dict[str, Dict], settings: Dict) -> Dict:
+    """Wrap per-benchmark statistics in the results document"""
+    return {
+        'version': RESULTS_VERSION,
+        'datetime': datetime.now().isoformat(timespec='seconds'),
+        'machine_info': machine_info(),
+        'settings': settings,
+        'benchmarks': [{'name': name, 'stats': stats} for name, stats in benchmarks.items()],
+    }
+
+def save_results(path: str, results: Dict):
+    with open(path, 'w') as handle:
+        json.dump(results, handle, indent=2)
+
+def load_results(path: str) -> Dict:
+    with open(path) as handle:
+        results = json.load(handle)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(f"{path}: unsupported results version {results.get('version')!r}")
+    return results
+
+def compare(results: Dict, baseline: Dict, threshold: float = 0.10) -> List[Dict]:
+    """Compare median times with a baseline.
+    
+    Returns one entry per benchmark present in both; ``regression`` is set
+    when the median is more than ``threshold`` (a fraction) slower.
+    """
+    baseline_stats = {benchmark['name']: benchmark['stats'] for benchmark in baseline['benchmarks']}
+    comparison = []
+    for benchmark in results['benchmarks']:
+        before = baseline_stats.get(benchmark['name'])
+        if not before:
+            continue
+        change = benchmark['stats']['median'] / before['median'] - 1 if before['median'] else 0.0
+        comparison.append({
+            'name': benchmark['name'],
+            'baseline_median': before['median'],
+            'median': benchmark['stats']['median'],
+            'change': change,
+            'regression': change > threshold,
+        })
+    return comparison
@@ -0,0 +1,72 @@
+"""
+Benchmark runner for ExpenseWise
+Builds (or reuses) a synthetic fixture, times every scenario, writes JSON
+results and fails when a scenario regressed against a baseline
+
+Usage:
+    python -m benchmarks.run [--scale 1k] [--only get_expenses ...]
+                             [--output results.json] [--baseline baseline.json] [--threshold 0.10]
+                             [--fixture fixture.db]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from typing import List
+from benchmarks.datagen import SCALES, build_fixture, fixture_database
+from benchmarks.harness import compare, load_results, make_results, measure, save_results
+from benchmarks.scenarios import SCENARIOS, BenchmarkContext
+
+def _format_time(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the ExpenseWise benchmark suite")
+    parser.add_argument('--scale', choices=SCALES, default='1k', help="Fixture size in expenses")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='+', choices=sorted(SCENARIOS), help="Scenarios to run")
+    parser.add_argument('--max-time', type=float, default=1.0, help="Seconds to spend per scenario")
+    parser.add_argument('--output', help="Write JSON results here")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Median slowdown counted as a regression (fraction)")
+    parser.add_argument('--fixture', help="Keep the fixture database here and reuse it on later runs")
+    args = parser.parse_args(argv)
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        fixture_path = args.fixture or os.path.join(work_dir, 'fixture.db')
+        fixture = build_fixture(fixture_path, args.scale, args.seed)
+        db = fixture_database(fixture_path)
+        try:
+            stats = {}
+            with BenchmarkContext(db, fixture, work_dir) as context:
+                for name in args.only or SCENARIOS:
+                    stats[name] = measure(SCENARIOS[name](context), max_time=args.max_time)
+                    print(f"{name:<22} median {_format_time(stats[name]['median']):>10}   "
+                          f"{stats[name]['ops']:>12,.1f} ops/s   ({stats[name]['rounds']} rounds)")
+        finally:
+            db.close()
+    
+    results = make_results(stats, {'scale': args.scale, 'seed': args.seed, 'max_time': args.max_time})
+    if args.output:
+        save_results(args.output, results)
+    
+    if not args.baseline:
+        return 0
+    baseline = load_results(args.baseline)
+    comparison = compare(results, baseline, args.threshold)
+    print()
+    if baseline['settings'].get('scale') != args.scale:
+        print(f"warning: baseline was run at scale {baseline['settings'].get('scale')}")
+    for entry in comparison:
+        marker = 'REGRESSION' if entry['regression'] else ''
+        print(f"{entry['name']:<22} {_format_time(entry['baseline_median']):>10} -> "
+              f"{_format_time(entry['median']):>10}  {entry['change']:+.1%}  {marker}")
+    return 1 if any(entry['regression'] for entry in comparison) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
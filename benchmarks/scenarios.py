@@ -0,0 +1,104 @@
+"""
+Benchmark scenarios for ExpenseWise
+Each scenario prepares against a fixture and returns the call to time
+"""
+
+import itertools
+import os
+import random
+from typing import Callable, Dict
+from ai_processor import AIProcessor
+from database import Database
+from benchmarks.datagen import receipt_corpus
+
+# Scenario name -> setup(context) returning the zero-argument call to time
+SCENARIOS: Dict[str, Callable[['BenchmarkContext'], Callable[[], object]]] = {}
+
+BENCH_PASSWORD = 'bench-password'
+
+def scenario(name: str):
+    """Register a scenario setup function under name"""
+    def register(setup):
+        SCENARIOS[name] = setup
+        return setup
+    return register
+
+class BenchmarkContext:
+    """What scenarios share: the fixture database, its description and a scratch directory.
+    
+    Use it as a context manager; databases scenarios open through
+    ``open_database()`` are closed on exit (the fixture database is not).
+    """
+    
+    def __init__(self, db: Database, fixture: Dict, work_dir: str):
+        self.db = db
+        self.fixture = fixture
+        self.work_dir = work_dir
+        self.user_id = fixture['busiest_user_id']
+        self._processor = None
+        self._databases = []
+    
+    def __enter__(self) -> 'BenchmarkContext':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        """Close the databases opened with open_database()"""
+        while self._databases:
+            self._databases.pop().close()
+    
+    def open_database(self) -> Database:
+        """Open another connection pool on the fixture, closed with the context"""
+        db = Database(self.db.db_path)
+        self._databases.append(db)
+        return db
+    
+    @property
+    def processor(self) -> AIProcessor:
+        if self._processor is None:
+            self._processor = AIProcessor()
+        return self._processor
+    
+    def bench_user(self, db: Database, username: str) -> int:
+        """Get a dedicated user's id, creating the user on first use"""
+        db.create_user(username, f'{username}@example.com', BENCH_PASSWORD)
+        return db.authenticate_user(username, BENCH_PASSWORD)['id']
+
+@scenario('add_expense')
+def add_expense(context: BenchmarkContext) -> Callable[[], object]:
+    # A separate user, so writes don't change what the read scenarios measure
+    user_id = context.bench_user(context.db, 'bench_writer')
+    rng = random.Random(0)
+    return lambda: context.db.add_expense(user_id, 'Benchmark expense', round(rng.uniform(1, 500), 2),
+                                          'Other', 'Written by the benchmark', '2024-06-01')
+
+@scenario('get_expenses')
+def get_expenses(context: BenchmarkContext) -> Callable[[], object]:
+    return lambda: context.db.get_expenses(context.user_id, limit=100)
+
+@scenario('get_expense_stats')
+def get_expense_stats(context: BenchmarkContext) -> Callable[[], object]:
+    return lambda: context.db.get_expense_stats(context.user_id)
+
+@scenario('authenticate_user')
+def authenticate_user(context: BenchmarkContext) -> Callable[[], object]:
+    # Uses the deployment's password settings, unlike the cheap fixture hasher
+    db = context.open_database()
+    context.bench_user(db, 'bench_login')
+    return lambda: db.authenticate_user('bench_login', BENCH_PASSWORD)
+
+@scenario('extract_expense_data')
+def extract_expense_data(context: BenchmarkContext) -> Callable[[], object]:
+    texts = itertools.cycle(receipt_corpus(500))
+    processor = context.processor
+    return lambda: processor.extract_expense_data(next(texts))
+
+@scenario('process_document')
+def process_document(context: BenchmarkContext) -> Callable[[], object]:
+    path = os.path.join(context.work_dir, 'receipt.png')
+    with open(path, 'wb') as handle:
+        handle.write(b'\x89PNG\r\n\x1a\n' + bytes(1024))
+    processor = context.processor
+    return lambda: processor.process_document(path, 'image/png')
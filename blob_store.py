@@ -0,0 +1,171 @@
+"""
+Blob store for ExpenseWise
+Keeps uploaded documents on local disk, addressed and deduplicated by content hash
+
+Usage:
+    python blob_store.py gc --db multitools.db --root blobs
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Iterable, Iterator, List, Tuple
+from database import Database
+from extraction_cache import HASH_DIGEST_SIZE
+
+BLOB_ROOT = 'blobs'
+
+# Uploads are copied in chunks of this size instead of being read whole
+CHUNK_SIZE = 1024 * 1024
+
+BLOB_ID_PATTERN = re.compile(rf'[0-9a-f]{{{HASH_DIGEST_SIZE * 2}}}')
+
+def is_blob_id(reference: str) -> bool:
+    """Check whether a stored file reference is a blob id (not a legacy path)"""
+    return bool(reference) and BLOB_ID_PATTERN.fullmatch(reference) is not None
+
+class BlobStore:
+    """Content-addressed files sharded as root/ab/cd/<blob id>.
+    
+    A blob id is the BLAKE2b hash of the content, the same value as
+    extraction_cache.content_hash(), so identical uploads share one blob.
+    """
+    
+    def __init__(self, root: str = BLOB_ROOT, chunk_size: int = CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+    
+    def path(self, blob_id: str) -> str:
+        """Get the on-disk path of a blob"""
+        if not is_blob_id(blob_id):
+            raise ValueError(f"Invalid blob id: {blob_id!r}")
+        return os.path.join(self.root, blob_id[:2], blob_id[2:4], blob_id)
+    
+    def resolve(self, reference: str) -> str:
+        """Get the path for a stored file reference (blob id or legacy path)"""
+        return self.path(reference) if is_blob_id(reference) else reference
+    
+    def exists(self, blob_id: str) -> bool:
+        return os.path.exists(self.path(blob_id))
+    
+    def write_stream(self, stream: BinaryIO) -> Tuple[str, int]:
+        """Store a stream's content in chunks, returning (blob_id, size).
+        
+        Content is written to a temp file, flushed to disk and renamed into
+        place, so readers never see a partial blob.
+        """
+        hasher = hashlib.blake2b(digest_size=HASH_DIGEST_SIZE)
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    tmp_file.write(chunk)
+                    size += len(chunk)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            
+            blob_id = hasher.hexdigest()
+            path = self.path(blob_id)
+            try:
+                # Already stored: keep that copy, refreshed so GC spares it
+                os.utime(path)
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return blob_id, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    
+    def write_bytes(self, data: bytes) -> Tuple[str, int]:
+        """Store bytes, returning (blob_id, size)"""
+        with tempfile.SpooledTemporaryFile(max_size=self.chunk_size) as stream:
+            stream.write(data)
+            stream.seek(0)
+            return self.write_stream(stream)
+    
+    def iter_chunks(self, blob_id: str) -> Iterator[bytes]:
+        """Stream a blob's content in chunks"""
+        with open(self.path(blob_id), 'rb') as handle:
+            while True:
+                chunk = handle.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    
+    @contextmanager
+    def mapped(self, blob_id: str) -> Iterator[mmap.mmap]:
+        """Memory-map a blob read-only (empty blobs map to b'')"""
+        with open(self.path(blob_id), 'rb') as handle:
+            if os.fstat(handle.fileno()).st_size == 0:
+                yield b''
+                return
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                yield view
+    
+    def preview(self, blob_id: str, max_bytes: int = 5 * 1024 * 1024) -> bytes:
+        """Read up to max_bytes of a blob through a memory map"""
+        with self.mapped(blob_id) as view:
+            return view[:max_bytes]
+    
+    def iter_blob_ids(self) -> Iterator[str]:
+        """List the ids of all stored blobs"""
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if is_blob_id(filename) and directory != self.tmp_dir:
+                    yield filename
+    
+    def collect_garbage(self, referenced: Iterable[str], min_age: int = 3600) -> List[str]:
+        """Delete blobs not in referenced, returning their ids.
+        
+        Blobs and temp files younger than min_age seconds are kept: they may
+        belong to an upload whose database row is not committed yet.
+        """
+        referenced = set(referenced)
+        cutoff = time.time() - min_age
+        removed = []
+        for blob_id in list(self.iter_blob_ids()):
+            path = self.path(blob_id)
+            if blob_id in referenced or os.path.getmtime(path) > cutoff:
+                continue
+            os.unlink(path)
+            removed.append(blob_id)
+        
+        for filename in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, filename)
+            if os.path.getmtime(path) <= cutoff:
+                os.unlink(path)
+        return removed
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point for blob store maintenance"""
+    parser = argparse.ArgumentParser(description="Maintain the ExpenseWise blob store")
+    parser.add_argument('command', choices=['gc'], help="gc: delete blobs nothing references")
+    parser.add_argument('--db', default='multitools.db', help="SQLite database path")
+    parser.add_argument('--root', default=BLOB_ROOT, help="Blob store directory")
+    parser.add_argument('--min-age', type=int, default=3600, help="Keep blobs younger than this (seconds)")
+    args = parser.parse_args(argv)
+    
+    store = BlobStore(args.root)
+    removed = store.collect_garbage(Database(args.db).get_file_references(), args.min_age)
+    print(json.dumps({'removed': len(removed)}))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
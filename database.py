@@ -5,215 +5,1106 @@ Uses SQLite for easy deployment and free hosting compatibility
 
 import sqlite3
 import json
+import re
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
-import hashlib
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 import secrets
+from models import ExpenseRecord, FileRecord
+from passwords import PasswordHasher
+from instrumentation import instrumented, trace_connection
+from slow_queries import SlowQueryLog, table_scans
 
+# Pragmas applied to every pooled connection. WAL lets readers run while a
+# writer is active; NORMAL sync is durable across application crashes in WAL mode.
+CONNECTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -16 * 1024,  # negative value is in KiB (16 MiB)
+    'busy_timeout': 5000,
+}
+
+def _dedupe_unique_keys(conn: sqlite3.Connection):
+    """Drop duplicate rows that would violate the new UNIQUE indexes"""
+    # Keep the original membership and the most recent value of each setting
+    conn.execute('''
+        DELETE FROM team_members WHERE id NOT IN (
+            SELECT MIN(id) FROM team_members GROUP BY team_id, user_id
+        )
+    ''')
+    conn.execute('''
+        DELETE FROM settings WHERE id NOT IN (
+            SELECT MAX(id) FROM settings GROUP BY user_id, setting_key
+        )
+    ''')
+
+def _add_column(table: str, column: str, declaration: str) -> Callable[[sqlite3.Connection], None]:
+    """Migration step adding a column unless it already exists"""
+    def step(conn: sqlite3.Connection):
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+    return step
+
+def _create_search_index(conn: sqlite3.Connection):
+    """Create FTS5 indexes over expenses and files, kept in sync by triggers"""
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+                title, description,
+                content='expenses', content_rowid='id', prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: searches fall back to LIKE scans
+        return
+    
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+            filename, extracted_data,
+            content='files', content_rowid='id', prefix='2 3'
+        )
+    ''')
+    
+    for table, columns in (('expenses', ('title', 'description')),
+                           ('files', ('filename', 'extracted_data'))):
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {table}_fts (rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {table}_fts (rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        # Index rows written before the migration
+        conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+# Rollup tables kept current by triggers on expenses, mapped to the key columns
+# they group by and the expression computing each key from an expense row.
+ROLLUP_KEYS = {
+    'expense_totals': {'user_id': '{row}.user_id'},
+    'expense_category_totals': {'user_id': '{row}.user_id', 'category': '{row}.category'},
+    'expense_month_totals': {'user_id': '{row}.user_id', 'month': "strftime('%Y-%m', {row}.date)"},
+}
+
+def _rollup_statements(table: str, keys: Dict[str, str], row: str, sign: str) -> str:
+    """SQL adding (sign '+') or removing (sign '-') one expense row from a rollup"""
+    key_columns = list(keys)
+    key_values = [expression.format(row=row) for expression in keys.values()]
+    not_null = ' AND '.join(f'({value}) IS NOT NULL' for value in key_values)
+    statements = f'''
+        INSERT INTO {table} ({', '.join(key_columns)}, total_amount, expense_count)
+        SELECT {', '.join(key_values)}, {sign}{row}.amount, {sign}1
+        WHERE {not_null}
+        ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET
+            total_amount = total_amount + excluded.total_amount,
+            expense_count = expense_count + excluded.expense_count;
+    '''
+    if sign == '-':
+        statements += f'''
+        DELETE FROM {table}
+        WHERE {' AND '.join(f'{column} = {value}' for column, value in zip(key_columns, key_values))}
+        AND expense_count <= 0;
+        '''
+    return statements
+
+def _create_rollups(conn: sqlite3.Connection):
+    """Create per-user, per-category and per-month expense rollups"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS expense_totals (
+            user_id INTEGER PRIMARY KEY,
+            total_amount REAL NOT NULL DEFAULT 0,
+            expense_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS expense_category_totals (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            total_amount REAL NOT NULL DEFAULT 0,
+            expense_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS expense_month_totals (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            total_amount REAL NOT NULL DEFAULT 0,
+            expense_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month)
+        ) WITHOUT ROWID
+    ''')
+    
+    add_new = ''.join(_rollup_statements(table, keys, 'new', '+') for table, keys in ROLLUP_KEYS.items())
+    remove_old = ''.join(_rollup_statements(table, keys, 'old', '-') for table, keys in ROLLUP_KEYS.items())
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_insert AFTER INSERT ON expenses BEGIN
+            {add_new}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_delete AFTER DELETE ON expenses BEGIN
+            {remove_old}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS expenses_rollup_update
+        AFTER UPDATE OF user_id, amount, category, date ON expenses BEGIN
+            {remove_old}
+            {add_new}
+        END
+    ''')
+    _rebuild_rollups(conn)
+
+def _rebuild_rollups(conn: sqlite3.Connection, user_id: int = None):
+    """Recompute rollups from the expenses table (for one user or everyone)"""
+    where = '' if user_id is None else 'WHERE user_id = ?'
+    params = () if user_id is None else (user_id,)
+    for table, keys in ROLLUP_KEYS.items():
+        key_columns = list(keys)
+        key_values = [expression.format(row='expenses') for expression in keys.values()]
+        conn.execute(f'DELETE FROM {table} {where}', params)
+        conn.execute(f'''
+            INSERT INTO {table} ({', '.join(key_columns)}, total_amount, expense_count)
+            SELECT {', '.join(key_values)}, SUM(amount), COUNT(*)
+            FROM expenses
+            WHERE {' AND '.join(f'({value}) IS NOT NULL' for value in key_values)}
+            {'' if user_id is None else 'AND expenses.user_id = ?'}
+            GROUP BY {', '.join(key_values)}
+        ''', params)
+
+# Schema migrations as (version, description, steps). A step is either a SQL
+# statement or a callable taking the connection. The applied version is kept in
+# PRAGMA user_version; append new migrations, never edit released ones.
+MIGRATIONS = [
+    (1, 'base schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            full_name TEXT,
+            role TEXT DEFAULT 'user',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            title TEXT NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT,
+            date DATE NOT NULL,
+            receipt_path TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            file_size INTEGER,
+            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed BOOLEAN DEFAULT 0,
+            extracted_data TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS teams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS team_members (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            team_id INTEGER,
+            user_id INTEGER,
+            role TEXT DEFAULT 'member',
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (team_id) REFERENCES teams (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            setting_key TEXT NOT NULL,
+            setting_value TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+    ]),
+    (2, 'secondary indexes and unique keys', [
+        'CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date DESC, created_at DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_user_category ON expenses (user_id, category, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_files_user_upload ON files (user_id, upload_date DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_team_members_user ON team_members (user_id, team_id, role)',
+        _dedupe_unique_keys,
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_team_members_team_user ON team_members (team_id, user_id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS ux_settings_user_key ON settings (user_id, setting_key)',
+    ]),
+    (3, 'indexes for filtered and amount-sorted expense listings', [
+        'CREATE INDEX IF NOT EXISTS idx_expenses_user_amount ON expenses (user_id, amount, id)',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_user_category_date ON expenses (user_id, category, date DESC, created_at DESC, id DESC)',
+    ]),
+    (4, 'full-text search over expenses and files', [
+        _create_search_index,
+    ]),
+    (5, 'incrementally maintained expense rollups', [
+        _create_rollups,
+    ]),
+    (6, 'document processing job queue', [
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            file_id INTEGER NOT NULL,
+            state TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            lease_owner TEXT,
+            lease_expires_at TIMESTAMP,
+            run_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (file_id) REFERENCES files (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (state, priority DESC, id)',
+        'CREATE INDEX IF NOT EXISTS idx_jobs_file ON jobs (file_id, id)',
+    ]),
+    (7, 'content hashes and the extraction result cache', [
+        _add_column('files', 'content_hash', 'TEXT'),
+        'CREATE INDEX IF NOT EXISTS idx_files_user_hash ON files (user_id, content_hash)',
+        '''
+        CREATE TABLE IF NOT EXISTS extraction_cache (
+            content_hash TEXT NOT NULL,
+            extractor_version TEXT NOT NULL,
+            raw_text TEXT,
+            extracted_data TEXT,
+            size INTEGER NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (content_hash, extractor_version)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_extraction_cache_lru ON extraction_cache (last_used_at)',
+    ]),
+    (8, 'server-side sessions', [
+        # Times are Unix epoch seconds; tokens are stored only as SHA-256 hashes
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_seen_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            data TEXT NOT NULL DEFAULT '{}',
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)',
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+EXPENSE_COLUMNS = 'id, title, amount, category, description, date, receipt_path, status, created_at'
+
+# A user's files with the state of their latest processing job
+UPLOAD_QUERY = '''
+    SELECT f.id, f.filename, f.file_type, f.file_size, f.upload_date, f.processed,
+           f.extracted_data, j.state, j.attempts, j.last_error, f.file_path
+    FROM files f
+    LEFT JOIN jobs j ON j.id = (SELECT MAX(id) FROM jobs WHERE file_id = f.id)
+    WHERE f.user_id = ?
+'''
+
+# Orderings accepted by Database.query_expenses. Each ends in a unique column so
+# the ordering is total and can be resumed from a keyset cursor.
+EXPENSE_SORTS = {
+    'date_desc': (('date', 'created_at', 'id'), 'DESC'),
+    'date_asc': (('date', 'created_at', 'id'), 'ASC'),
+    'amount_desc': (('amount', 'id'), 'DESC'),
+    'amount_asc': (('amount', 'id'), 'ASC'),
+}
+
+def expense_page_query(sort: str = 'date_desc', category: bool = False, fts: bool = False,
+                       like: bool = False, after: bool = False) -> str:
+    """SQL for one page of a user's expenses, as run by Database.query_expenses.
+    
+    Placeholders, in order: user_id, the category, the FTS match (or the LIKE
+    pattern twice), the cursor's sort values and the row limit.
+    """
+    sort_columns, direction = EXPENSE_SORTS[sort]
+    conditions = ['user_id = ?']
+    if category:
+        conditions.append('category = ?')
+    if fts:
+        conditions.append('id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?)')
+    elif like:
+        conditions.append("(title LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\')")
+    if after:
+        # Keyset condition: seek past the cursor instead of using OFFSET
+        operator = '<' if direction == 'DESC' else '>'
+        placeholders = ', '.join('?' * len(sort_columns))
+        conditions.append(f"({', '.join(sort_columns)}) {operator} ({placeholders})")
+    
+    order_by = ', '.join(f'{column} {direction}' for column in sort_columns)
+    return f'''
+        SELECT {EXPENSE_COLUMNS}
+        FROM expenses
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order_by}
+        LIMIT ?
+    '''
+
+AUTHENTICATE_USER_QUERY = '''
+    SELECT id, username, email, full_name, role, password_hash
+    FROM users
+    WHERE username = ? AND is_active = 1
+'''
+SESSION_QUERY = '''
+    SELECT s.created_at, s.last_seen_at, s.expires_at, s.data,
+           u.id, u.username, u.email, u.full_name, u.role
+    FROM sessions s
+    JOIN users u ON u.id = s.user_id
+    WHERE s.token_hash = ? AND u.is_active = 1
+'''
+DELETE_EXPIRED_SESSIONS_QUERY = 'DELETE FROM sessions WHERE expires_at <= ?'
+
+EXPENSE_CATEGORIES_QUERY = '''
+    SELECT DISTINCT category FROM expenses
+    WHERE user_id = ?
+    ORDER BY category
+'''
+
+# Per-user aggregates read the trigger-maintained rollups
+EXPENSE_TOTALS_QUERY = 'SELECT total_amount, expense_count FROM expense_totals WHERE user_id = ?'
+EXPENSE_CATEGORY_TOTALS_QUERY = '''
+    SELECT category, total_amount, expense_count
+    FROM expense_category_totals
+    WHERE user_id = ?
+    ORDER BY total_amount DESC
+'''
+EXPENSE_MONTH_TOTALS_QUERY = '''
+    SELECT month, total_amount, expense_count
+    FROM expense_month_totals
+    WHERE user_id = ?
+    ORDER BY month
+'''
+MONTHLY_TREND_QUERY = '''
+    SELECT month, total_amount, expense_count,
+           AVG(total_amount) OVER (ORDER BY month ROWS BETWEEN ? PRECEDING AND CURRENT ROW)
+    FROM expense_month_totals
+    WHERE user_id = ?
+    ORDER BY month
+'''
+WEEKLY_TREND_QUERY = '''
+    SELECT week, total_amount, expense_count,
+           AVG(total_amount) OVER (ORDER BY week ROWS BETWEEN ? PRECEDING AND CURRENT ROW)
+    FROM (
+        SELECT date(date, 'weekday 0', '-6 days') AS week,
+               SUM(amount) AS total_amount, COUNT(*) AS expense_count
+        FROM expenses
+        WHERE user_id = ?
+        GROUP BY week
+    )
+    ORDER BY week
+'''
+
+# Ranks a user's amounts in one walk of the amount index and keeps only the two
+# ranks around each percentile. Both window functions share one window so SQLite
+# doesn't re-sort, and the count comes from the same statement, so it always
+# matches the ranks. Format {wanted} with one (?) row per percentile.
+AMOUNT_PERCENTILES_QUERY = '''
+    WITH wanted(percentile) AS (VALUES {wanted}),
+    ranked AS (
+        SELECT amount, ROW_NUMBER() OVER amounts - 1 AS position, COUNT(*) OVER amounts AS total
+        FROM expenses WHERE user_id = ?
+        WINDOW amounts AS (ORDER BY amount ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+    )
+    SELECT position, amount, total FROM ranked
+    WHERE EXISTS (
+        SELECT 1 FROM wanted
+        WHERE position - CAST(percentile * (total - 1) AS INTEGER) IN (0, 1)
+    )
+'''
+
+FILES_QUERY = '''
+    SELECT id, filename, file_type, file_size, upload_date, processed, extracted_data
+    FROM files
+    WHERE user_id = ?
+    ORDER BY upload_date DESC
+'''
+FILE_BY_HASH_QUERY = '''
+    SELECT f.id, f.processed, j.state
+    FROM files f
+    LEFT JOIN jobs j ON j.id = (SELECT MAX(id) FROM jobs WHERE file_id = f.id)
+    WHERE f.user_id = ? AND f.content_hash = ?
+    ORDER BY f.id
+    LIMIT 1
+'''
+CACHED_EXTRACTION_QUERY = '''
+    SELECT raw_text, extracted_data FROM extraction_cache
+    WHERE content_hash = ? AND extractor_version = ?
+'''
+CLAIM_JOBS_QUERY = '''
+    SELECT j.id, j.user_id, j.file_id, j.attempts, f.filename, f.file_path, f.file_type,
+           f.content_hash
+    FROM jobs j
+    JOIN files f ON f.id = j.file_id
+    WHERE j.state = 'queued' AND j.run_after <= CURRENT_TIMESTAMP
+    ORDER BY j.priority DESC, j.id
+    LIMIT ?
+'''
+
+USER_TEAMS_QUERY = '''
+    SELECT t.id, t.name, t.description, tm.role, t.created_at
+    FROM teams t
+    JOIN team_members tm ON t.id = tm.team_id
+    WHERE tm.user_id = ?
+    ORDER BY t.created_at DESC
+'''
+TEAMMATE_IDS_QUERY = '''
+    SELECT ?
+    UNION
+    SELECT other.user_id
+    FROM team_members mine
+    JOIN team_members other ON other.team_id = mine.team_id
+    WHERE mine.user_id = ?
+'''
+
+# Team aggregates read the per-user rollups of every member, found through
+# the (team_id, user_id) unique index on team_members
+TEAM_MEMBER_TOTALS_QUERY = '''
+    SELECT u.id, u.username, u.full_name, tm.role,
+           COALESCE(et.total_amount, 0), COALESCE(et.expense_count, 0)
+    FROM team_members tm
+    JOIN users u ON u.id = tm.user_id
+    LEFT JOIN expense_totals et ON et.user_id = tm.user_id
+    WHERE tm.team_id = ?
+    ORDER BY 5 DESC, u.username
+'''
+TEAM_CATEGORY_TOTALS_QUERY = '''
+    SELECT ct.category, SUM(ct.total_amount), SUM(ct.expense_count)
+    FROM team_members tm
+    JOIN expense_category_totals ct ON ct.user_id = tm.user_id
+    WHERE tm.team_id = ?
+    GROUP BY ct.category
+    ORDER BY 2 DESC
+'''
+TEAM_MONTH_TOTALS_QUERY = '''
+    SELECT mt.month, SUM(mt.total_amount), SUM(mt.expense_count),
+           AVG(SUM(mt.total_amount)) OVER (ORDER BY mt.month ROWS BETWEEN ? PRECEDING AND CURRENT ROW)
+    FROM team_members tm
+    JOIN expense_month_totals mt ON mt.user_id = tm.user_id
+    WHERE tm.team_id = ?
+    GROUP BY mt.month
+    ORDER BY mt.month
+'''
+
+RECENT_UPLOADS_QUERY = UPLOAD_QUERY + 'ORDER BY f.upload_date DESC, f.id DESC LIMIT ?'
+
+# Queries on the request path, with sample parameters, that must stay index-backed.
+# They are the statements the Database methods run, so a plan checked here is the
+# plan served. Checked by Database.check_query_plans().
+HOT_QUERIES = {
+    'get_expenses': (expense_page_query(), (1, 101)),
+    'get_expenses_page': (expense_page_query(after=True), (1, '2024-01-01', '2024-01-01 00:00:00', 1, 51)),
+    'query_expenses_category': (expense_page_query(category=True), (1, 'Travel', 51)),
+    'query_expenses_search': (expense_page_query(like=True), (1, '%taxi%', '%taxi%', 51)),
+    'query_expenses_amount': (expense_page_query('amount_desc', after=True), (1, 100.0, 1, 51)),
+    'get_expense_categories': (EXPENSE_CATEGORIES_QUERY, (1,)),
+    'expense_totals': (EXPENSE_TOTALS_QUERY, (1,)),
+    'expense_category_totals': (EXPENSE_CATEGORY_TOTALS_QUERY, (1,)),
+    'expense_month_totals': (EXPENSE_MONTH_TOTALS_QUERY, (1,)),
+    'get_monthly_trend': (MONTHLY_TREND_QUERY, (2, 1)),
+    'get_weekly_trend': (WEEKLY_TREND_QUERY, (3, 1)),
+    'get_amount_percentiles': (AMOUNT_PERCENTILES_QUERY.format(wanted='(?), (?)'), (0.5, 0.9, 1)),
+    'get_files': (FILES_QUERY, (1,)),
+    'get_recent_uploads': (RECENT_UPLOADS_QUERY, (1, 20)),
+    'find_file_by_hash': (FILE_BY_HASH_QUERY, (1, 'hash')),
+    'get_cached_extraction': (CACHED_EXTRACTION_QUERY, ('hash', 'version')),
+    'claim_jobs': (CLAIM_JOBS_QUERY, (4,)),
+    'get_user_teams': (USER_TEAMS_QUERY, (1,)),
+    'get_teammate_ids': (TEAMMATE_IDS_QUERY, (1, 1)),
+    'authenticate_user': (AUTHENTICATE_USER_QUERY, ('user',)),
+    'team_member_totals': (TEAM_MEMBER_TOTALS_QUERY, (1,)),
+    'team_category_totals': (TEAM_CATEGORY_TOTALS_QUERY, (1,)),
+    'team_month_totals': (TEAM_MONTH_TOTALS_QUERY, (2, 1)),
+    'get_session': (SESSION_QUERY, ('hash',)),
+    'delete_expired_sessions': (DELETE_EXPIRED_SESSIONS_QUERY, (0.0,)),
+}
+
+class ConnectionPool:
+    """Thread-safe pool of long-lived SQLite connections.
+    
+    A thread checks out one connection and keeps it for the duration of the
+    outermost ``connection()`` block, so nested calls on the same thread share
+    it. Idle connections are kept for reuse up to ``max_idle``.
+    """
+    
+    def __init__(self, db_path: str, max_idle: int = 8, pragmas: Dict = None):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.pragmas = dict(CONNECTION_PRAGMAS if pragmas is None else pragmas)
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._closed = False
+    
+    def _open(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly by Database.transaction()
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+    
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+    
+    def _release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if not self._closed and self._idle.qsize() < self.max_idle:
+                self._idle.put(conn)
+                return
+        conn.close()
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Check out this thread's connection, reusing it for nested calls"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        
+        conn = self._acquire()
+        self._local.conn = conn
+        tracer = trace_connection(conn)
+        try:
+            yield conn
+        finally:
+            if tracer:
+                tracer.close()
+            self._local.conn = None
+            self._release(conn)
+    
+    def close(self):
+        """Close all idle connections and stop pooling new ones"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+@instrumented('db')
 class Database:
-    def __init__(self, db_path: str = "multitools.db"):
+    def __init__(self, db_path: str = "multitools.db", pool_size: int = 8,
+                 hasher: PasswordHasher = None, slow_log: SlowQueryLog = None):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, max_idle=pool_size)
+        self.hasher = hasher or PasswordHasher.from_env()
+        self.slow_log = slow_log or SlowQueryLog.from_env()
         self.init_database()
+        self.fts_enabled = self._table_exists('expenses_fts')
+        self._write_count = 0
+        self._data_versions = {}
+        self._all_data_version = 0
+        self._version_lock = threading.Lock()
     
-    def init_database(self):
-        """Initialize database tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                full_name TEXT,
-                role TEXT DEFAULT 'user',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1
-            )
-        ''')
+    def data_version(self, user_id: int) -> int:
+        """Get a counter that grows with every write to the user's data.
         
-        # Expenses table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                title TEXT NOT NULL,
-                amount REAL NOT NULL,
-                category TEXT NOT NULL,
-                description TEXT,
-                date DATE NOT NULL,
-                receipt_path TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Files table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS files (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                filename TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                file_type TEXT NOT NULL,
-                file_size INTEGER,
-                upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                processed BOOLEAN DEFAULT 0,
-                extracted_data TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
+        Only writes made through this Database instance are counted. Pass
+        None for the counter of writes that affect everyone, such as team
+        membership changes.
+        """
+        with self._version_lock:
+            return max(self._data_versions.get(user_id, 0), self._all_data_version)
+    
+    def _data_changed(self, user_id: Optional[int]):
+        """Bump a user's data version (everyone's when user_id is None)"""
+        with self._version_lock:
+            self._write_count += 1
+            if user_id is None:
+                self._all_data_version = self._write_count
+            else:
+                self._data_versions[user_id] = self._write_count
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a pooled connection (autocommit, for reads)"""
+        with self.pool.connection() as conn:
+            yield conn
+    
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a block in a single transaction, committing on success.
         
-        # Teams table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS teams (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                created_by INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (created_by) REFERENCES users (id)
-            )
-        ''')
+        Nested ``transaction()`` blocks on the same thread join the outer one.
+        """
+        with self.pool.connection() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+            
+            # Through _run, so waits for the write lock and slow commits show up in the slow-query log
+            self._run(conn, 'BEGIN IMMEDIATE', ())
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                self._run(conn, 'COMMIT', ())
+    
+    def close(self):
+        """Close pooled connections and the slow-query log file"""
+        self.pool.close()
+        if self.slow_log:
+            self.slow_log.close()
+    
+    # Statement execution. Every query goes through _run, which times it and
+    # hands statements slower than the slow-query log's threshold to the log.
+    # Without a conn, reads borrow a pooled connection and writes run in their
+    # own transaction; pass the conn of an open block to join it.
+    
+    @contextmanager
+    def _using(self, conn: Optional[sqlite3.Connection], write: bool = False) -> Iterator[sqlite3.Connection]:
+        if conn is not None:
+            yield conn
+            return
+        with (self.transaction() if write else self.connection()) as conn:
+            yield conn
+    
+    def _run(self, conn: sqlite3.Connection, sql: str, params, fetch: str = None, many: bool = False):
+        start = time.perf_counter()
+        cursor = conn.executemany(sql, params) if many else conn.execute(sql, params)
+        if fetch == 'all':
+            result = cursor.fetchall()
+        elif fetch == 'one':
+            result = cursor.fetchone()
+        else:
+            result = cursor
+        self._check_slow(conn, sql, params, time.perf_counter() - start, many)
+        return result
+    
+    def _check_slow(self, conn: sqlite3.Connection, sql: str, params, seconds: float, many: bool = False):
+        if self.slow_log and seconds >= self.slow_log.threshold:
+            self.slow_log.record(conn, sql, params, seconds, many)
+    
+    def _fetch_all(self, sql: str, params=(), conn: sqlite3.Connection = None) -> List[tuple]:
+        with self._using(conn) as conn:
+            return self._run(conn, sql, params, 'all')
+    
+    def _fetch_one(self, sql: str, params=(), conn: sqlite3.Connection = None) -> Optional[tuple]:
+        with self._using(conn) as conn:
+            return self._run(conn, sql, params, 'one')
+    
+    def _execute(self, sql: str, params=(), conn: sqlite3.Connection = None) -> sqlite3.Cursor:
+        """Run a write, returning the cursor for its rowcount and lastrowid"""
+        with self._using(conn, write=True) as conn:
+            return self._run(conn, sql, params)
+    
+    def _execute_many(self, sql: str, rows: List[tuple], conn: sqlite3.Connection = None) -> sqlite3.Cursor:
+        with self._using(conn, write=True) as conn:
+            return self._run(conn, sql, rows, many=True)
+    
+    def _iter_rows(self, sql: str, params=(), batch_size: int = 1000) -> Iterator[tuple]:
+        """Stream a query's rows batch_size at a time on one connection.
         
-        # Team members table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS team_members (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                team_id INTEGER,
-                user_id INTEGER,
-                role TEXT DEFAULT 'member',
-                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (team_id) REFERENCES teams (id),
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
+        Only time spent in SQLite counts towards the slow-query threshold,
+        not time the caller spends between batches.
+        """
+        with self.connection() as conn:
+            start = time.perf_counter()
+            cursor = conn.execute(sql, params)
+            elapsed = time.perf_counter() - start
+            while True:
+                start = time.perf_counter()
+                rows = cursor.fetchmany(batch_size)
+                elapsed += time.perf_counter() - start
+                if not rows:
+                    break
+                yield from rows
+            self._check_slow(conn, sql, params, elapsed)
+    
+    def init_database(self):
+        """Initialize database tables and apply pending migrations"""
+        if self.schema_version() >= SCHEMA_VERSION:
+            return
         
-        # Settings table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                setting_key TEXT NOT NULL,
-                setting_value TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
+        with self.transaction() as conn:
+            # Re-read under the write lock in case another process migrated first
+            current = self._fetch_one('PRAGMA user_version', conn=conn)[0]
+            for version, description, steps in MIGRATIONS:
+                if version <= current:
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        self._execute(step, conn=conn)
+                self._execute(f'PRAGMA user_version = {version}', conn=conn)
+    
+    def _table_exists(self, name: str) -> bool:
+        row = self._fetch_one("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+        return row is not None
+    
+    def schema_version(self) -> int:
+        """Get the applied schema migration version"""
+        return self._fetch_one('PRAGMA user_version')[0]
+    
+    def explain_query_plan(self, query: str, params: tuple = ()) -> List[str]:
+        """Get the EXPLAIN QUERY PLAN details for a statement"""
+        rows = self._fetch_all(f'EXPLAIN QUERY PLAN {query}', params)
+        return [row[3] for row in rows]
+    
+    def check_query_plans(self) -> Dict[str, List[str]]:
+        """Find hot queries that fall back to a full table scan.
         
-        conn.commit()
-        conn.close()
+        Returns a mapping of query name to offending plan steps; an empty
+        mapping means every query in HOT_QUERIES is served by an index.
+        """
+        problems = {}
+        for name, (query, params) in HOT_QUERIES.items():
+            scans = table_scans(self.explain_query_plan(query, params))
+            if scans:
+                problems[name] = scans
+        return problems
     
     def hash_password(self, password: str) -> str:
-        """Hash password using SHA-256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Hash password with the configured salted KDF"""
+        return self.hasher.hash(password)
     
     def create_user(self, username: str, email: str, password: str, full_name: str = None) -> int:
         """Create a new user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         password_hash = self.hash_password(password)
         
         try:
-            cursor.execute('''
+            cursor = self._execute('''
                 INSERT INTO users (username, email, password_hash, full_name)
                 VALUES (?, ?, ?, ?)
             ''', (username, email, password_hash, full_name))
-            
-            user_id = cursor.lastrowid
-            conn.commit()
-            return user_id
+            return cursor.lastrowid
         except sqlite3.IntegrityError:
             return None
-        finally:
-            conn.close()
     
     def authenticate_user(self, username: str, password: str) -> Optional[Dict]:
-        """Authenticate user login"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Authenticate user login.
         
-        password_hash = self.hash_password(password)
+        The hash is verified on the shared password pool. Hashes in an older
+        format or with other work factors are replaced after a successful login.
+        """
+        user = self._fetch_one(AUTHENTICATE_USER_QUERY, (username,))
         
-        cursor.execute('''
-            SELECT id, username, email, full_name, role
-            FROM users 
-            WHERE username = ? AND password_hash = ? AND is_active = 1
-        ''', (username, password_hash))
+        if not self.hasher.verify_in_pool(password, user[5] if user else None):
+            return None
         
-        user = cursor.fetchone()
-        conn.close()
+        if self.hasher.needs_rehash(user[5]):
+            # Only replace the hash that was verified, in case it changed meanwhile
+            self._execute('''
+                UPDATE users SET password_hash = ?
+                WHERE id = ? AND password_hash = ?
+            ''', (self.hash_password(password), user[0], user[5]))
         
-        if user:
-            return {
-                'id': user[0],
-                'username': user[1],
-                'email': user[2],
-                'full_name': user[3],
-                'role': user[4]
+        return {
+            'id': user[0],
+            'username': user[1],
+            'email': user[2],
+            'full_name': user[3],
+            'role': user[4]
+        }
+    
+    def create_session(self, token_hash: str, user_id: int, created_at: float,
+                       expires_at: float, data: str = '{}'):
+        """Store a new login session (data as JSON)"""
+        self._execute('''
+            INSERT INTO sessions (token_hash, user_id, created_at, last_seen_at, expires_at, data)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (token_hash, user_id, created_at, created_at, expires_at, data))
+    
+    def get_session(self, token_hash: str) -> Optional[Dict]:
+        """Get a session and its (active) user by token hash"""
+        row = self._fetch_one(SESSION_QUERY, (token_hash,))
+        
+        if not row:
+            return None
+        return {
+            'created_at': row[0],
+            'last_seen_at': row[1],
+            'expires_at': row[2],
+            'data': json.loads(row[3]),
+            'user': {
+                'id': row[4],
+                'username': row[5],
+                'email': row[6],
+                'full_name': row[7],
+                'role': row[8]
             }
-        return None
+        }
+    
+    def touch_session(self, token_hash: str, last_seen_at: float, expires_at: float) -> bool:
+        """Record activity on a session and extend its expiry; False if it no longer exists"""
+        cursor = self._execute('''
+            UPDATE sessions SET last_seen_at = ?, expires_at = ?
+            WHERE token_hash = ?
+        ''', (last_seen_at, expires_at, token_hash))
+        return cursor.rowcount > 0
     
-    def add_expense(self, user_id: int, title: str, amount: float, category: str, 
+    def set_session_data(self, token_hash: str, data: str) -> bool:
+        """Replace a session's data (JSON); False if the session no longer exists"""
+        cursor = self._execute('UPDATE sessions SET data = ? WHERE token_hash = ?', (data, token_hash))
+        return cursor.rowcount > 0
+    
+    def delete_session(self, token_hash: str) -> bool:
+        """Revoke a session, returning whether it existed"""
+        cursor = self._execute('DELETE FROM sessions WHERE token_hash = ?', (token_hash,))
+        return cursor.rowcount > 0
+    
+    def delete_expired_sessions(self, now: float) -> int:
+        """Drop sessions that expired before now, returning how many"""
+        cursor = self._execute(DELETE_EXPIRED_SESSIONS_QUERY, (now,))
+        return cursor.rowcount
+    
+    def add_expense(self, user_id: int, title: str, amount: float, category: str,
                    description: str = None, date: str = None, receipt_path: str = None) -> int:
         """Add a new expense"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         if not date:
             date = datetime.now().strftime('%Y-%m-%d')
         
-        cursor.execute('''
+        cursor = self._execute('''
             INSERT INTO expenses (user_id, title, amount, category, description, date, receipt_path)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', (user_id, title, amount, category, description, date, receipt_path))
         
-        expense_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        self._data_changed(user_id)
+        return cursor.lastrowid
+    
+    def get_expenses(self, user_id: int, limit: Optional[int] = 100) -> List[Dict]:
+        """Get user expenses, newest first (all of them when limit is None)"""
+        return list(islice(self.iter_expenses(user_id), limit))
+    
+    def get_expenses_page(self, user_id: int, page_size: int = 50,
+                          after: Optional[Tuple] = None) -> Tuple[List[Dict], Optional[Tuple]]:
+        """Get one page of user expenses, newest first.
+        
+        ``after`` is the cursor returned with the previous page. Returns the
+        page and the cursor for the next one (None on the last page).
+        """
+        return self.query_expenses(user_id, page_size=page_size, after=after)
+    
+    def query_expenses(self, user_id: int, category: str = None, search: str = None,
+                       sort: str = 'date_desc', after: Optional[Tuple] = None,
+                       page_size: int = 50) -> Tuple[List[Dict], Optional[Tuple]]:
+        """Filter, search, sort and page user expenses in SQL.
+        
+        ``search`` prefix-matches words in the title or description through the
+        full-text index (a case-insensitive substring match when FTS5 is
+        unavailable). ``sort`` is a key of EXPENSE_SORTS. Paging works like
+        get_expenses_page: pass the returned cursor as ``after`` to fetch the
+        next page.
+        """
+        if sort not in EXPENSE_SORTS:
+            raise ValueError(f"Unknown sort: {sort}")
+        sort_columns = EXPENSE_SORTS[sort][0]
+        
+        params = [user_id]
+        if category:
+            params.append(category)
+        
+        # Searches with no words FTS can index (e.g. "!!!") fall back to LIKE
+        match = self._fts_query(search) if search and self.fts_enabled else ''
+        if match:
+            params.append(match)
+        elif search:
+            pattern = '%' + re.sub(r'([\\%_])', r'\\\1', search) + '%'
+            params.extend([pattern, pattern])
+        
+        if after is not None:
+            params.extend(after)
+        params.append(page_size + 1)
+        
+        query = expense_page_query(sort, category=bool(category), fts=bool(match),
+                                   like=bool(search) and not match, after=after is not None)
+        rows = self._fetch_all(query, params)
         
-        return expense_id
+        expenses = [self._expense_from_row(row) for row in rows[:page_size]]
+        next_cursor = None
+        if len(rows) > page_size:
+            last = expenses[-1]
+            next_cursor = tuple(last[column] for column in sort_columns)
+        return expenses, next_cursor
     
-    def get_expenses(self, user_id: int, limit: int = 100) -> List[Dict]:
-        """Get user expenses"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def search(self, user_id: int, query: str, limit: int = 20) -> List[Dict]:
+        """Full-text search over a user's expenses and processed documents.
         
-        cursor.execute('''
-            SELECT id, title, amount, category, description, date, receipt_path, status, created_at
-            FROM expenses 
-            WHERE user_id = ?
-            ORDER BY date DESC, created_at DESC
+        Every word in ``query`` is prefix-matched. Results are ranked by bm25
+        and carry a highlighted snippet.
+        """
+        match = self._fts_query(query)
+        if not match:
+            return []
+        
+        if not self.fts_enabled:
+            expenses, _ = self.query_expenses(user_id, search=query.strip(), page_size=limit)
+            return [{
+                'type': 'expense',
+                'id': expense['id'],
+                'title': expense['title'],
+                'snippet': expense['description'] or expense['title'],
+                'score': 0.0
+            } for expense in expenses]
+        
+        rows = self._fetch_all('''
+            SELECT * FROM (
+                SELECT 'expense', e.id, e.title,
+                       snippet(expenses_fts, -1, '**', '**', '…', 12),
+                       bm25(expenses_fts)
+                FROM expenses_fts
+                JOIN expenses e ON e.id = expenses_fts.rowid
+                WHERE expenses_fts MATCH ? AND e.user_id = ?
+                UNION ALL
+                SELECT 'file', f.id, f.filename,
+                       snippet(files_fts, -1, '**', '**', '…', 12),
+                       bm25(files_fts)
+                FROM files_fts
+                JOIN files f ON f.id = files_fts.rowid
+                WHERE files_fts MATCH ? AND f.user_id = ?
+            )
+            ORDER BY 5
             LIMIT ?
-        ''', (user_id, limit))
+        ''', (match, user_id, match, user_id, limit))
         
-        expenses = []
-        for row in cursor.fetchall():
-            expenses.append({
-                'id': row[0],
-                'title': row[1],
-                'amount': row[2],
-                'category': row[3],
-                'description': row[4],
-                'date': row[5],
-                'receipt_path': row[6],
-                'status': row[7],
-                'created_at': row[8]
+        results = []
+        for row in rows:
+            results.append({
+                'type': row[0],
+                'id': row[1],
+                'title': row[2],
+                'snippet': row[3],
+                'score': -row[4]
             })
         
-        conn.close()
-        return expenses
+        return results
+    
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        """Turn free text into an FTS5 query that prefix-matches every word"""
+        return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text or ''))
+    
+    def get_expense_categories(self, user_id: int) -> List[str]:
+        """Get the distinct categories a user has expenses in"""
+        rows = self._fetch_all(EXPENSE_CATEGORIES_QUERY, (user_id,))
+        return [row[0] for row in rows]
     
-    def update_expense(self, expense_id: int, **kwargs) -> bool:
-        """Update an expense"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def iter_expenses(self, user_id: int, after: Optional[Tuple] = None,
+                      page_size: int = 200) -> Iterator[Dict]:
+        """Lazily stream user expenses, newest first, one page at a time"""
+        while True:
+            expenses, after = self.get_expenses_page(user_id, page_size, after)
+            yield from expenses
+            if after is None:
+                return
+    
+    @staticmethod
+    def _expense_from_row(row) -> ExpenseRecord:
+        return ExpenseRecord(*row)
+    
+    def bulk_add_expenses(self, expenses: Iterable[Dict], chunk_size: int = 1000,
+                          progress: Callable[[int], None] = None) -> int:
+        """Insert many expenses, one transaction per chunk.
+        
+        ``expenses`` may be any iterable (including a generator) of dicts with
+        the add_expense fields plus ``user_id``; it is consumed lazily. After
+        each committed chunk ``progress`` is called with the running total.
+        Returns the number of expenses inserted.
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        rows = (
+            (expense['user_id'], expense['title'], expense['amount'], expense['category'],
+             expense.get('description'), expense.get('date') or today, expense.get('receipt_path'))
+            for expense in expenses
+        )
+        
+        inserted = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            
+            self._execute_many('''
+                INSERT INTO expenses (user_id, title, amount, category, description, date, receipt_path)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', chunk)
+            
+            for user_id in {row[0] for row in chunk}:
+                self._data_changed(user_id)
+            inserted += len(chunk)
+            if progress:
+                progress(inserted)
+        
+        return inserted
+    
+    def get_expense(self, expense_id: int, user_id: int) -> Optional[Dict]:
+        """Get one of a user's expenses"""
+        row = self._fetch_one(f'SELECT {EXPENSE_COLUMNS} FROM expenses WHERE id = ? AND user_id = ?',
+                              (expense_id, user_id))
         
+        return self._expense_from_row(row) if row else None
+    
+    def update_expense(self, expense_id: int, user_id: int = None, **kwargs) -> bool:
+        """Update an expense (only the user's own when user_id is given)"""
         # Build dynamic update query
         set_clauses = []
         values = []
@@ -231,103 +1122,328 @@ class Database:
         values.append(expense_id)
         
         query = f"UPDATE expenses SET {', '.join(set_clauses)} WHERE id = ?"
+        if user_id is not None:
+            query += " AND user_id = ?"
+            values.append(user_id)
         
-        cursor.execute(query, values)
-        conn.commit()
-        conn.close()
+        cursor = self._execute(query, values)
         
+        if cursor.rowcount > 0:
+            self._data_changed(user_id)
         return cursor.rowcount > 0
     
     def delete_expense(self, expense_id: int, user_id: int) -> bool:
         """Delete an expense"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM expenses WHERE id = ? AND user_id = ?', (expense_id, user_id))
-        conn.commit()
-        conn.close()
+        cursor = self._execute('DELETE FROM expenses WHERE id = ? AND user_id = ?', (expense_id, user_id))
         
+        if cursor.rowcount > 0:
+            self._data_changed(user_id)
         return cursor.rowcount > 0
     
-    def add_file(self, user_id: int, filename: str, file_path: str, file_type: str, 
+    def add_file(self, user_id: int, filename: str, blob_id: str, file_type: str,
                  file_size: int, extracted_data: str = None) -> int:
-        """Add a new file"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Add a new file stored in the blob store"""
+        cursor = self._execute('''
+            INSERT INTO files (user_id, filename, file_path, file_type, file_size, extracted_data, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, filename, blob_id, file_type, file_size, extracted_data, blob_id))
         
-        cursor.execute('''
-            INSERT INTO files (user_id, filename, file_path, file_type, file_size, extracted_data)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, filename, file_path, file_type, file_size, extracted_data))
+        self._data_changed(user_id)
+        return cursor.lastrowid
+    
+    def add_files(self, files: Iterable[Dict]) -> List[int]:
+        """Add several files in one transaction, returning their ids in order.
         
-        file_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        Each dict has the add_file fields (including ``user_id``) and an
+        optional ``processed`` flag. The blob id doubles as the content hash.
+        """
+        file_ids = []
+        user_ids = set()
+        with self.transaction() as conn:
+            for file in files:
+                cursor = self._execute('''
+                    INSERT INTO files (user_id, filename, file_path, file_type, file_size, processed,
+                                       extracted_data, content_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (file['user_id'], file['filename'], file['blob_id'], file['file_type'],
+                      file.get('file_size'), bool(file.get('processed')), file.get('extracted_data'),
+                      file['blob_id']), conn)
+                file_ids.append(cursor.lastrowid)
+                user_ids.add(file['user_id'])
         
-        return file_id
+        for user_id in user_ids:
+            self._data_changed(user_id)
+        return file_ids
+    
+    def mark_file_processed(self, file_id: int, user_id: int, extracted_data: str) -> bool:
+        """Store extracted data (as JSON) on one of a user's existing files"""
+        cursor = self._execute('''
+            UPDATE files SET processed = 1, extracted_data = ?
+            WHERE id = ? AND user_id = ?
+        ''', (extracted_data, file_id, user_id))
+        
+        if cursor.rowcount:
+            self._data_changed(user_id)
+        return cursor.rowcount > 0
     
     def get_files(self, user_id: int) -> List[Dict]:
         """Get user files"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, filename, file_type, file_size, upload_date, processed, extracted_data
-            FROM files 
-            WHERE user_id = ?
-            ORDER BY upload_date DESC
-        ''', (user_id,))
-        
-        files = []
-        for row in cursor.fetchall():
-            files.append({
-                'id': row[0],
-                'filename': row[1],
-                'file_type': row[2],
-                'file_size': row[3],
-                'upload_date': row[4],
-                'processed': bool(row[5]),
-                'extracted_data': row[6]
-            })
+        rows = self._fetch_all(FILES_QUERY, (user_id,))
         
-        conn.close()
-        return files
+        return [FileRecord(*row[:5], bool(row[5]), row[6]) for row in rows]
     
-    def get_expense_stats(self, user_id: int) -> Dict:
-        """Get expense statistics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_recent_uploads(self, user_id: int, limit: int = 20) -> List[Dict]:
+        """Get a user's latest files with the state of their processing job"""
+        rows = self._fetch_all(RECENT_UPLOADS_QUERY, (user_id, limit))
         
-        # Total expenses
-        cursor.execute('SELECT SUM(amount) FROM expenses WHERE user_id = ?', (user_id,))
-        total_amount = cursor.fetchone()[0] or 0
+        return [self._upload_from_row(row) for row in rows]
+    
+    def get_upload(self, file_id: int, user_id: int) -> Optional[Dict]:
+        """Get one of a user's files with the state of its processing job"""
+        row = self._fetch_one(UPLOAD_QUERY + 'AND f.id = ?', (user_id, file_id))
         
-        # Count of expenses
-        cursor.execute('SELECT COUNT(*) FROM expenses WHERE user_id = ?', (user_id,))
-        expense_count = cursor.fetchone()[0]
+        return self._upload_from_row(row) if row else None
+    
+    @staticmethod
+    def _upload_from_row(row) -> Dict:
+        return {
+            'id': row[0],
+            'filename': row[1],
+            'file_type': row[2],
+            'file_size': row[3],
+            'upload_date': row[4],
+            'processed': bool(row[5]),
+            'extracted_data': json.loads(row[6]) if row[6] else None,
+            'job_state': row[7],
+            'attempts': row[8],
+            'error': row[9],
+            'blob_id': row[10]
+        }
+    
+    def enqueue_jobs(self, user_id: int, file_ids: Iterable[int], priority: int = 0,
+                     max_attempts: int = 3) -> List[int]:
+        """Queue files for background processing, returning the job ids"""
+        job_ids = []
+        with self.transaction() as conn:
+            for file_id in file_ids:
+                cursor = self._execute('''
+                    INSERT INTO jobs (user_id, file_id, priority, max_attempts)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, file_id, priority, max_attempts), conn)
+                job_ids.append(cursor.lastrowid)
+        
+        return job_ids
+    
+    def claim_jobs(self, worker_id: str, limit: int = 1, lease_seconds: int = 300) -> List[Dict]:
+        """Lease up to limit queued jobs to a worker, highest priority first.
+        
+        Jobs whose lease has expired (their worker died) are queued again
+        first, or failed if they have used up their attempts.
+        """
+        with self.transaction() as conn:
+            self._execute('''
+                UPDATE jobs
+                SET state = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                    finished_at = CASE WHEN attempts >= max_attempts THEN CURRENT_TIMESTAMP END,
+                    last_error = 'Lease expired', lease_owner = NULL, lease_expires_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE state = 'running' AND lease_expires_at < CURRENT_TIMESTAMP
+            ''', conn=conn)
+            
+            rows = self._fetch_all(CLAIM_JOBS_QUERY, (limit,), conn)
+            
+            self._execute_many('''
+                UPDATE jobs
+                SET state = 'running', attempts = attempts + 1, lease_owner = ?,
+                    lease_expires_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(worker_id, f'+{lease_seconds} seconds', row[0]) for row in rows], conn)
+        
+        return [{
+            'id': row[0],
+            'user_id': row[1],
+            'file_id': row[2],
+            'attempt': row[3] + 1,
+            'filename': row[4],
+            'blob_id': row[5],
+            'file_type': row[6],
+            'content_hash': row[7]
+        } for row in rows]
+    
+    def extend_job_leases(self, worker_id: str, job_ids: Iterable[int], lease_seconds: int = 300) -> int:
+        """Renew the leases a worker holds, returning how many are still held"""
+        cursor = self._execute_many('''
+            UPDATE jobs SET lease_expires_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND lease_owner = ? AND state = 'running'
+        ''', [(f'+{lease_seconds} seconds', job_id, worker_id) for job_id in job_ids])
+        return cursor.rowcount
+    
+    def release_jobs(self, worker_id: str, job_ids: Iterable[int]) -> int:
+        """Hand unfinished jobs back to the queue without using up an attempt"""
+        cursor = self._execute_many('''
+            UPDATE jobs
+            SET state = 'queued', attempts = attempts - 1, lease_owner = NULL,
+                lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND lease_owner = ? AND state = 'running'
+        ''', [(job_id, worker_id) for job_id in job_ids])
+        return cursor.rowcount
+    
+    def complete_jobs(self, worker_id: str, results: Iterable[Tuple[int, str]]) -> int:
+        """Store (job_id, extracted_data) results on their files and finish the jobs.
+        
+        Jobs whose lease the worker no longer holds are skipped.
+        """
+        completed = 0
+        user_ids = set()
+        with self.transaction() as conn:
+            for job_id, extracted_data in results:
+                cursor = self._execute('''
+                    UPDATE jobs
+                    SET state = 'done', lease_owner = NULL, lease_expires_at = NULL, last_error = NULL,
+                        finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND lease_owner = ? AND state = 'running'
+                ''', (job_id, worker_id), conn)
+                if cursor.rowcount == 0:
+                    continue
+                self._execute('''
+                    UPDATE files SET processed = 1, extracted_data = ?
+                    WHERE id = (SELECT file_id FROM jobs WHERE id = ?)
+                ''', (extracted_data, job_id), conn)
+                user_ids.add(self._fetch_one('SELECT user_id FROM jobs WHERE id = ?', (job_id,), conn)[0])
+                completed += 1
+        
+        for user_id in user_ids:
+            self._data_changed(user_id)
+        return completed
+    
+    def fail_job(self, job_id: int, worker_id: str, error: str, retry: bool = True,
+                 retry_delay: int = 30) -> Optional[str]:
+        """Record a failed attempt, returning the job's new state.
+        
+        Retries back off exponentially from retry_delay seconds until the
+        job runs out of attempts. Returns None if the lease was lost.
+        """
+        with self.transaction() as conn:
+            row = self._fetch_one('''
+                SELECT attempts, max_attempts FROM jobs
+                WHERE id = ? AND lease_owner = ? AND state = 'running'
+            ''', (job_id, worker_id), conn)
+            if not row:
+                return None
+            
+            attempts, max_attempts = row
+            if retry and attempts < max_attempts:
+                delay = retry_delay * 2 ** (attempts - 1)
+                self._execute('''
+                    UPDATE jobs
+                    SET state = 'queued', run_after = datetime('now', ?), last_error = ?,
+                        lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (f'+{delay} seconds', error, job_id), conn)
+                return 'queued'
+            
+            self._execute('''
+                UPDATE jobs
+                SET state = 'failed', last_error = ?, lease_owner = NULL, lease_expires_at = NULL,
+                    finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (error, job_id), conn)
+            return 'failed'
+    
+    def get_file_references(self) -> set:
+        """Get every stored file reference (blob ids and legacy paths) still in use"""
+        rows = self._fetch_all('''
+            SELECT file_path FROM files WHERE file_path IS NOT NULL
+            UNION
+            SELECT receipt_path FROM expenses WHERE receipt_path IS NOT NULL
+        ''')
+        return {row[0] for row in rows}
+    
+    def find_file_by_hash(self, user_id: int, content_hash: str) -> Optional[Dict]:
+        """Find a file the user already uploaded with the same content"""
+        row = self._fetch_one(FILE_BY_HASH_QUERY, (user_id, content_hash))
+        
+        if not row:
+            return None
+        return {'id': row[0], 'processed': bool(row[1]), 'job_state': row[2]}
+    
+    def get_cached_extraction(self, content_hash: str, extractor_version: str) -> Optional[Dict]:
+        """Look up a cached extraction result, marking it recently used.
+        
+        The lookup is a plain read; only a hit takes the write lock, briefly,
+        to update the LRU bookkeeping.
+        """
+        row = self._fetch_one(CACHED_EXTRACTION_QUERY, (content_hash, extractor_version))
+        if not row:
+            return None
+        
+        # A no-op if the entry was evicted since the read; the result is still good
+        self._execute('''
+            UPDATE extraction_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP
+            WHERE content_hash = ? AND extractor_version = ?
+        ''', (content_hash, extractor_version))
+        
+        return {'raw_text': row[0], 'extracted_data': row[1]}
+    
+    def put_cached_extraction(self, content_hash: str, extractor_version: str,
+                              raw_text: str, extracted_data: str):
+        """Store an extraction result (extracted_data as JSON) for later uploads"""
+        size = len(raw_text or '') + len(extracted_data or '')
+        self._execute('''
+            INSERT OR REPLACE INTO extraction_cache
+            (content_hash, extractor_version, raw_text, extracted_data, size)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (content_hash, extractor_version, raw_text, extracted_data, size))
+    
+    def evict_extraction_cache(self, max_entries: int, max_bytes: int) -> int:
+        """Drop least recently used cache entries beyond the limits, returning how many"""
+        cursor = self._execute('''
+            DELETE FROM extraction_cache WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid,
+                           ROW_NUMBER() OVER recent AS position,
+                           SUM(size) OVER recent AS running_size
+                    FROM extraction_cache
+                    WINDOW recent AS (ORDER BY last_used_at DESC, rowid DESC)
+                )
+                WHERE position > ? OR running_size > ?
+            )
+        ''', (max_entries, max_bytes))
+        return cursor.rowcount
+    
+    def purge_extraction_cache(self, keep_version: str = None) -> int:
+        """Drop cache entries from other extractor versions (all if keep_version is None)"""
+        cursor = self._execute('''
+            DELETE FROM extraction_cache WHERE ? IS NULL OR extractor_version != ?
+        ''', (keep_version, keep_version))
+        return cursor.rowcount
+    
+    def get_extraction_cache_size(self) -> Dict:
+        """Get the number of cached results and their total size"""
+        row = self._fetch_one('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extraction_cache')
+        return {'entries': row[0], 'bytes': row[1]}
+    
+    def get_expense_stats(self, user_id: int) -> Dict:
+        """Get expense statistics"""
+        with self.connection() as conn:
+            # Totals and category breakdown come from the trigger-maintained rollups
+            totals = self._fetch_one(EXPENSE_TOTALS_QUERY, (user_id,), conn)
+            total_amount, expense_count = totals or (0, 0)
+            
+            # Category breakdown
+            rows = self._fetch_all(EXPENSE_CATEGORY_TOTALS_QUERY, (user_id,), conn)
         
         # Average expense
         avg_expense = total_amount / expense_count if expense_count > 0 else 0
         
-        # Category breakdown
-        cursor.execute('''
-            SELECT category, SUM(amount), COUNT(*)
-            FROM expenses 
-            WHERE user_id = ?
-            GROUP BY category
-            ORDER BY SUM(amount) DESC
-        ''', (user_id,))
-        
         categories = []
-        for row in cursor.fetchall():
+        for row in rows:
             categories.append({
                 'category': row[0],
                 'amount': row[1],
                 'count': row[2]
             })
         
-        conn.close()
-        
         return {
             'total_amount': total_amount,
             'expense_count': expense_count,
@@ -335,62 +1451,157 @@ class Database:
             'categories': categories
         }
     
-    def create_team(self, name: str, description: str, created_by: int) -> int:
-        """Create a new team"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_monthly_totals(self, user_id: int) -> List[Dict]:
+        """Get a user's expense totals per month, oldest first"""
+        rows = self._fetch_all(EXPENSE_MONTH_TOTALS_QUERY, (user_id,))
+        
+        months = []
+        for row in rows:
+            months.append({
+                'month': row[0],
+                'amount': row[1],
+                'count': row[2]
+            })
+        
+        return months
+    
+    def get_monthly_trend(self, user_id: int, window: int = 3) -> List[Dict]:
+        """Get monthly totals with a rolling average over the last window months"""
+        rows = self._fetch_all(MONTHLY_TREND_QUERY, (window - 1, user_id))
         
-        cursor.execute('''
-            INSERT INTO teams (name, description, created_by)
-            VALUES (?, ?, ?)
-        ''', (name, description, created_by))
+        return [{
+            'month': row[0],
+            'amount': row[1],
+            'count': row[2],
+            'rolling_average': row[3]
+        } for row in rows]
+    
+    def get_weekly_trend(self, user_id: int, window: int = 4) -> List[Dict]:
+        """Get totals per week (starting Monday) with a rolling average over the last window weeks"""
+        rows = self._fetch_all(WEEKLY_TREND_QUERY, (window - 1, user_id))
         
-        team_id = cursor.lastrowid
+        return [{
+            'week': row[0],
+            'amount': row[1],
+            'count': row[2],
+            'rolling_average': row[3]
+        } for row in rows]
+    
+    def get_amount_percentiles(self, user_id: int, percentiles: Iterable[float]) -> Dict[float, float]:
+        """Get expense amount percentiles (0-1, linearly interpolated) in one pass over the amount index"""
+        percentiles = list(percentiles)
+        if not percentiles:
+            return {}
         
-        # Add creator as admin
-        cursor.execute('''
-            INSERT INTO team_members (team_id, user_id, role)
-            VALUES (?, ?, ?)
-        ''', (team_id, created_by, 'admin'))
+        wanted = ', '.join(['(?)'] * len(percentiles))
+        rows = self._fetch_all(AMOUNT_PERCENTILES_QUERY.format(wanted=wanted), (*percentiles, user_id))
         
-        conn.commit()
-        conn.close()
+        amounts = {position: amount for position, amount, _ in rows}
+        count = rows[0][2] if rows else 0
+        results = {}
+        for percentile in percentiles:
+            if count == 0:
+                results[percentile] = None
+                continue
+            position = percentile * (count - 1)
+            lower = int(position)
+            upper = amounts.get(lower + 1, amounts[lower])
+            results[percentile] = amounts[lower] + (upper - amounts[lower]) * (position - lower)
         
+        return results
+    
+    def rebuild_rollups(self, user_id: int = None):
+        """Recompute expense rollups from scratch (for one user or everyone)"""
+        with self.transaction() as conn:
+            _rebuild_rollups(conn, user_id)
+        self._data_changed(user_id)
+    
+    def check_rollups(self, user_id: int = None, repair: bool = False) -> List[Dict]:
+        """Compare rollups with a fresh aggregation of the expenses table.
+        
+        Returns one entry per mismatched rollup row; with ``repair`` the
+        rollups are rebuilt when any mismatch is found.
+        """
+        mismatches = []
+        with self.connection() as conn:
+            for table, keys in ROLLUP_KEYS.items():
+                key_columns = list(keys)
+                key_values = [expression.format(row='expenses') for expression in keys.values()]
+                where = ' AND '.join(f'({value}) IS NOT NULL' for value in key_values)
+                params = ()
+                if user_id is not None:
+                    where += ' AND expenses.user_id = ?'
+                    params = (user_id,)
+                
+                expected = {}
+                for row in self._fetch_all(f'''
+                    SELECT {', '.join(key_values)}, SUM(amount), COUNT(*)
+                    FROM expenses WHERE {where}
+                    GROUP BY {', '.join(key_values)}
+                ''', params, conn):
+                    expected[tuple(row[:-2])] = (row[-2], row[-1])
+                
+                actual = {}
+                for row in self._fetch_all(f'''
+                    SELECT {', '.join(key_columns)}, total_amount, expense_count
+                    FROM {table} {'' if user_id is None else 'WHERE user_id = ?'}
+                ''', params, conn):
+                    actual[tuple(row[:-2])] = (row[-2], row[-1])
+                
+                for key in expected.keys() | actual.keys():
+                    want = expected.get(key, (0, 0))
+                    have = actual.get(key, (0, 0))
+                    if want[1] != have[1] or abs(want[0] - have[0]) > 1e-6:
+                        mismatches.append({
+                            'table': table,
+                            'key': dict(zip(key_columns, key)),
+                            'expected': {'amount': want[0], 'count': want[1]},
+                            'actual': {'amount': have[0], 'count': have[1]}
+                        })
+        
+        if mismatches and repair:
+            self.rebuild_rollups(user_id)
+        return mismatches
+    
+    def create_team(self, name: str, description: str, created_by: int) -> int:
+        """Create a new team"""
+        with self.transaction() as conn:
+            cursor = self._execute('''
+                INSERT INTO teams (name, description, created_by)
+                VALUES (?, ?, ?)
+            ''', (name, description, created_by), conn)
+            
+            team_id = cursor.lastrowid
+            
+            # Add creator as admin
+            self._execute('''
+                INSERT INTO team_members (team_id, user_id, role)
+                VALUES (?, ?, ?)
+            ''', (team_id, created_by, 'admin'), conn)
+        
+        self._data_changed(created_by)
         return team_id
     
     def add_team_member(self, team_id: int, user_id: int, role: str = 'member') -> bool:
         """Add member to team"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
+            self._execute('''
                 INSERT INTO team_members (team_id, user_id, role)
                 VALUES (?, ?, ?)
             ''', (team_id, user_id, role))
-            
-            conn.commit()
-            return True
         except sqlite3.IntegrityError:
             return False
-        finally:
-            conn.close()
+        
+        # Every existing member now sees the new member's data
+        self._data_changed(None)
+        return True
     
     def get_user_teams(self, user_id: int) -> List[Dict]:
         """Get teams for a user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT t.id, t.name, t.description, tm.role, t.created_at
-            FROM teams t
-            JOIN team_members tm ON t.id = tm.team_id
-            WHERE tm.user_id = ?
-            ORDER BY t.created_at DESC
-        ''', (user_id,))
+        rows = self._fetch_all(USER_TEAMS_QUERY, (user_id,))
         
         teams = []
-        for row in cursor.fetchall():
+        for row in rows:
             teams.append({
                 'id': row[0],
                 'name': row[1],
@@ -399,5 +1610,109 @@ class Database:
                 'created_at': row[4]
             })
         
-        conn.close()
         return teams
+    
+    def get_teammate_ids(self, user_id: int) -> List[int]:
+        """Get the user and everyone who shares a team with them"""
+        rows = self._fetch_all(TEAMMATE_IDS_QUERY, (user_id, user_id))
+        return sorted(row[0] for row in rows)
+    
+    def get_team_member_ids(self, team_id: int) -> List[int]:
+        """Get the ids of a team's members"""
+        rows = self._fetch_all('SELECT user_id FROM team_members WHERE team_id = ? ORDER BY user_id', (team_id,))
+        return [row[0] for row in rows]
+    
+    def get_team_stats(self, team_id: int) -> Dict:
+        """Get a team's expense totals with per-member and per-category breakdowns.
+        
+        Aggregated from the members' trigger-maintained rollups, so the cost
+        grows with the number of members and categories, not expenses.
+        """
+        with self.connection() as conn:
+            member_rows = self._fetch_all(TEAM_MEMBER_TOTALS_QUERY, (team_id,), conn)
+            category_rows = self._fetch_all(TEAM_CATEGORY_TOTALS_QUERY, (team_id,), conn)
+        
+        members = []
+        for row in member_rows:
+            members.append({
+                'user_id': row[0],
+                'username': row[1],
+                'full_name': row[2],
+                'role': row[3],
+                'amount': row[4],
+                'count': row[5]
+            })
+        
+        categories = []
+        for row in category_rows:
+            categories.append({
+                'category': row[0],
+                'amount': row[1],
+                'count': row[2]
+            })
+        
+        total_amount = sum(member['amount'] for member in members)
+        expense_count = sum(member['count'] for member in members)
+        return {
+            'total_amount': total_amount,
+            'expense_count': expense_count,
+            'average_expense': total_amount / expense_count if expense_count > 0 else 0,
+            'member_count': len(members),
+            'members': members,
+            'categories': categories
+        }
+    
+    def get_team_monthly_trend(self, team_id: int, window: int = 3) -> List[Dict]:
+        """Get a team's monthly totals with a rolling average over the last window months"""
+        rows = self._fetch_all(TEAM_MONTH_TOTALS_QUERY, (window - 1, team_id))
+        
+        return [{
+            'month': row[0],
+            'amount': row[1],
+            'count': row[2],
+            'rolling_average': row[3]
+        } for row in rows]
+    
+    def iter_expenses_for_export(self, user_ids: Iterable[int], start_date: str = None,
+                                 end_date: str = None, category: str = None,
+                                 batch_size: int = 1000) -> Iterator[Dict]:
+        """Stream expenses of several users for export, batch_size rows at a time.
+        
+        Each user's rows are read through a cursor in date order off their
+        index, so memory stays bounded however many rows are exported.
+        """
+        conditions = ['e.user_id = ?']
+        filters = []
+        if start_date:
+            conditions.append('e.date >= ?')
+            filters.append(start_date)
+        if end_date:
+            conditions.append('e.date <= ?')
+            filters.append(end_date)
+        if category:
+            conditions.append('e.category = ?')
+            filters.append(category)
+        
+        query = f'''
+            SELECT e.id, e.date, e.title, e.amount, e.category, e.description,
+                   e.status, u.username, e.receipt_path, e.created_at
+            FROM expenses e
+            LEFT JOIN users u ON u.id = e.user_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY e.date, e.created_at, e.id
+        '''
+        
+        for user_id in user_ids:
+            for row in self._iter_rows(query, [user_id] + filters, batch_size):
+                yield {
+                    'id': row[0],
+                    'date': row[1],
+                    'title': row[2],
+                    'amount': row[3],
+                    'category': row[4],
+                    'description': row[5],
+                    'status': row[6],
+                    'owner': row[7],
+                    'receipt_path': row[8],
+                    'created_at': row[9]
+                }
@@ -0,0 +1,158 @@
+"""
+Export module for ExpenseWise
+Streams expenses and analytics rollups to CSV, JSONL or Parquet in bounded memory
+(the command line does; app downloads are built in memory, see export_bytes)
+
+Usage:
+    python exporter.py --user-id 1 -o expenses.csv
+    python exporter.py --user-id 1 --format parquet --from 2024-01-01 --to 2024-12-31 -o 2024.parquet
+    python exporter.py --user-id 1 --analytics --format jsonl -o analytics.jsonl
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from itertools import islice
+from typing import BinaryIO, Dict, Iterable, Iterator, List
+from database import Database
+
+EXPENSE_EXPORT_COLUMNS = ['id', 'date', 'title', 'amount', 'category', 'description',
+                          'status', 'owner', 'receipt_path', 'created_at']
+
+ANALYTICS_EXPORT_COLUMNS = ['breakdown', 'key', 'amount', 'count']
+
+EXPORT_FORMATS = {
+    'csv': {'extension': 'csv', 'mime': 'text/csv'},
+    'jsonl': {'extension': 'jsonl', 'mime': 'application/x-ndjson'},
+    'parquet': {'extension': 'parquet', 'mime': 'application/vnd.apache.parquet'},
+}
+
+# Parquet column types (pyarrow type names); unlisted columns are strings
+PARQUET_TYPES = {'id': 'int64', 'amount': 'float64', 'count': 'int64'}
+
+def write_csv(rows: Iterable[Dict], columns: List[str], stream: BinaryIO) -> int:
+    """Write rows as CSV with a header line, returning the row count"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    writer = csv.DictWriter(text, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+def write_jsonl(rows: Iterable[Dict], columns: List[str], stream: BinaryIO) -> int:
+    """Write rows as JSON Lines, returning the row count"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='\n')
+    count = 0
+    for row in rows:
+        text.write(json.dumps({column: row.get(column) for column in columns}))
+        text.write('\n')
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+def write_parquet(rows: Iterable[Dict], columns: List[str], stream: BinaryIO,
+                  chunk_size: int = 10000) -> int:
+    """Write rows as Parquet, one row group per chunk (requires pyarrow)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    
+    schema = pa.schema([(column, getattr(pa, PARQUET_TYPES.get(column, 'string'))()) for column in columns])
+    rows = iter(rows)
+    count = 0
+    with pq.ParquetWriter(stream, schema) as writer:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            columns_data = {column: [row.get(column) for row in chunk] for column in columns}
+            writer.write_table(pa.table(columns_data, schema=schema))
+            count += len(chunk)
+    return count
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+    'parquet': write_parquet,
+}
+
+def iter_expense_rows(db: Database, user_id: int, include_teams: bool = True,
+                      start_date: str = None, end_date: str = None,
+                      category: str = None) -> Iterator[Dict]:
+    """Stream the expenses a user may export (their own and, optionally, their teams')"""
+    user_ids = db.get_teammate_ids(user_id) if include_teams else [user_id]
+    return db.iter_expenses_for_export(user_ids, start_date, end_date, category)
+
+def iter_analytics_rows(db: Database, user_id: int) -> Iterator[Dict]:
+    """Stream a user's precomputed category and monthly rollups"""
+    for category in db.get_expense_stats(user_id)['categories']:
+        yield {'breakdown': 'category', 'key': category['category'],
+               'amount': category['amount'], 'count': category['count']}
+    for month in db.get_monthly_totals(user_id):
+        yield {'breakdown': 'month', 'key': month['month'],
+               'amount': month['amount'], 'count': month['count']}
+
+def export_expenses(db: Database, user_id: int, stream: BinaryIO, file_format: str = 'csv',
+                    **filters) -> int:
+    """Export expenses to a binary stream, returning the row count.
+    
+    ``filters`` are passed to iter_expense_rows (include_teams, start_date,
+    end_date, category).
+    """
+    rows = iter_expense_rows(db, user_id, **filters)
+    return WRITERS[file_format](rows, EXPENSE_EXPORT_COLUMNS, stream)
+
+def export_analytics(db: Database, user_id: int, stream: BinaryIO, file_format: str = 'csv') -> int:
+    """Export analytics rollups to a binary stream, returning the row count"""
+    return WRITERS[file_format](iter_analytics_rows(db, user_id), ANALYTICS_EXPORT_COLUMNS, stream)
+
+def export_bytes(export_function, *args, **kwargs) -> bytes:
+    """Run an export in memory and return its contents, e.g. for a download button"""
+    buffer = io.BytesIO()
+    export_function(*args, buffer, **kwargs)
+    return buffer.getvalue()
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point for server-side exports"""
+    parser = argparse.ArgumentParser(description="Export ExpenseWise expenses or analytics")
+    parser.add_argument('--user-id', type=int, required=True, help="User whose data to export")
+    parser.add_argument('--db', default='multitools.db', help="SQLite database path")
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+    parser.add_argument('-o', '--output', default='-', help="Output file ('-' for stdout)")
+    parser.add_argument('--from', dest='start_date', help="First date to include (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='end_date', help="Last date to include (YYYY-MM-DD)")
+    parser.add_argument('--category', help="Only export this category")
+    parser.add_argument('--no-teams', action='store_true', help="Skip teammates' expenses")
+    parser.add_argument('--analytics', action='store_true', help="Export rollups instead of expenses")
+    args = parser.parse_args(argv)
+    
+    db = Database(args.db)
+    stream = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    try:
+        if args.analytics:
+            count = export_analytics(db, args.user_id, stream, args.format)
+        else:
+            count = export_expenses(db, args.user_id, stream, args.format,
+                                    include_teams=not args.no_teams,
+                                    start_date=args.start_date, end_date=args.end_date,
+                                    category=args.category)
+    finally:
+        if stream is not sys.stdout.buffer:
+            stream.close()
+        else:
+            stream.flush()
+    
+    print(f"exported {count} rows", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Extraction result cache for ExpenseWise
+Maps document content hashes to stored OCR text and extracted data, so re-uploads skip processing
+"""
+
+import hashlib
+import json
+import threading
+from typing import Dict, Optional
+from database import Database
+
+# BLAKE2b digest size in bytes (hex digests are twice as long)
+HASH_DIGEST_SIZE = 32
+
+def content_hash(data: bytes) -> str:
+    """Hash document bytes for content addressing"""
+    return hashlib.blake2b(data, digest_size=HASH_DIGEST_SIZE).hexdigest()
+
+class ExtractionCache:
+    """Cache of extraction results keyed by (content hash, extractor version).
+    
+    Entries for other extractor versions are never returned, so changing the
+    AIProcessor patterns invalidates the cache; ``purge_stale()`` reclaims
+    their space. Least recently used entries are evicted past the limits.
+    """
+    
+    def __init__(self, db: Database, extractor_version: str, max_entries: int = 10000,
+                 max_bytes: int = 64 * 1024 * 1024, evict_every: int = 100):
+        self.db = db
+        self.extractor_version = extractor_version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+    
+    def get(self, digest: str) -> Optional[Dict]:
+        """Get the cached {'raw_text', 'extracted_data'} for a content hash"""
+        entry = self.db.get_cached_extraction(digest, self.extractor_version) if digest else None
+        with self._lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not entry:
+            return None
+        return {'raw_text': entry['raw_text'], 'extracted_data': json.loads(entry['extracted_data'])}
+    
+    def put(self, digest: str, raw_text: str, extracted_data: Dict):
+        """Cache a successful extraction result"""
+        if not digest:
+            return
+        self.db.put_cached_extraction(digest, self.extractor_version, raw_text, json.dumps(extracted_data))
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % self.evict_every == 0
+        if evict:
+            self.evict()
+    
+    def evict(self) -> int:
+        """Enforce the entry and size limits, returning how many entries were dropped"""
+        return self.db.evict_extraction_cache(self.max_entries, self.max_bytes)
+    
+    def purge_stale(self) -> int:
+        """Drop entries written by other extractor versions"""
+        return self.db.purge_extraction_cache(self.extractor_version)
+    
+    def stats(self) -> Dict:
+        """Get hit/miss counters for this process and the cache's size"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            **self.db.get_extraction_cache_size()
+        }
@@ -0,0 +1,294 @@
+"""
+Bulk import module for ExpenseWise
+Streams expenses from CSV/JSONL exports into the database in batched transactions
+
+Usage:
+    python importer.py --user-id 1 bank_export.csv
+    python importer.py --user-id 1 --format jsonl --db multitools.db expenses.jsonl
+"""
+
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+from datetime import datetime
+from itertools import chain, islice
+from typing import Callable, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+from database import Database
+from ai_processor import AIProcessor
+
+# Column names accepted for each expense field, checked in order (case-insensitive)
+FIELD_ALIASES = {
+    'title': ['title', 'name', 'payee', 'merchant', 'vendor', 'description'],
+    'amount': ['amount', 'total', 'value'],
+    'debit': ['debit', 'withdrawal', 'money out', 'paid out'],
+    'credit': ['credit', 'deposit', 'money in', 'paid in'],
+    'category': ['category'],
+    'description': ['description', 'memo', 'notes', 'details'],
+    'date': ['date', 'transaction date', 'posted date', 'booking date'],
+}
+
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%m/%d/%Y', '%m/%d/%y', '%d.%m.%Y', '%b %d, %Y', '%d %b %Y']
+
+# Only the first errors are kept so a bad 1M-row file can't exhaust memory
+MAX_REPORTED_ERRORS = 100
+
+# Sign of spending in a signed amount column: 'positive' for expense lists,
+# 'negative' for bank statements, or 'auto' to pick whichever sign most of the
+# first SIGN_SAMPLE_ROWS amounts have (spending outnumbers credits in both).
+# Rows of the other sign are credits (refunds, income), counted but not imported.
+AMOUNT_SIGNS = ('auto', 'positive', 'negative')
+SIGN_SAMPLE_ROWS = 1000
+
+# Key of the marker row readers yield for a line they can't parse; the importer
+# reports it as that row's error and carries on
+ROW_ERROR = '__error__'
+
+# Key readers add to every row with its line number in the file, so errors
+# point at the line the user sees (after the CSV header, past blank lines)
+ROW_LINE = '__line__'
+
+# Open import streams with errors=DECODE_ERRORS: bytes that aren't UTF-8 then
+# decode to lone surrogates, which readers report per row instead of failing
+DECODE_ERRORS = 'surrogateescape'
+UNDECODABLE = re.compile('[\udc80-\udcff]')
+
+def _undecodable(*values) -> bool:
+    return any(isinstance(value, str) and UNDECODABLE.search(value) for value in values)
+
+def read_csv_rows(stream: IO[str]) -> Iterator[Dict]:
+    """Stream rows from a CSV file with a header line"""
+    reader = csv.DictReader(stream)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            yield {ROW_ERROR: f"Invalid CSV: {exc}", ROW_LINE: reader.line_num}
+            continue
+        if _undecodable(*row.values()):
+            yield {ROW_ERROR: "Invalid UTF-8", ROW_LINE: reader.line_num}
+            continue
+        # line_num is the record's last line; quoted values can span several
+        yield {**{(key or '').strip().lower(): value for key, value in row.items()}, ROW_LINE: reader.line_num}
+
+def read_jsonl_rows(stream: IO[str]) -> Iterator[Dict]:
+    """Stream rows from a JSON Lines file (one object per line)"""
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if _undecodable(line):
+            yield {ROW_ERROR: "Invalid UTF-8", ROW_LINE: line_number}
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield {ROW_ERROR: f"Invalid JSON: {exc}", ROW_LINE: line_number}
+            continue
+        if not isinstance(row, dict):
+            yield {ROW_ERROR: "Not a JSON object", ROW_LINE: line_number}
+            continue
+        yield {**{str(key).strip().lower(): value for key, value in row.items()}, ROW_LINE: line_number}
+
+def read_rows(stream: IO[str], file_format: str) -> Iterator[Dict]:
+    """Stream rows from a text stream in the given format ('csv' or 'jsonl')"""
+    if file_format == 'csv':
+        return read_csv_rows(stream)
+    if file_format in ('jsonl', 'json'):
+        return read_jsonl_rows(stream)
+    raise ValueError(f"Unsupported import format: {file_format}")
+
+def detect_format(filename: str) -> str:
+    """Guess the import format from a file name"""
+    return 'csv' if filename.lower().endswith('.csv') else 'jsonl'
+
+def parse_amount(value) -> Optional[float]:
+    """Parse signed amounts like '12.50', '$1,200.00', '-45' or '(45.00)'"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value:
+        return None
+    text = str(value).replace('$', '').replace(',', '').strip()
+    negative = text.startswith('(') and text.endswith(')')
+    try:
+        amount = float(text.strip('()'))
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+def parse_date(value) -> Optional[str]:
+    """Normalise a date in any of DATE_FORMATS to YYYY-MM-DD"""
+    if not value:
+        return None
+    value = str(value).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+class ExpenseImporter:
+    def __init__(self, db: Database, ai_processor: AIProcessor, chunk_size: int = 1000,
+                 amount_sign: str = 'auto'):
+        if amount_sign not in AMOUNT_SIGNS:
+            raise ValueError(f"Unknown amount sign: {amount_sign}")
+        self.db = db
+        self.ai_processor = ai_processor
+        self.chunk_size = chunk_size
+        self.amount_sign = amount_sign
+    
+    def _field(self, row: Dict, field: str):
+        for alias in FIELD_ALIASES[field]:
+            value = row.get(alias)
+            if value not in (None, ''):
+                return value
+        return None
+    
+    def _amount(self, row: Dict, amount_sign: str) -> Tuple[Optional[float], bool]:
+        """Get a row's expense amount and whether the row is a credit instead"""
+        debit = parse_amount(self._field(row, 'debit'))
+        if debit:
+            return abs(debit), False
+        if parse_amount(self._field(row, 'credit')):
+            return None, True
+        
+        amount = parse_amount(self._field(row, 'amount'))
+        if not amount:
+            return amount, False
+        if (amount < 0) != (amount_sign == 'negative'):
+            return None, True
+        return abs(amount), False
+    
+    def detect_amount_sign(self, rows: List[Dict]) -> str:
+        """Pick the 'auto' amount sign from a sample of rows (a tie reads as an expense list)"""
+        balance = 0
+        for row in rows:
+            amount = parse_amount(self._field(row, 'amount'))
+            if amount:
+                balance += 1 if amount < 0 else -1
+        return 'negative' if balance > 0 else 'positive'
+    
+    def normalize(self, row: Dict, user_id: int, amount_sign: str = 'positive') -> Tuple[Optional[Dict], List[str]]:
+        """Map a raw import row to an expense, returning (expense, errors).
+        
+        Credits return (None, []): they are not expenses, but not errors either.
+        """
+        if ROW_ERROR in row:
+            return None, [row[ROW_ERROR]]
+        
+        amount, is_credit = self._amount(row, amount_sign)
+        if is_credit:
+            return None, []
+        
+        title = self._field(row, 'title')
+        description = self._field(row, 'description')
+        expense = {
+            'user_id': user_id,
+            'title': str(title).strip() if title else None,
+            'amount': amount,
+            'category': self._field(row, 'category'),
+            'description': description if description != title else None,
+            'date': parse_date(self._field(row, 'date')),
+        }
+        
+        # Imported rows are user data, not OCR output, so confidence is not in question
+        is_valid, errors = self.ai_processor.validate_expense_data({**expense, 'confidence': 1.0})
+        if not expense['title']:
+            errors.append("Missing title")
+            is_valid = False
+        if not is_valid:
+            return None, errors
+        
+        if not expense['category']:
+            expense['category'] = self.ai_processor.categorize_expense_automatically(
+                expense['title'], expense['description']
+            )
+        
+        return expense, []
+    
+    def import_rows(self, rows: Iterable[Dict], user_id: int,
+                    progress: Callable[[Dict], None] = None) -> Dict:
+        """Validate, categorise and insert rows in chunked transactions.
+        
+        Rows are consumed lazily, so arbitrarily large inputs use bounded
+        memory. ``progress`` receives the running summary after every chunk.
+        """
+        summary = {'imported': 0, 'skipped': 0, 'credits': 0, 'errors': []}
+        
+        rows = iter(rows)
+        amount_sign = self.amount_sign
+        if amount_sign == 'auto':
+            sample = list(islice(rows, SIGN_SAMPLE_ROWS))
+            amount_sign = self.detect_amount_sign(sample)
+            rows = chain(sample, rows)
+        
+        def valid_expenses():
+            for index, row in enumerate(rows, start=1):
+                expense, errors = self.normalize(row, user_id, amount_sign)
+                if expense:
+                    yield expense
+                    continue
+                if not errors:
+                    summary['credits'] += 1
+                    continue
+                summary['skipped'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    # Rows that didn't come from a file are numbered from 1
+                    summary['errors'].append({'line': row.get(ROW_LINE, index), 'errors': errors})
+        
+        def on_chunk(inserted: int):
+            summary['imported'] = inserted
+            if progress:
+                progress(summary)
+        
+        summary['imported'] = self.db.bulk_add_expenses(valid_expenses(), self.chunk_size, on_chunk)
+        return summary
+    
+    def import_stream(self, stream: IO[str], file_format: str, user_id: int,
+                      progress: Callable[[Dict], None] = None) -> Dict:
+        """Import expenses from an open text stream (opened with errors=DECODE_ERRORS)"""
+        return self.import_rows(read_rows(stream, file_format), user_id, progress)
+    
+    def import_file(self, path: str, user_id: int, file_format: str = None,
+                    progress: Callable[[Dict], None] = None) -> Dict:
+        """Import expenses from a CSV or JSONL file on disk"""
+        with open(path, newline='', encoding='utf-8-sig', errors=DECODE_ERRORS) as stream:
+            return self.import_stream(stream, file_format or detect_format(path), user_id, progress)
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point for server-side backfills"""
+    parser = argparse.ArgumentParser(description="Bulk import expenses into ExpenseWise")
+    parser.add_argument('path', help="CSV or JSONL file to import ('-' for stdin)")
+    parser.add_argument('--user-id', type=int, required=True, help="Owner of the imported expenses")
+    parser.add_argument('--db', default='multitools.db', help="SQLite database path")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Input format (default: from file name)")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Rows per transaction")
+    parser.add_argument('--amount-sign', choices=AMOUNT_SIGNS, default='auto',
+                        help="Sign of expenses in the amount column; the other sign is skipped as credits")
+    args = parser.parse_args(argv)
+    
+    importer = ExpenseImporter(Database(args.db), AIProcessor(), chunk_size=args.chunk_size,
+                               amount_sign=args.amount_sign)
+    
+    def report(summary: Dict):
+        print(f"imported {summary['imported']} rows, skipped {summary['skipped']}, "
+              f"credits {summary['credits']}", file=sys.stderr)
+    
+    if args.path == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', errors=DECODE_ERRORS, newline='')
+        summary = importer.import_stream(stream, args.format or 'csv', args.user_id, report)
+    else:
+        summary = importer.import_file(args.path, args.user_id, args.format, report)
+    
+    for error in summary['errors']:
+        print(f"line {error['line']}: {', '.join(error['errors'])}", file=sys.stderr)
+    print(json.dumps({'imported': summary['imported'], 'skipped': summary['skipped'], 'credits': summary['credits']}))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Instrumentation for ExpenseWise
+Latency histograms and call counts for Database and AIProcessor methods, SQL
+statements and page renders, exportable in the Prometheus text format
+
+Collection is off unless EXPENSEWISE_METRICS=1 or ``enable()`` is called;
+while off, an instrumented call costs one flag check.
+"""
+
+import functools
+import inspect
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Histogram bucket upper bounds in seconds (a +Inf bucket is implied)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metric family -> (Prometheus metric name, label name, help text)
+FAMILIES = {
+    'call': ('expensewise_call_duration_seconds', 'function', "Duration of instrumented method calls"),
+    'sql': ('expensewise_sql_duration_seconds', 'statement',
+            "Duration of SQL statements, until the next statement or the end of the checkout"),
+    'page': ('expensewise_page_duration_seconds', 'page', "Duration of Streamlit page reruns"),
+}
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_enabled = os.environ.get('EXPENSEWISE_METRICS', '').lower() in ('1', 'true', 'yes')
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+class Histogram:
+    """Cumulative-bucket latency histogram with a count, sum and error count"""
+    
+    __slots__ = ('counts', 'count', 'total', 'errors')
+    
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+    
+    def observe(self, seconds: float, error: bool = False):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+    
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating within its bucket, as Prometheus does"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+                if index == len(LATENCY_BUCKETS):
+                    return lower
+                return lower + (LATENCY_BUCKETS[index] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return LATENCY_BUCKETS[-1]
+
+class MetricsRegistry:
+    """Thread-safe histograms keyed by (family, label)"""
+    
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, family: str, label: str, seconds: float, error: bool = False):
+        with self._lock:
+            histogram = self._histograms.get((family, label))
+            if histogram is None:
+                histogram = self._histograms[(family, label)] = Histogram()
+            histogram.observe(seconds, error)
+    
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+    
+    def snapshot(self) -> List[Dict]:
+        """Summarise every histogram, slowest total first"""
+        with self._lock:
+            items = [(family, label, histogram.count, histogram.errors, histogram.total,
+                      histogram.quantile(0.5), histogram.quantile(0.95), histogram.quantile(0.99))
+                     for (family, label), histogram in self._histograms.items()]
+        rows = [{
+            'family': family,
+            'name': label,
+            'count': count,
+            'errors': errors,
+            'total_seconds': total,
+            'mean_seconds': total / count if count else 0.0,
+            'p50_seconds': p50,
+            'p95_seconds': p95,
+            'p99_seconds': p99
+        } for family, label, count, errors, total, p50, p95, p99 in items]
+        return sorted(rows, key=lambda row: row['total_seconds'], reverse=True)
+    
+    def render_prometheus(self) -> str:
+        """Render every histogram in the Prometheus text exposition format"""
+        with self._lock:
+            items = sorted((key, list(histogram.counts), histogram.count, histogram.total, histogram.errors)
+                           for key, histogram in self._histograms.items())
+        lines = []
+        for family, (metric, label_name, help_text) in FAMILIES.items():
+            family_items = [item for item in items if item[0][0] == family]
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for (_, label), counts, count, total, _ in family_items:
+                label_value = _escape_label(label)
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{metric}_bucket{{{label_name}="{label_value}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label_name}="{label_value}"}} {total!r}')
+                lines.append(f'{metric}_count{{{label_name}="{label_value}"}} {count}')
+        
+        errors_metric = 'expensewise_call_errors_total'
+        lines.append(f'# HELP {errors_metric} Instrumented method calls that raised')
+        lines.append(f'# TYPE {errors_metric} counter')
+        for (family, label), _, _, _, errors in items:
+            if family == 'call':
+                lines.append(f'{errors_metric}{{function="{_escape_label(label)}"}} {errors}')
+        return '\n'.join(lines) + '\n'
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+registry = MetricsRegistry()
+
+def observe(family: str, label: str, seconds: float, error: bool = False):
+    """Record one timing, if collection is enabled"""
+    if _enabled:
+        registry.observe(family, label, seconds, error)
+
+def render_prometheus() -> str:
+    return registry.render_prometheus()
+
+def write_prometheus(path: str):
+    """Write the metrics to a file atomically, e.g. for node_exporter's textfile collector"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as handle:
+            handle.write(render_prometheus())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def start_file_export(path: str, interval: float = 15.0) -> threading.Event:
+    """Rewrite the metrics file every interval seconds on a daemon thread; set the returned event to stop"""
+    stop = threading.Event()
+    
+    def export():
+        while not stop.wait(interval):
+            if _enabled:
+                write_prometheus(path)
+    
+    threading.Thread(target=export, name='metrics-export', daemon=True).start()
+    return stop
+
+@contextmanager
+def timer(family: str, label: str) -> Iterator[None]:
+    """Time a block into a histogram"""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        registry.observe(family, label, time.perf_counter() - start, error)
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Decorate a function to record its latency as call ``name``"""
+    def decorate(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            error = False
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                registry.observe('call', name, time.perf_counter() - start, error)
+        return wrapper
+    return decorate
+
+def instrumented(prefix: str) -> Callable[[type], type]:
+    """Class decorator timing every public method as ``<prefix>.<method>``.
+    
+    Generator methods and context managers are left alone: their calls
+    return before any work is done.
+    """
+    def decorate(cls: type) -> type:
+        for name, value in list(vars(cls).items()):
+            if name.startswith('_') or not inspect.isfunction(value):
+                continue
+            if inspect.isgeneratorfunction(inspect.unwrap(value)):
+                continue
+            setattr(cls, name, timed(f'{prefix}.{name}')(value))
+        return cls
+    return decorate
+
+# Literals in the expanded SQL the trace callback sees, replaced so labels
+# don't carry user data and statements group by shape
+SQL_LITERAL = re.compile(r"[xX]?'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+SQL_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+
+@functools.lru_cache(maxsize=4096)
+def normalize_sql(sql: str) -> str:
+    """Reduce a statement to its shape: literals as ?, lists of them as ?..., whitespace collapsed"""
+    shape = SQL_LITERAL.sub('?', sql)
+    shape = SQL_PLACEHOLDER_LIST.sub('?...', shape)
+    return ' '.join(shape.split())
+
+class StatementTracer:
+    """SQLite trace callback timing each statement on one connection.
+    
+    SQLite reports when a statement starts, not when it ends, so a statement
+    is timed until the next one starts or the tracer is closed; that covers
+    stepping through and fetching its rows.
+    """
+    
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.statement = None
+        self.started = 0.0
+        conn.set_trace_callback(self)
+    
+    def __call__(self, sql: str):
+        now = time.perf_counter()
+        self._finish(now)
+        self.statement = sql
+        self.started = now
+    
+    def _finish(self, now: float):
+        if self.statement is not None:
+            registry.observe('sql', normalize_sql(self.statement), now - self.started)
+            self.statement = None
+    
+    def close(self):
+        self._finish(time.perf_counter())
+        self.conn.set_trace_callback(None)
+
+def trace_connection(conn: sqlite3.Connection) -> Optional[StatementTracer]:
+    """Start timing a checked-out connection's statements (None while collection is disabled)"""
+    return StatementTracer(conn) if _enabled else None
@@ -0,0 +1,124 @@
+"""
+Memoisation for ExpenseWise
+Bounded TTL + LRU cache for per-user query results, keyed on the user's data version
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+from database import Database
+
+# Per-user Database reads that CachedDatabase memoises; all take user_id first
+MEMOIZED_QUERIES = {
+    'get_expense_stats',
+    'get_monthly_totals',
+    'get_monthly_trend',
+    'get_weekly_trend',
+    'get_amount_percentiles',
+    'get_expenses',
+    'get_expenses_page',
+    'query_expenses',
+    'get_expense_categories',
+    'get_files',
+    'get_user_teams',
+    'get_teammate_ids',
+}
+
+def _freeze(value) -> Hashable:
+    """Turn an argument into a hashable cache key part (lists become tuples, dicts sorted items)"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    hash(value)
+    return value
+
+def _copy(value):
+    """Copy the lists, tuples and dicts of a cached result, sharing everything else.
+    
+    Leaves are strings, numbers and read-only records, which callers can't modify.
+    """
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return tuple(_copy(item) for item in value)
+    return value
+
+class MemoCache:
+    """Thread-safe memo table with a time-to-live and least-recently-used eviction.
+    
+    The TTL bounds staleness for writes this process can't see (other
+    workers or the API service writing to the same database).
+    """
+    
+    def __init__(self, max_entries: int = 2048, ttl: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        """Return the cached value for key, computing and storing it on a miss"""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            # Expired entries and entries for superseded data versions age out from the front
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or next(iter(self._entries.values()))[0] <= now):
+                self._entries.popitem(last=False)
+        return value
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+class CachedDatabase:
+    """Database wrapper whose per-user reads are memoised until the user's data changes.
+    
+    Memoised reads are keyed on (user_id, data version, query, arguments),
+    so any write through the wrapped Database makes older entries
+    unreachable. Other attributes pass straight through.
+    """
+    
+    def __init__(self, db: Database, cache: MemoCache = None):
+        self.db = db
+        self.cache = cache or MemoCache()
+    
+    def __getattr__(self, name: str):
+        attribute = getattr(self.db, name)
+        if name not in MEMOIZED_QUERIES:
+            return attribute
+        
+        def memoized(user_id: int, *args, **kwargs):
+            try:
+                key = (user_id, self.db.data_version(user_id), name, _freeze(args), _freeze(kwargs))
+            except TypeError:
+                # An argument with no stable key (e.g. an unhashable object): don't cache
+                return attribute(user_id, *args, **kwargs)
+            value = self.cache.get_or_compute(key, lambda: attribute(user_id, *args, **kwargs))
+            # Hand out copies so callers can't modify the cached value
+            return _copy(value)
+        return memoized
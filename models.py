@@ -0,0 +1,91 @@
+"""
+Record types for ExpenseWise
+Compact read-only rows for expense and file result sets that behave like dicts
+"""
+
+import sys
+from collections.abc import Mapping
+from typing import Dict, Iterator
+
+def _intern(value):
+    """Share one string object between rows with the same value"""
+    return sys.intern(value) if type(value) is str else value
+
+# Records fill their slots in __init__ through object.__setattr__, past the
+# read-only guard
+_set = object.__setattr__
+
+class Record(Mapping):
+    """Read-only mapping over ``__slots__`` attributes.
+    
+    Subclasses list their columns in ``_fields``. A slotted record has no
+    per-instance dict and no per-row key table, so it takes far less memory
+    than the equivalent dict. Records support ``row['key']``,
+    ``row.get()``, ``dict(row)`` and ``{**row}``. Convert with ``to_dict()``
+    before handing rows to code that expects real dicts, such as the json
+    module, Streamlit tables or pandas.
+    """
+    
+    __slots__ = ()
+    _fields = ()
+    
+    def __getitem__(self, key: str):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+    
+    def __len__(self) -> int:
+        return len(self._fields)
+    
+    def __contains__(self, key) -> bool:
+        return key in self._fields
+    
+    def __setattr__(self, name: str, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+    
+    def __delattr__(self, name: str):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+    
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+    
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, field) for field in self._fields)
+    
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in self._fields}
+
+class ExpenseRecord(Record):
+    """One expense row; category, status and date strings are interned"""
+    
+    __slots__ = _fields = ('id', 'title', 'amount', 'category', 'description',
+                           'date', 'receipt_path', 'status', 'created_at')
+    
+    def __init__(self, id, title, amount, category, description, date, receipt_path, status, created_at):
+        _set(self, 'id', id)
+        _set(self, 'title', title)
+        _set(self, 'amount', amount)
+        _set(self, 'category', _intern(category))
+        _set(self, 'description', description)
+        _set(self, 'date', _intern(date))
+        _set(self, 'receipt_path', receipt_path)
+        _set(self, 'status', _intern(status))
+        _set(self, 'created_at', created_at)
+
+class FileRecord(Record):
+    """One uploaded file row; file type strings are interned"""
+    
+    __slots__ = _fields = ('id', 'filename', 'file_type', 'file_size', 'upload_date',
+                           'processed', 'extracted_data')
+    
+    def __init__(self, id, filename, file_type, file_size, upload_date, processed, extracted_data):
+        _set(self, 'id', id)
+        _set(self, 'filename', filename)
+        _set(self, 'file_type', _intern(file_type))
+        _set(self, 'file_size', file_size)
+        _set(self, 'upload_date', upload_date)
+        _set(self, 'processed', processed)
+        _set(self, 'extracted_data', extracted_data)
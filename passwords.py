@@ -0,0 +1,152 @@
+"""
+Password hashing for ExpenseWise
+Salted scrypt or PBKDF2 hashes in versioned strings, with work factors set per
+deployment and verification bounded by a shared thread pool
+
+Hash formats:
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+    <64 hex digits>  (legacy unsalted SHA-256, verified and then rehashed)
+
+Environment:
+    EXPENSEWISE_PASSWORD_SCHEME      scrypt (default) or pbkdf2_sha256
+    EXPENSEWISE_SCRYPT_N             CPU/memory cost, a power of two (default 16384)
+    EXPENSEWISE_SCRYPT_R             block size (default 8)
+    EXPENSEWISE_SCRYPT_P             parallelism (default 1)
+    EXPENSEWISE_PBKDF2_ITERATIONS    iterations (default 600000)
+    EXPENSEWISE_PASSWORD_WORKERS     concurrent verifications (default: CPU count)
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+SCRYPT = 'scrypt'
+PBKDF2 = 'pbkdf2_sha256'
+SCHEMES = (SCRYPT, PBKDF2)
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+DEFAULT_SCRYPT_N = 2 ** 14
+DEFAULT_SCRYPT_R = 8
+DEFAULT_SCRYPT_P = 1
+DEFAULT_PBKDF2_ITERATIONS = 600000
+
+LEGACY_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip('=')
+
+def _decode(text: str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # Allow the memory scrypt needs for these parameters (OpenSSL caps it at 32 MiB by default)
+    maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=KEY_BYTES)
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, dklen=KEY_BYTES)
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get the process-wide pool password verifications run on.
+    
+    The KDFs release the GIL, so verifications use other cores while the
+    pool size caps how many run at once: a burst of logins queues here
+    instead of starving every other session's reruns of CPU.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = int(os.environ.get('EXPENSEWISE_PASSWORD_WORKERS', 0)) or os.cpu_count() or 1
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        return _executor
+
+class PasswordHasher:
+    """Hashes new passwords with one scheme and work factor, and verifies any supported format.
+    
+    Hashes written with another scheme, weaker parameters or the legacy
+    SHA-256 format report ``needs_rehash()`` so they can be upgraded at the
+    next successful login.
+    """
+    
+    def __init__(self, scheme: str = SCRYPT, scrypt_n: int = DEFAULT_SCRYPT_N,
+                 scrypt_r: int = DEFAULT_SCRYPT_R, scrypt_p: int = DEFAULT_SCRYPT_P,
+                 pbkdf2_iterations: int = DEFAULT_PBKDF2_ITERATIONS):
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown password scheme: {scheme}")
+        if scrypt_n < 2 or scrypt_n & (scrypt_n - 1):
+            raise ValueError("scrypt n must be a power of two")
+        self.scheme = scheme
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        self.pbkdf2_iterations = pbkdf2_iterations
+        # Verified against when a user doesn't exist, so a miss takes as long as a wrong password
+        self._dummy_hash = self.hash(secrets.token_urlsafe(16))
+    
+    @classmethod
+    def from_env(cls, environ: Dict[str, str] = None) -> 'PasswordHasher':
+        """Build a hasher from the EXPENSEWISE_* settings"""
+        environ = os.environ if environ is None else environ
+        return cls(
+            scheme=environ.get('EXPENSEWISE_PASSWORD_SCHEME', SCRYPT),
+            scrypt_n=int(environ.get('EXPENSEWISE_SCRYPT_N', DEFAULT_SCRYPT_N)),
+            scrypt_r=int(environ.get('EXPENSEWISE_SCRYPT_R', DEFAULT_SCRYPT_R)),
+            scrypt_p=int(environ.get('EXPENSEWISE_SCRYPT_P', DEFAULT_SCRYPT_P)),
+            pbkdf2_iterations=int(environ.get('EXPENSEWISE_PBKDF2_ITERATIONS', DEFAULT_PBKDF2_ITERATIONS)),
+        )
+    
+    def hash(self, password: str) -> str:
+        """Hash a password with a fresh salt"""
+        salt = secrets.token_bytes(SALT_BYTES)
+        if self.scheme == SCRYPT:
+            key = _scrypt(password, salt, self.scrypt_n, self.scrypt_r, self.scrypt_p)
+            return f'{SCRYPT}${self.scrypt_n}${self.scrypt_r}${self.scrypt_p}${_encode(salt)}${_encode(key)}'
+        key = _pbkdf2(password, salt, self.pbkdf2_iterations)
+        return f'{PBKDF2}${self.pbkdf2_iterations}${_encode(salt)}${_encode(key)}'
+    
+    def verify(self, password: str, stored: Optional[str]) -> bool:
+        """Check a password against a stored hash of any supported format.
+        
+        A missing or malformed hash costs the same as a wrong password and fails.
+        """
+        if stored and LEGACY_PATTERN.fullmatch(stored):
+            return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        
+        parts = (stored or '').split('$')
+        try:
+            if parts[0] == SCRYPT and len(parts) == 6:
+                n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+                expected = _decode(parts[5])
+                key = _scrypt(password, _decode(parts[4]), n, r, p)
+            elif parts[0] == PBKDF2 and len(parts) == 4:
+                expected = _decode(parts[3])
+                key = _pbkdf2(password, _decode(parts[2]), int(parts[1]))
+            else:
+                raise ValueError(f"Unrecognised password hash: {parts[0]!r}")
+        except ValueError:
+            self.verify(password, self._dummy_hash)
+            return False
+        return hmac.compare_digest(key, expected)
+    
+    def verify_in_pool(self, password: str, stored: Optional[str]) -> bool:
+        """Verify on the shared password pool, waiting for the result"""
+        return get_executor().submit(self.verify, password, stored).result()
+    
+    def needs_rehash(self, stored: str) -> bool:
+        """Check whether a stored hash differs from what ``hash()`` would write now"""
+        parts = stored.split('$')
+        if self.scheme == SCRYPT:
+            return parts[:4] != [SCRYPT, str(self.scrypt_n), str(self.scrypt_r), str(self.scrypt_p)]
+        return parts[:2] != [PBKDF2, str(self.pbkdf2_iterations)]
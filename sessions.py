@@ -0,0 +1,187 @@
+"""
+Session store for ExpenseWise
+Server-side login sessions in SQLite behind a bounded in-memory LRU, shared by
+every browser tab and app process that uses the same database
+"""
+
+import hashlib
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from database import Database
+
+SESSION_TIMEOUT = 24 * 60 * 60  # 24 hours in seconds
+
+class SessionStore:
+    """Login sessions keyed by the SHA-256 hash of their token.
+    
+    Validation is a dict lookup for recently used sessions and a primary-key
+    read otherwise. At most ``max_cached`` sessions are held in memory and
+    each session's data is capped at ``max_data_bytes`` of JSON, so idle
+    sessions cost nothing beyond their database row. Expiry slides with
+    activity; the database is updated at most once per ``touch_interval``,
+    which also bounds how long a session revoked by another process stays
+    valid here.
+    """
+    
+    def __init__(self, db: Database, timeout: int = SESSION_TIMEOUT, max_cached: int = 1000,
+                 max_data_bytes: int = 16 * 1024, touch_interval: int = 60,
+                 sweep_interval: int = 300, clock: Callable[[], float] = time.time):
+        self.db = db
+        self.timeout = timeout
+        self.max_cached = max_cached
+        self.max_data_bytes = max_data_bytes
+        self.touch_interval = touch_interval
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    def _encode(self, data: Dict) -> str:
+        encoded = json.dumps(data, separators=(',', ':'))
+        if len(encoded) > self.max_data_bytes:
+            raise ValueError(f"Session data exceeds {self.max_data_bytes} bytes")
+        return encoded
+    
+    def _remember(self, key: str, session: Dict):
+        with self._lock:
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_cached:
+                self._sessions.popitem(last=False)
+    
+    def _forget(self, key: str):
+        with self._lock:
+            self._sessions.pop(key, None)
+    
+    def create(self, user: Dict, data: Dict = None) -> str:
+        """Start a session for a user, returning its token"""
+        token = secrets.token_urlsafe(32)
+        key = self._key(token)
+        now = self.clock()
+        encoded = self._encode(data or {})
+        self.db.create_session(key, user['id'], now, now + self.timeout, encoded)
+        self._remember(key, {
+            'user': dict(user),
+            'created_at': now,
+            'last_seen_at': now,
+            'expires_at': now + self.timeout,
+            'data': json.loads(encoded)
+        })
+        return token
+    
+    def validate(self, token: Optional[str]) -> Optional[Dict]:
+        """Get the live session for a token, or None if it is unknown, revoked or expired.
+        
+        The returned dict has the session's 'user', 'data' and timestamps;
+        change data through ``update_data()``.
+        """
+        if not token:
+            return None
+        key = self._key(token)
+        now = self.clock()
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        
+        if session is None:
+            session = self.db.get_session(key)
+            if session is None:
+                return None
+        
+        if session['expires_at'] <= now:
+            self._forget(key)
+            self.db.delete_session(key)
+            return None
+        
+        if now - session['last_seen_at'] >= self.touch_interval:
+            if not self.db.touch_session(key, now, now + self.timeout):
+                # Revoked elsewhere (logout in another process, or swept)
+                self._forget(key)
+                return None
+            # Pick up data written by other processes since the last touch
+            session = self.db.get_session(key)
+            if session is None:
+                self._forget(key)
+                return None
+        
+        self._remember(key, session)
+        return session
+    
+    def update_data(self, token: str, **values) -> bool:
+        """Merge JSON-serialisable values into a session's data; False if the session is gone.
+        
+        Raises ValueError when the data would exceed ``max_data_bytes``.
+        """
+        session = self.validate(token)
+        if session is None:
+            return False
+        data = {**session['data'], **values}
+        encoded = self._encode(data)
+        key = self._key(token)
+        if not self.db.set_session_data(key, encoded):
+            self._forget(key)
+            return False
+        self._remember(key, {**session, 'data': data})
+        return True
+    
+    def revoke(self, token: Optional[str]) -> bool:
+        """End a session, returning whether it existed"""
+        if not token:
+            return False
+        key = self._key(token)
+        self._forget(key)
+        return self.db.delete_session(key)
+    
+    def sweep(self) -> int:
+        """Drop expired sessions from memory and the database, returning how many rows went"""
+        now = self.clock()
+        with self._lock:
+            expired = [key for key, session in self._sessions.items() if session['expires_at'] <= now]
+            for key in expired:
+                del self._sessions[key]
+        return self.db.delete_expired_sessions(now)
+    
+    def _sweep_forever(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except sqlite3.Error:
+                # e.g. the database is busy; try again next interval
+                continue
+    
+    def start_sweeper(self):
+        """Sweep expired sessions every ``sweep_interval`` seconds on a background thread"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sweep_forever, name='session-sweeper', daemon=True)
+            self._thread.start()
+    
+    def shutdown(self, wait: bool = True):
+        """Stop the sweeper thread"""
+        self._stop.set()
+        if wait and self._thread:
+            self._thread.join()
+    
+    def stats(self) -> Dict:
+        """Get cache counters for this process"""
+        with self._lock:
+            return {'cached': len(self._sessions), 'hits': self.hits, 'misses': self.misses}
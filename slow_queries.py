@@ -0,0 +1,201 @@
+"""
+Slow-query log for ExpenseWise
+Statements slower than a threshold are recorded with their parameter shape,
+duration and EXPLAIN QUERY PLAN in a ring buffer and, optionally, a rotating
+JSON lines file. Parameter values are never recorded.
+
+Usage:
+    python slow_queries.py slow_queries.log [--top 10] [--sort total|max|count] [--plans]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+from instrumentation import normalize_sql
+
+DEFAULT_THRESHOLD_MS = 100
+DEFAULT_CAPACITY = 200
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+
+# Plans are cached per statement text; SQLite plans don't depend on the bound values
+PLAN_CACHE_SIZE = 256
+
+SORT_KEYS = ('total', 'max', 'count')
+
+def parameter_shape(params, many: bool = False) -> str:
+    """Describe bound parameters by type only, e.g. ``(int, str, None)`` or ``500 x (int, str)``"""
+    if many:
+        rows = list(params)
+        return f"{len(rows)} x {parameter_shape(rows[0]) if rows else '()'}"
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{name}: {_type_name(value)}' for name, value in params.items()) + '}'
+    return '(' + ', '.join(_type_name(value) for value in params) + ')'
+
+def _type_name(value) -> str:
+    return 'None' if value is None else type(value).__name__
+
+def is_table_scan(detail: str) -> bool:
+    """Whether an EXPLAIN QUERY PLAN step reads a whole table (not an index or a subquery's rows)"""
+    if not detail.startswith('SCAN') or 'INDEX' in detail:
+        return False
+    return not detail.startswith('SCAN (') and not detail.endswith(('CONSTANT ROW', 'CONSTANT ROWS'))
+
+def table_scans(plan: List[str]) -> List[str]:
+    """The steps of a plan that read a whole table, leaving out scans of its CTEs"""
+    ctes = {detail.split(' ', 1)[1] for detail in plan if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+    return [detail for detail in plan if is_table_scan(detail) and detail.split(' ')[1] not in ctes]
+
+class SlowQueryLog:
+    """Ring buffer (and optional rotating file) of statements slower than ``threshold`` seconds"""
+    
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD_MS / 1000, capacity: int = DEFAULT_CAPACITY,
+                 path: str = None, max_bytes: int = DEFAULT_MAX_BYTES, backup_count: int = DEFAULT_BACKUP_COUNT):
+        self.threshold = threshold
+        self.path = path
+        self._entries = deque(maxlen=capacity)
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        self._handler = None
+        if path:
+            # logging.handlers pulls in socket and pickle; only load it when a file is configured
+            from logging.handlers import RotatingFileHandler
+            self._handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                encoding='utf-8', delay=True)
+    
+    @classmethod
+    def from_env(cls, environ: Dict[str, str] = None) -> Optional['SlowQueryLog']:
+        """Build a log from the EXPENSEWISE_SLOW_QUERY_* settings (None unless a threshold is set)"""
+        environ = os.environ if environ is None else environ
+        threshold_ms = environ.get('EXPENSEWISE_SLOW_QUERY_MS')
+        if not threshold_ms:
+            return None
+        return cls(
+            threshold=float(threshold_ms) / 1000,
+            capacity=int(environ.get('EXPENSEWISE_SLOW_QUERY_CAPACITY', DEFAULT_CAPACITY)),
+            path=environ.get('EXPENSEWISE_SLOW_QUERY_FILE') or None,
+            max_bytes=int(environ.get('EXPENSEWISE_SLOW_QUERY_MAX_BYTES', DEFAULT_MAX_BYTES)),
+            backup_count=int(environ.get('EXPENSEWISE_SLOW_QUERY_BACKUPS', DEFAULT_BACKUP_COUNT)),
+        )
+    
+    def record(self, conn: sqlite3.Connection, sql: str, params, seconds: float, many: bool = False):
+        """Record a slow statement, capturing its plan on the connection it ran on"""
+        if many:
+            params = list(params)
+        entry = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'seconds': seconds,
+            'sql': ' '.join(sql.split()),
+            'params': parameter_shape(params, many),
+            'plan': self._plan(conn, sql, params[0] if many and params else params)
+        }
+        with self._lock:
+            self._entries.append(entry)
+        if self._handler:
+            self._handler.handle(logging.makeLogRecord({'msg': json.dumps(entry)}))
+    
+    def _plan(self, conn: sqlite3.Connection, sql: str, params) -> List[str]:
+        with self._lock:
+            if sql in self._plans:
+                self._plans.move_to_end(sql)
+                return self._plans[sql]
+        try:
+            plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        except sqlite3.Error:
+            # Statements such as BEGIN or PRAGMA have no query plan
+            plan = []
+        with self._lock:
+            self._plans[sql] = plan
+            if len(self._plans) > PLAN_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        return plan
+    
+    def entries(self) -> List[Dict]:
+        """Get the buffered entries, oldest first"""
+        with self._lock:
+            return list(self._entries)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def close(self):
+        """Close the log file (it is reopened if more statements are recorded)"""
+        if self._handler:
+            self._handler.close()
+
+def read_log(path: str) -> Iterator[Dict]:
+    """Read entries from a log file and its rotated backups, oldest file first"""
+    backups = []
+    index = 1
+    while os.path.exists(f'{path}.{index}'):
+        backups.append(f'{path}.{index}')
+        index += 1
+    files = list(reversed(backups)) + ([path] if os.path.exists(path) else [])
+    for file_path in files:
+        with open(file_path, encoding='utf-8') as handle:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+def summarize(entries: Iterable[Dict], sort: str = 'total') -> List[Dict]:
+    """Group entries by statement shape, worst first by total time, max time or count"""
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort: {sort}")
+    groups = {}
+    for entry in entries:
+        shape = normalize_sql(entry['sql'])
+        group = groups.get(shape)
+        if group is None:
+            group = groups[shape] = {'sql': shape, 'count': 0, 'total': 0.0, 'max': 0.0,
+                                     'params': set(), 'plan': [], 'last_seen': None}
+        group['count'] += 1
+        group['total'] += entry['seconds']
+        group['params'].add(entry['params'])
+        if entry['seconds'] >= group['max']:
+            group['max'] = entry['seconds']
+            group['plan'] = entry['plan']
+        group['last_seen'] = max(group['last_seen'] or entry['time'], entry['time'])
+    
+    summary = []
+    for group in groups.values():
+        group['mean'] = group['total'] / group['count']
+        group['params'] = sorted(group['params'])
+        group['full_scan'] = bool(table_scans(group['plan']))
+        summary.append(group)
+    return sorted(summary, key=lambda group: group[sort], reverse=True)
+
+def main(argv: List[str] = None) -> int:
+    """Print the worst statements in a slow-query log"""
+    parser = argparse.ArgumentParser(description="Summarise an ExpenseWise slow-query log")
+    parser.add_argument('path', help="Slow-query log file (rotated backups are read too)")
+    parser.add_argument('--top', type=int, default=10, help="Number of statements to show")
+    parser.add_argument('--sort', choices=SORT_KEYS, default='total', help="Rank by total time, max time or count")
+    parser.add_argument('--plans', action='store_true', help="Show parameter shapes and the slowest run's plan")
+    args = parser.parse_args(argv)
+    
+    summary = summarize(read_log(args.path), args.sort)
+    if not summary:
+        print("No slow queries recorded.")
+        return 0
+    
+    print(f"{'#':>3} {'count':>7} {'total ms':>10} {'max ms':>9} {'mean ms':>9}  scan  statement")
+    for rank, group in enumerate(summary[:args.top], 1):
+        sql = group['sql'] if len(group['sql']) <= 100 else group['sql'][:97] + '...'
+        print(f"{rank:>3} {group['count']:>7} {group['total'] * 1000:>10.1f} {group['max'] * 1000:>9.1f} "
+              f"{group['mean'] * 1000:>9.1f}  {'FULL' if group['full_scan'] else '    '}  {sql}")
+        if args.plans:
+            print(f"      params: {'; '.join(group['params'])}")
+            for step in group['plan']:
+                print(f"      plan:   {step}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,24 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import random
-import json
+import html
 import io
-import base64
 import os
-import tempfile
+import time
+import importlib.util
+import instrumentation
 from database import Database
 from auth import AuthManager
+from sessions import SessionStore
 from ai_processor import AIProcessor
+from batch_processor import BatchProcessor, INTERACTIVE_PRIORITY, enqueue_uploads
+from blob_store import BlobStore, is_blob_id
+from analytics import ExpenseAnalytics, MONTHLY_WINDOW, WEEKLY_WINDOW
+from memo import CachedDatabase, MemoCache
+from importer import DECODE_ERRORS, ExpenseImporter, detect_format
+from exporter import EXPORT_FORMATS, export_analytics, export_bytes, export_expenses
+
+# Start of this rerun, for the page timing recorded at the end of the script
+rerun_started = time.perf_counter()
 
 # Page configuration
 st.set_page_config(
@@ -238,30 +245,118 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize managers
-db = Database()
-auth = AuthManager()
-ai_processor = AIProcessor()
+# Shared managers: created once per server process rather than on every rerun.
+# The schema is initialised when the Database resource is first built.
+@st.cache_resource
+def get_database() -> Database:
+    return Database()
 
-# Initialize session state
-if 'expenses' not in st.session_state:
-    st.session_state.expenses = []
+@st.cache_resource
+def get_session_store() -> SessionStore:
+    store = SessionStore(get_database())
+    store.start_sweeper()
+    return store
+
+@st.cache_resource
+def get_auth_manager() -> AuthManager:
+    return AuthManager(get_database(), get_session_store())
+
+@st.cache_resource
+def get_ai_processor() -> AIProcessor:
+    return AIProcessor()
+
+@st.cache_resource
+def get_blob_store() -> BlobStore:
+    return BlobStore()
+
+@st.cache_resource
+def get_memo_cache() -> MemoCache:
+    return MemoCache()
+
+@st.cache_resource
+def get_analytics() -> ExpenseAnalytics:
+    return ExpenseAnalytics(get_database(), get_memo_cache())
+
+@st.cache_resource
+def get_batch_processor() -> BatchProcessor:
+    # Embedded worker; more can be started with `python batch_processor.py`
+    processor = BatchProcessor(get_database(), get_blob_store())
+    processor.start()
+    return processor
+
+@st.cache_resource
+def get_metrics_export():
+    # Optional Prometheus textfile export, e.g. EXPENSEWISE_METRICS_FILE=/var/lib/node_exporter/expensewise.prom
+    path = os.environ.get('EXPENSEWISE_METRICS_FILE')
+    return instrumentation.start_file_export(path) if path else None
+
+def reset_resources():
+    """Drop the shared managers so the next rerun rebuilds them"""
+    get_batch_processor().shutdown(wait=False)
+    get_batch_processor.clear()
+    get_session_store().shutdown(wait=False)
+    get_session_store.clear()
+    get_database().close()
+    get_database.clear()
+    get_auth_manager.clear()
+    get_ai_processor.clear()
+    get_blob_store.clear()
+    get_analytics.clear()
+    get_memo_cache.clear()
+
+# Initialize managers. Per-user reads go through the memo cache, so reruns
+# without writes are answered from memory.
+db = CachedDatabase(get_database(), get_memo_cache())
+auth = get_auth_manager()
+ai_processor = get_ai_processor()
+blob_store = get_blob_store()
+analytics = get_analytics()
+get_batch_processor()
+get_metrics_export()
+
+# Expense Management loads expenses one keyset page at a time
+EXPENSE_PAGE_SIZE = 25
+
+# Analytics shows only the latest expenses in its detailed table
+ANALYTICS_TABLE_ROWS = 500
+
+# Most expenses one browser session keeps loaded, bounding per-session memory
+MAX_LOADED_EXPENSES = 500
+
+EXPENSE_SORT_OPTIONS = {
+    "Date (Newest)": "date_desc",
+    "Date (Oldest)": "date_asc",
+    "Amount (High to Low)": "amount_desc",
+    "Amount (Low to High)": "amount_asc",
+}
+
+def reset_expense_pages():
+    """Forget loaded expense pages so the list reloads from the newest expense"""
+    st.session_state.pop('expense_pages', None)
 
-if 'uploaded_files' not in st.session_state:
-    st.session_state.uploaded_files = []
+def html_text(value) -> str:
+    """Escape a user-supplied value for markup rendered with unsafe_allow_html (None renders empty)"""
+    return '' if value is None else html.escape(str(value))
 
+# Initialize session state
 if 'show_register' not in st.session_state:
     st.session_state.show_register = False
 
-# Initialize session state for navigation
-if 'current_page' not in st.session_state:
-    st.session_state.current_page = "🏠 Home"
-
 # Check authentication
 if not auth.is_logged_in():
     auth.show_auth_page()
     st.stop()
 
+def navigate(target: str):
+    """Switch page; new tabs of this session open on the last page visited"""
+    st.session_state.current_page = target
+    auth.set_session_value('current_page', target)
+    st.rerun()
+
+# Initialize session state for navigation
+if 'current_page' not in st.session_state:
+    st.session_state.current_page = auth.get_session_value('current_page', "🏠 Home")
+
 # Sidebar navigation
 st.sidebar.markdown("""
 <div style="text-align: center; padding: 1rem;">
@@ -274,8 +369,8 @@ st.sidebar.markdown("""
 user = auth.get_current_user()
 st.sidebar.markdown(f"""
 <div style="background: rgba(255,255,255,0.1); padding: 1rem; border-radius: 10px; margin: 1rem 0;">
-    <p style="color: white; margin: 0; font-weight: bold;">👤 {user['full_name'] or user['username']}</p>
-    <p style="color: #e0e0e0; margin: 0; font-size: 0.9rem;">{user['email']}</p>
+    <p style="color: white; margin: 0; font-weight: bold;">👤 {html_text(user['full_name'] or user['username'])}</p>
+    <p style="color: #e0e0e0; margin: 0; font-size: 0.9rem;">{html_text(user['email'])}</p>
 </div>
 """, unsafe_allow_html=True)
 
@@ -284,28 +379,23 @@ st.sidebar.markdown("### 🧭 Navigation")
 
 # Home button
 if st.sidebar.button("🏠 Home", use_container_width=True, type="primary" if st.session_state.current_page == "🏠 Home" else "secondary"):
-    st.session_state.current_page = "🏠 Home"
-    st.rerun()
+    navigate("🏠 Home")
 
 # Expense Management button
 if st.sidebar.button("💰 Expense Management", use_container_width=True, type="primary" if st.session_state.current_page == "💰 Expense Management" else "secondary"):
-    st.session_state.current_page = "💰 Expense Management"
-    st.rerun()
+    navigate("💰 Expense Management")
 
 # File Upload button
 if st.sidebar.button("📁 File Upload", use_container_width=True, type="primary" if st.session_state.current_page == "📁 File Upload" else "secondary"):
-    st.session_state.current_page = "📁 File Upload"
-    st.rerun()
+    navigate("📁 File Upload")
 
 # Analytics button
 if st.sidebar.button("📊 Analytics", use_container_width=True, type="primary" if st.session_state.current_page == "📊 Analytics" else "secondary"):
-    st.session_state.current_page = "📊 Analytics"
-    st.rerun()
+    navigate("📊 Analytics")
 
 # Settings button
 if st.sidebar.button("⚙️ Settings", use_container_width=True, type="primary" if st.session_state.current_page == "⚙️ Settings" else "secondary"):
-    st.session_state.current_page = "⚙️ Settings"
-    st.rerun()
+    navigate("⚙️ Settings")
 
 # Logout button
 if st.sidebar.button("🚪 Logout", use_container_width=True):
@@ -317,8 +407,6 @@ page = st.session_state.current_page
 
 # Load user data
 user_id = user['id']
-expenses = db.get_expenses(user_id)
-st.session_state.expenses = expenses
 
 # Home Page
 if page == "🏠 Home":
@@ -330,13 +418,17 @@ if page == "🏠 Home":
     """, unsafe_allow_html=True)
     
     # Quick stats
+    stats = db.get_expense_stats(user_id)
+    current_month = datetime.now().strftime('%Y-%m')
+    this_month_count = next((month['count'] for month in db.get_monthly_totals(user_id)
+                             if month['month'] == current_month), 0)
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         st.markdown(f"""
         <div class="metric-card">
             <h3>💰</h3>
-            <h2>${sum(exp['amount'] for exp in st.session_state.expenses)}</h2>
+            <h2>${stats['total_amount']}</h2>
             <p>Total Expenses</p>
         </div>
         """, unsafe_allow_html=True)
@@ -345,7 +437,7 @@ if page == "🏠 Home":
         st.markdown(f"""
         <div class="metric-card">
             <h3>📊</h3>
-            <h2>{len(st.session_state.expenses)}</h2>
+            <h2>{this_month_count}</h2>
             <p>This Month</p>
         </div>
         """, unsafe_allow_html=True)
@@ -354,14 +446,14 @@ if page == "🏠 Home":
         st.markdown(f"""
         <div class="metric-card">
             <h3>🏷️</h3>
-            <h2>{len(set(exp['category'] for exp in st.session_state.expenses))}</h2>
+            <h2>{len(stats['categories'])}</h2>
             <p>Categories</p>
         </div>
         """, unsafe_allow_html=True)
     
     with col4:
-        if st.session_state.expenses:
-            avg_expense = sum(exp['amount'] for exp in st.session_state.expenses) // len(st.session_state.expenses)
+        if stats['expense_count']:
+            avg_expense = stats['total_amount'] // stats['expense_count']
         else:
             avg_expense = 0
         st.markdown(f"""
@@ -374,20 +466,20 @@ if page == "🏠 Home":
     
     # Recent expenses preview
     st.markdown("### 🎯 Recent Expenses")
-    recent_expenses = st.session_state.expenses[:3]
+    recent_expenses, _ = db.get_expenses_page(user_id, page_size=3)
     
     for expense in recent_expenses:
         st.markdown(f"""
         <div class="expense-card">
             <div style="display: flex; justify-content: space-between; align-items: center;">
                 <div>
-                    <h4 style="margin: 0;">{expense['title']}</h4>
-                    <p style="margin: 0; opacity: 0.8;">{expense['description']}</p>
-                    <span style="background: rgba(255,255,255,0.2); padding: 0.2rem 0.5rem; border-radius: 5px; font-size: 0.8rem;">{expense['category']}</span>
+                    <h4 style="margin: 0;">{html_text(expense['title'])}</h4>
+                    <p style="margin: 0; opacity: 0.8;">{html_text(expense['description'])}</p>
+                    <span style="background: rgba(255,255,255,0.2); padding: 0.2rem 0.5rem; border-radius: 5px; font-size: 0.8rem;">{html_text(expense['category'])}</span>
                 </div>
                 <div style="text-align: right;">
                     <h3 style="margin: 0;">${expense['amount']}</h3>
-                    <p style="margin: 0; opacity: 0.8; font-size: 0.9rem;">{expense['date']}</p>
+                    <p style="margin: 0; opacity: 0.8; font-size: 0.9rem;">{html_text(expense['date'])}</p>
                 </div>
             </div>
         </div>
@@ -399,18 +491,15 @@ if page == "🏠 Home":
     
     with col1:
         if st.button("➕ Add New Expense", key="quick_add"):
-            st.session_state.current_page = "💰 Expense Management"
-            st.rerun()
+            navigate("💰 Expense Management")
     
     with col2:
         if st.button("📁 Upload Files", key="quick_upload"):
-            st.session_state.current_page = "📁 File Upload"
-            st.rerun()
+            navigate("📁 File Upload")
     
     with col3:
         if st.button("📊 View Analytics", key="quick_analytics"):
-            st.session_state.current_page = "📊 Analytics"
-            st.rerun()
+            navigate("📊 Analytics")
 
 # Expense Management Page
 elif page == "💰 Expense Management":
@@ -444,11 +533,41 @@ elif page == "💰 Expense Management":
                 )
                 
                 if expense_id:
+                    reset_expense_pages()
                     st.success("✅ Expense added successfully!")
                     st.rerun()
                 else:
                     st.error("❌ Failed to add expense. Please try again.")
     
+    # Bulk import from bank/card exports
+    with st.expander("📥 Import Expenses", expanded=False):
+        import_file = st.file_uploader(
+            "Upload a CSV or JSONL export",
+            type=['csv', 'jsonl', 'json'],
+            help="Columns: date, title/description, amount, optional category. Missing categories are filled in automatically."
+        )
+        
+        if import_file and st.button("📥 Import", type="primary"):
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+            
+            def show_import_progress(summary):
+                # The upload is read lazily, so the byte offset tracks progress
+                progress_bar.progress(min(import_file.tell() / max(import_file.size, 1), 1.0))
+                status_text.text(f"Imported {summary['imported']} expenses, skipped {summary['skipped']}...")
+            
+            stream = io.TextIOWrapper(import_file, encoding='utf-8-sig', errors=DECODE_ERRORS, newline='')
+            importer = ExpenseImporter(db, ai_processor)
+            summary = importer.import_stream(stream, detect_format(import_file.name), user_id, show_import_progress)
+            progress_bar.progress(1.0)
+            reset_expense_pages()
+            
+            st.success(f"✅ Imported {summary['imported']} expenses ({summary['skipped']} skipped)")
+            if summary['credits']:
+                st.info(f"{summary['credits']} credits (refunds, income) were not imported as expenses")
+            for error in summary['errors'][:10]:
+                st.warning(f"Line {error['line']}: {', '.join(error['errors'])}")
+    
     # Expenses list
     st.markdown("### 📋 All Expenses")
     
@@ -456,31 +575,33 @@ elif page == "💰 Expense Management":
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        category_filter = st.selectbox("Filter by Category", ["All"] + list(set(exp['category'] for exp in st.session_state.expenses)))
+        category_filter = st.selectbox("Filter by Category", ["All"] + db.get_expense_categories(user_id))
     
     with col2:
-        sort_by = st.selectbox("Sort by", ["Date (Newest)", "Date (Oldest)", "Amount (High to Low)", "Amount (Low to High)"])
+        sort_by = st.selectbox("Sort by", list(EXPENSE_SORT_OPTIONS))
     
     with col3:
-        search_term = st.text_input("Search expenses", placeholder="Search by title or description...")
-    
-    # Filter and sort expenses
-    filtered_expenses = st.session_state.expenses.copy()
+        search_term = st.text_input("Search expenses", placeholder="Search expenses and receipts...")
     
-    if category_filter != "All":
-        filtered_expenses = [exp for exp in filtered_expenses if exp['category'] == category_filter]
-    
-    if search_term:
-        filtered_expenses = [exp for exp in filtered_expenses if search_term.lower() in exp['title'].lower() or search_term.lower() in exp['description'].lower()]
+    # Filtering, searching and sorting happen in SQL; pages are reloaded when the filters change
+    expense_query = {
+        'category': None if category_filter == "All" else category_filter,
+        'search': search_term.strip() or None,
+        'sort': EXPENSE_SORT_OPTIONS[sort_by],
+    }
+    filters = tuple(expense_query.values())
+    if st.session_state.get('expense_pages', {}).get('filters') != filters:
+        page_expenses, next_cursor = db.query_expenses(user_id, page_size=EXPENSE_PAGE_SIZE, **expense_query)
+        st.session_state.expense_pages = {'filters': filters, 'expenses': page_expenses, 'cursor': next_cursor}
+    filtered_expenses = st.session_state.expense_pages['expenses']
     
-    if sort_by == "Date (Newest)":
-        filtered_expenses.sort(key=lambda x: x['date'], reverse=True)
-    elif sort_by == "Date (Oldest)":
-        filtered_expenses.sort(key=lambda x: x['date'])
-    elif sort_by == "Amount (High to Low)":
-        filtered_expenses.sort(key=lambda x: x['amount'], reverse=True)
-    elif sort_by == "Amount (Low to High)":
-        filtered_expenses.sort(key=lambda x: x['amount'])
+    # Documents whose extracted text matches the search
+    if search_term.strip():
+        matching_files = [result for result in db.search(user_id, search_term) if result['type'] == 'file']
+        if matching_files:
+            st.markdown("#### 📄 Matching Documents")
+            for result in matching_files:
+                st.markdown(f"📄 **{result['title']}** — {result['snippet']}")
     
     # Display expenses
     for expense in filtered_expenses:
@@ -490,9 +611,9 @@ elif page == "💰 Expense Management":
             with col1:
                 st.markdown(f"""
                 <div style="background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%); padding: 1rem; border-radius: 10px; color: white; margin: 0.5rem 0;">
-                    <h4 style="margin: 0;">{expense['title']}</h4>
-                    <p style="margin: 0; opacity: 0.8;">{expense['description']}</p>
-                    <span style="background: rgba(255,255,255,0.2); padding: 0.2rem 0.5rem; border-radius: 5px; font-size: 0.8rem;">{expense['category']}</span>
+                    <h4 style="margin: 0;">{html_text(expense['title'])}</h4>
+                    <p style="margin: 0; opacity: 0.8;">{html_text(expense['description'])}</p>
+                    <span style="background: rgba(255,255,255,0.2); padding: 0.2rem 0.5rem; border-radius: 5px; font-size: 0.8rem;">{html_text(expense['category'])}</span>
                 </div>
                 """, unsafe_allow_html=True)
             
@@ -501,8 +622,24 @@ elif page == "💰 Expense Management":
             
             with col3:
                 if st.button("🗑️", key=f"delete_{expense['id']}", help="Delete expense"):
-                    st.session_state.expenses = [exp for exp in st.session_state.expenses if exp['id'] != expense['id']]
+                    db.delete_expense(expense['id'], user_id)
+                    reset_expense_pages()
                     st.rerun()
+    
+    # Load the next page by seeking past the last loaded expense (no OFFSET scan)
+    if len(filtered_expenses) >= MAX_LOADED_EXPENSES:
+        st.caption(f"Showing the first {MAX_LOADED_EXPENSES} expenses. Narrow the filters or search to see others.")
+    elif st.session_state.expense_pages['cursor'] is not None:
+        if st.button("⬇️ Load more", key="load_more_expenses"):
+            page_expenses, next_cursor = db.query_expenses(
+                user_id,
+                after=st.session_state.expense_pages['cursor'],
+                page_size=EXPENSE_PAGE_SIZE,
+                **expense_query
+            )
+            st.session_state.expense_pages['expenses'].extend(page_expenses)
+            st.session_state.expense_pages['cursor'] = next_cursor
+            st.rerun()
 
 # File Upload Page
 elif page == "📁 File Upload":
@@ -537,64 +674,11 @@ elif page == "📁 File Upload":
             
             with col3:
                 if st.button("🔍 Process", key=f"process_{i}"):
-                    # Save file temporarily
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.name)[1]) as tmp_file:
-                        tmp_file.write(file.getvalue())
-                        tmp_path = tmp_file.name
-                    
-                    # Process with AI
-                    with st.spinner(f"Processing {file.name}..."):
-                        result = ai_processor.process_document(tmp_path, file.type)
-                    
-                    if result['success']:
-                        # Save to database
-                        file_id = db.add_file(
-                            user_id=user_id,
-                            filename=file.name,
-                            file_path=tmp_path,
-                            file_type=file.type,
-                            file_size=file.size,
-                            extracted_data=json.dumps(result['extracted_data'])
-                        )
-                        
-                        st.session_state.uploaded_files.append({
-                            "id": file_id,
-                            "name": file.name,
-                            "size": file.size,
-                            "type": file.type,
-                            "processed": True,
-                            "extracted_data": result['extracted_data']
-                        })
-                        
-                        # Show extracted data
-                        if result['extracted_data']['amount']:
-                            st.success(f"✅ {file.name} processed successfully!")
-                            st.json(result['extracted_data'])
-                            
-                            # Offer to create expense from extracted data
-                            if st.button(f"💰 Create Expense from {file.name}", key=f"create_expense_{i}"):
-                                extracted = result['extracted_data']
-                                expense_id = db.add_expense(
-                                    user_id=user_id,
-                                    title=extracted.get('vendor', 'Document Expense'),
-                                    amount=extracted.get('amount', 0),
-                                    category=extracted.get('category', 'Other'),
-                                    description=extracted.get('description', ''),
-                                    date=extracted.get('date', datetime.now().strftime('%Y-%m-%d'))
-                                )
-                                if expense_id:
-                                    st.success("✅ Expense created from document!")
-                                    st.rerun()
-                        else:
-                            st.warning(f"⚠️ {file.name} processed but no expense data found")
-                    else:
-                        st.error(f"❌ Failed to process {file.name}: {result.get('error', 'Unknown error')}")
-                    
-                    # Clean up temp file
-                    try:
-                        os.unlink(tmp_path)
-                    except:
-                        pass
+                    # Queued ahead of bulk uploads; a background worker does the processing
+                    enqueue_uploads(db, blob_store, user_id, [
+                        {'name': file.name, 'type': file.type, 'stream': file}
+                    ], priority=INTERACTIVE_PRIORITY, cache=get_batch_processor().cache)
+                    st.rerun()
             
             with col4:
                 if st.button("🗑️", key=f"remove_{i}"):
@@ -614,83 +698,209 @@ elif page == "📁 File Upload":
             data_export = st.checkbox("📊 Export Data", value=False, help="Export processed data to CSV")
         
         if st.button("🚀 Process All Files", type="primary"):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            for i in range(len(uploaded_files)):
-                progress_bar.progress((i + 1) / len(uploaded_files))
-                status_text.text(f"Processing {uploaded_files[i].name}...")
-                # Simulate processing time
-                import time
-                time.sleep(0.5)
-            
-            st.markdown("""
-            <div class="success-message">
-                <h3>🎉 Processing Complete!</h3>
-                <p>All files have been successfully processed and analyzed.</p>
-            </div>
-            """, unsafe_allow_html=True)
+            enqueue_uploads(db, blob_store, user_id, [
+                {'name': file.name, 'type': file.type, 'stream': file}
+                for file in uploaded_files
+            ], cache=get_batch_processor().cache)
+            st.rerun()
     
-    # Recent uploads
-    if st.session_state.uploaded_files:
+    # Recent uploads and their processing jobs, which run in the background
+    recent_uploads = db.get_recent_uploads(user_id)
+    if recent_uploads:
         st.markdown("### 📂 Recent Uploads")
         
-        for file_info in st.session_state.uploaded_files:
-            status_icon = "✅" if file_info.get("processed", False) else "⏳"
-            st.write(f"{status_icon} {file_info['name']} - {file_info['size'] / 1024:.1f} KB")
+        pending = [upload for upload in recent_uploads if upload['job_state'] in ('queued', 'running')]
+        if pending:
+            st.progress(1 - len(pending) / len(recent_uploads))
+            st.text(f"Processing {len(pending)} of {len(recent_uploads)} recent files...")
+        
+        status_icons = {'queued': "⏳", 'running': "🔄", 'done': "✅", 'failed': "❌"}
+        for upload in recent_uploads:
+            status_icon = status_icons.get(upload['job_state'], "✅" if upload['processed'] else "⏳")
+            col1, col2 = st.columns([4, 1])
+            
+            with col1:
+                st.write(f"{status_icon} {upload['filename']} - {(upload['file_size'] or 0) / 1024:.1f} KB")
+                if upload['job_state'] == 'failed':
+                    st.caption(f"Failed: {upload['error'] or 'Unknown error'}")
+                if (upload['file_type'] or '').startswith('image/') and is_blob_id(upload['blob_id']):
+                    with st.expander("👁️ Preview"):
+                        st.image(blob_store.preview(upload['blob_id']))
+            
+            with col2:
+                extracted = upload['extracted_data']
+                if extracted and extracted.get('amount'):
+                    # Offer to create expense from extracted data
+                    if st.button("💰 Create Expense", key=f"create_expense_{upload['id']}"):
+                        expense_id = db.add_expense(
+                            user_id=user_id,
+                            title=extracted.get('vendor') or 'Document Expense',
+                            amount=extracted.get('amount', 0),
+                            category=extracted.get('category', 'Other'),
+                            description=extracted.get('description', ''),
+                            date=extracted.get('date') or datetime.now().strftime('%Y-%m-%d'),
+                            receipt_path=upload['blob_id'] if is_blob_id(upload['blob_id']) else None
+                        )
+                        if expense_id:
+                            reset_expense_pages()
+                            st.success("✅ Expense created from document!")
+                            st.rerun()
+        
+        # Poll until the queued files are processed
+        if pending:
+            time.sleep(1)
+            st.rerun()
 
 # Analytics Page
 elif page == "📊 Analytics":
+    # Plotly is only needed here; importing it lazily keeps it off the login and other pages' startup
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
     st.markdown("### 📊 Analytics Dashboard")
     
-    if not st.session_state.expenses:
+    # Aggregates come from SQL and are cached until this user's expenses change
+    summary = analytics.summary(user_id)
+    
+    if not summary['expense_count']:
         st.warning("No expense data available. Add some expenses to see analytics.")
     else:
-        # Convert to DataFrame for easier analysis
-        df = pd.DataFrame(st.session_state.expenses)
-        df['date'] = pd.to_datetime(df['date'])
-        df['amount'] = pd.to_numeric(df['amount'])
+        percentiles = analytics.percentiles(user_id)
         
         # Summary metrics
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            st.metric("Total Expenses", f"${df['amount'].sum():,.2f}")
+            st.metric("Total Expenses", f"${summary['total_amount']:,.2f}")
+        
+        with col2:
+            st.metric("Average Expense", f"${summary['average_expense']:.2f}")
+        
+        with col3:
+            st.metric("Highest Expense", f"${percentiles[1.0]:.2f}")
+        
+        with col4:
+            st.metric("Number of Expenses", summary['expense_count'])
+        
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("Median Expense", f"${percentiles[0.5]:.2f}")
         
         with col2:
-            st.metric("Average Expense", f"${df['amount'].mean():.2f}")
+            st.metric("90th Percentile", f"${percentiles[0.9]:.2f}")
         
         with col3:
-            st.metric("Highest Expense", f"${df['amount'].max():.2f}")
+            st.metric("99th Percentile", f"${percentiles[0.99]:.2f}")
         
         with col4:
-            st.metric("Number of Expenses", len(df))
+            st.metric("Lowest Expense", f"${percentiles[0.0]:.2f}")
         
         # Charts
         col1, col2 = st.columns(2)
         
         with col1:
             st.markdown("#### 💰 Expenses by Category")
-            category_data = df.groupby('category')['amount'].sum().reset_index()
-            fig = px.pie(category_data, values='amount', names='category', 
+            categories = analytics.category_breakdown(user_id)
+            fig = px.pie(values=[category['amount'] for category in categories],
+                        names=[category['category'] for category in categories],
                         color_discrete_sequence=px.colors.qualitative.Set3)
             fig.update_traces(textposition='inside', textinfo='percent+label')
             st.plotly_chart(fig, use_container_width=True)
         
         with col2:
             st.markdown("#### 📈 Monthly Trend")
-            df['month'] = df['date'].dt.to_period('M')
-            monthly_data = df.groupby('month')['amount'].sum().reset_index()
-            monthly_data['month'] = monthly_data['month'].astype(str)
-            
-            fig = px.bar(monthly_data, x='month', y='amount',
-                        color='amount', color_continuous_scale='Viridis')
+            months = analytics.monthly_trend(user_id)
+            fig = go.Figure()
+            fig.add_trace(go.Bar(x=[month['month'] for month in months],
+                                 y=[month['amount'] for month in months], name="Total"))
+            fig.add_trace(go.Scatter(x=[month['month'] for month in months],
+                                     y=[month['rolling_average'] for month in months],
+                                     name=f"{MONTHLY_WINDOW}-month average", mode='lines+markers'))
             fig.update_layout(xaxis_title="Month", yaxis_title="Amount ($)")
             st.plotly_chart(fig, use_container_width=True)
         
+        st.markdown("#### 📅 Weekly Trend")
+        weeks = analytics.weekly_trend(user_id)
+        fig = go.Figure()
+        fig.add_trace(go.Bar(x=[week['week'] for week in weeks],
+                             y=[week['amount'] for week in weeks], name="Total"))
+        fig.add_trace(go.Scatter(x=[week['week'] for week in weeks],
+                                 y=[week['rolling_average'] for week in weeks],
+                                 name=f"{WEEKLY_WINDOW}-week average", mode='lines'))
+        fig.update_layout(xaxis_title="Week starting", yaxis_title="Amount ($)")
+        st.plotly_chart(fig, use_container_width=True)
+        
         # Detailed table
         st.markdown("#### 📋 Detailed Expense Report")
-        st.dataframe(df, use_container_width=True)
+        st.dataframe([expense.to_dict() for expense in db.get_expenses(user_id, limit=ANALYTICS_TABLE_ROWS)],
+                     use_container_width=True)
+        if summary['expense_count'] > ANALYTICS_TABLE_ROWS:
+            st.caption(f"Showing the latest {ANALYTICS_TABLE_ROWS} of {summary['expense_count']} expenses. "
+                       "Use Settings → Export for the full report.")
+    
+    # Team dashboard, aggregated from the members' rollups
+    teams = db.get_user_teams(user_id)
+    if teams:
+        st.markdown("---")
+        st.markdown("### 👥 Team Dashboard")
+        team = st.selectbox("Team", teams, format_func=lambda team: team['name'], key="analytics_team")
+        team_summary = analytics.team_summary(team['id'])
+        
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("Team Total", f"${team_summary['total_amount']:,.2f}")
+        
+        with col2:
+            st.metric("Average Expense", f"${team_summary['average_expense']:.2f}")
+        
+        with col3:
+            st.metric("Number of Expenses", team_summary['expense_count'])
+        
+        with col4:
+            st.metric("Members", team_summary['member_count'])
+        
+        if team_summary['expense_count']:
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.markdown("#### 🧑‍🤝‍🧑 Spending by Member")
+                members = team_summary['members']
+                fig = px.bar(x=[member['full_name'] or member['username'] for member in members],
+                             y=[member['amount'] for member in members],
+                             labels={'x': "Member", 'y': "Amount ($)"})
+                st.plotly_chart(fig, use_container_width=True)
+            
+            with col2:
+                st.markdown("#### 💰 Team Expenses by Category")
+                team_categories = team_summary['categories']
+                fig = px.pie(values=[category['amount'] for category in team_categories],
+                            names=[category['category'] for category in team_categories],
+                            color_discrete_sequence=px.colors.qualitative.Set3)
+                fig.update_traces(textposition='inside', textinfo='percent+label')
+                st.plotly_chart(fig, use_container_width=True)
+            
+            st.markdown("#### 📈 Team Monthly Trend")
+            team_months = analytics.team_monthly_trend(team['id'])
+            fig = go.Figure()
+            fig.add_trace(go.Bar(x=[month['month'] for month in team_months],
+                                 y=[month['amount'] for month in team_months], name="Total"))
+            fig.add_trace(go.Scatter(x=[month['month'] for month in team_months],
+                                     y=[month['rolling_average'] for month in team_months],
+                                     name=f"{MONTHLY_WINDOW}-month average", mode='lines+markers'))
+            fig.update_layout(xaxis_title="Month", yaxis_title="Amount ($)")
+            st.plotly_chart(fig, use_container_width=True)
+            
+            st.dataframe([{
+                'Member': member['full_name'] or member['username'],
+                'Role': member['role'],
+                'Expenses': member['count'],
+                'Total ($)': round(member['amount'], 2),
+                'Share': f"{member['share']:.1%}"
+            } for member in members], use_container_width=True)
+        else:
+            st.info("No team expenses yet.")
 
 # Settings Page
 elif page == "⚙️ Settings":
@@ -705,22 +915,105 @@ elif page == "⚙️ Settings":
     data_retention = st.slider("Data retention (days)", 30, 365, 90)
     
     st.markdown("#### 📊 Export Data")
-    col1, col2 = st.columns(2)
+    
+    # Parquet is offered only when pyarrow is installed
+    export_formats = [name for name in EXPORT_FORMATS if name != 'parquet' or importlib.util.find_spec('pyarrow')]
+    col1, col2, col3 = st.columns(3)
     
     with col1:
+        export_format = st.selectbox("Format", export_formats, format_func=str.upper)
+        export_category = st.selectbox("Category", ["All"] + db.get_expense_categories(user_id), key="export_category")
+    
+    with col2:
+        export_range = st.date_input("Date range", value=(), help="Leave empty to export everything")
+        include_teams = st.checkbox("Include team members' expenses", value=True)
+    
+    export_info = EXPORT_FORMATS[export_format]
+    export_stamp = datetime.now().strftime('%Y%m%d')
+    
+    with col3:
         if st.button("📥 Export Expenses"):
-            df = pd.DataFrame(st.session_state.expenses)
-            csv = df.to_csv(index=False)
+            start_date, end_date = (export_range + (None, None))[:2] if export_range else (None, None)
+            # The download button keeps the whole file in memory, so it is built as bytes
+            export_file = export_bytes(
+                export_expenses, db, user_id,
+                file_format=export_format,
+                include_teams=include_teams,
+                start_date=start_date.isoformat() if start_date else None,
+                end_date=end_date.isoformat() if end_date else None,
+                category=None if export_category == "All" else export_category
+            )
             st.download_button(
-                label="Download CSV",
-                data=csv,
-                file_name=f"expenses_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
+                label=f"Download {export_format.upper()}",
+                data=export_file,
+                file_name=f"expenses_{export_stamp}.{export_info['extension']}",
+                mime=export_info['mime']
             )
-    
-    with col2:
+        
         if st.button("📊 Export Analytics"):
-            st.info("Analytics export feature coming soon!")
+            export_file = export_bytes(export_analytics, db, user_id, file_format=export_format)
+            st.download_button(
+                label=f"Download {export_format.upper()}",
+                data=export_file,
+                file_name=f"analytics_{export_stamp}.{export_info['extension']}",
+                mime=export_info['mime']
+            )
+    
+    # Performance panel, for admins only
+    if user['role'] == 'admin':
+        st.markdown("#### 📈 Performance")
+        metrics_enabled = st.toggle("Collect timing metrics", value=instrumentation.is_enabled(),
+                                    help="Applies to the whole server process")
+        if metrics_enabled != instrumentation.is_enabled():
+            if metrics_enabled:
+                instrumentation.enable()
+            else:
+                instrumentation.disable()
+        
+        metric_rows = instrumentation.registry.snapshot()
+        for family, title in (('page', "Page reruns"), ('call', "Database and AI calls"), ('sql', "SQL statements")):
+            family_rows = [row for row in metric_rows if row['family'] == family]
+            if family_rows:
+                st.markdown(f"**{title}**")
+                st.dataframe([{
+                    'Name': row['name'],
+                    'Calls': row['count'],
+                    'Errors': row['errors'],
+                    'Total (ms)': round(row['total_seconds'] * 1000, 1),
+                    'Mean (ms)': round(row['mean_seconds'] * 1000, 2),
+                    'p50 (ms)': round(row['p50_seconds'] * 1000, 2),
+                    'p95 (ms)': round(row['p95_seconds'] * 1000, 2),
+                    'p99 (ms)': round(row['p99_seconds'] * 1000, 2)
+                } for row in family_rows], use_container_width=True)
+        if not metric_rows:
+            st.info("No metrics recorded yet." if metrics_enabled else "Metric collection is off.")
+        
+        # Enabled with EXPENSEWISE_SLOW_QUERY_MS
+        slow_log = get_database().slow_log
+        if slow_log:
+            st.markdown(f"**Slow queries** (over {slow_log.threshold * 1000:g} ms, newest first)")
+            slow_entries = slow_log.entries()
+            if slow_entries:
+                st.dataframe([{
+                    'Time': entry['time'],
+                    'Duration (ms)': round(entry['seconds'] * 1000, 1),
+                    'Statement': entry['sql'],
+                    'Parameters': entry['params'],
+                    'Plan': ' | '.join(entry['plan'])
+                } for entry in reversed(slow_entries)], use_container_width=True)
+            else:
+                st.caption("No slow queries recorded.")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("📥 Download Prometheus metrics", instrumentation.render_prometheus(),
+                               file_name="expensewise.prom", mime="text/plain")
+        with col2:
+            if st.button("🧹 Reset metrics"):
+                instrumentation.registry.reset()
+                if slow_log:
+                    slow_log.clear()
+                st.rerun()
     
     if st.button("💾 Save Settings", type="primary"):
         st.success("Settings saved successfully!")
@@ -732,3 +1025,6 @@ st.markdown("""
     <p>💰 ExpenseWise - Built with Streamlit | Smart Expense Management</p>
 </div>
 """, unsafe_allow_html=True)
+
+# Time this rerun (reruns cut short by st.rerun or st.stop aren't recorded)
+instrumentation.observe('page', page, time.perf_counter() - rerun_started)
@@ -0,0 +1,48 @@
+"""Re-uploading a document through the API reuses the user's existing file row"""
+
+import io
+import pytest
+
+testclient = pytest.importorskip('fastapi.testclient')
+
+import api
+from ai_processor import AIProcessor
+from batch_processor import enqueue_uploads
+from blob_store import BlobStore
+from database import Database
+from extraction_cache import ExtractionCache
+
+DOCUMENT = b'%PDF-1.4 receipt that failed to process'
+
+@pytest.fixture
+def failed_upload(tmp_path, monkeypatch):
+    """A user whose only upload's processing job has failed for good"""
+    db_path = str(tmp_path / 'expensewise.db')
+    blob_root = str(tmp_path / 'blobs')
+    monkeypatch.setenv('EXPENSEWISE_DB', db_path)
+    monkeypatch.setenv('EXPENSEWISE_BLOBS', blob_root)
+    
+    db = Database(db_path)
+    user_id = db.create_user('alice', 'alice@example.com', 'password')
+    [file_id] = enqueue_uploads(db, BlobStore(blob_root), user_id,
+                                [{'name': 'receipt.pdf', 'type': 'application/pdf', 'stream': io.BytesIO(DOCUMENT)}])
+    [job] = db.claim_jobs('test-worker')
+    db.fail_job(job['id'], 'test-worker', 'OCR failed', retry=False)
+    # The retry is served from the extraction cache, so no worker process is needed
+    blob_id = db.get_upload(file_id, user_id)['blob_id']
+    ExtractionCache(db, AIProcessor().extractor_version).put(blob_id, 'TOTAL 12.50', {'amount': 12.5})
+    yield db, user_id, file_id
+    db.close()
+
+def test_retrying_a_failed_upload_updates_its_row(failed_upload):
+    db, user_id, file_id = failed_upload
+    with testclient.TestClient(api.app) as client:
+        for _ in range(2):
+            response = client.post('/documents/process', auth=('alice', 'password'),
+                                   files={'file': ('receipt.pdf', DOCUMENT, 'application/pdf')})
+            assert response.status_code == 200
+            assert response.json()['file_id'] == file_id
+    
+    files = db.get_files(user_id)
+    assert len(files) == 1
+    assert files[0]['processed']
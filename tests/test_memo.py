@@ -0,0 +1,37 @@
+"""CachedDatabase keys on any argument shape and never shares cached containers"""
+
+import pytest
+from database import Database
+from memo import CachedDatabase
+
+@pytest.fixture
+def cached(tmp_path):
+    db = Database(str(tmp_path / 'expensewise.db'))
+    user_id = db.create_user('alice', 'alice@example.com', 'password')
+    db.add_expense(user_id, 'Lunch', 12.5, 'Food & Dining', None, '2024-01-01')
+    db.add_expense(user_id, 'Train', 30.0, 'Transportation', None, '2024-01-02')
+    yield CachedDatabase(db), user_id
+    db.close()
+
+def test_list_arguments_are_cached(cached):
+    db, user_id = cached
+    assert db.get_amount_percentiles(user_id, [0.5]) == {0.5: 21.25}
+    assert db.get_amount_percentiles(user_id, [0.5]) == {0.5: 21.25}
+    assert db.cache.stats()['hits'] == 1
+
+def test_unhashable_arguments_bypass_the_cache(cached):
+    db, user_id = cached
+    class Percentiles:
+        __hash__ = None
+        def __iter__(self):
+            return iter([0.0, 1.0])
+    
+    for _ in range(2):
+        assert db.get_amount_percentiles(user_id, Percentiles()) == {0.0: 12.5, 1.0: 30.0}
+    assert db.cache.stats() == {'entries': 0, 'hits': 0, 'misses': 0}
+
+def test_nested_results_are_not_shared(cached):
+    db, user_id = cached
+    stats = db.get_expense_stats(user_id)
+    stats['categories'].clear()
+    assert db.get_expense_stats(user_id)['categories']
@@ -0,0 +1,19 @@
+"""Every query in HOT_QUERIES must be served by an index on a fresh database"""
+
+import pytest
+from database import Database
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'expensewise.db'))
+    yield database
+    database.close()
+
+def test_hot_queries_use_indexes(db):
+    assert db.check_query_plans() == {}
+
+def test_missing_index_is_reported(db):
+    with db.transaction() as conn:
+        conn.execute('DROP INDEX idx_files_user_upload')
+        conn.execute('DROP INDEX idx_files_user_hash')
+    assert 'get_files' in db.check_query_plans()